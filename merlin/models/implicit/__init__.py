@@ -13,11 +13,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Optional, Tuple
+
 import implicit
+import numpy as np
 from implicit.evaluation import ranking_metrics_at_k
 
 from merlin.io import Dataset
-from merlin.models.utils.dataset import _to_numpy, dataset_to_coo
+from merlin.models.utils.dataset import csr_rows, dataset_to_csr, to_numpy
+from merlin.models.utils.parquet import ParquetBatchWriter, recommendations_table
 from merlin.schema import Tags
 
 
@@ -41,11 +47,16 @@ class ImplicitModelAdaptor:
         # evaluate the model given the validation set
         # prints out {'precision@10': 0.3895182175113377, 'map@10': 0.2609445966914911, ...} etc
         print(model.evaluate(valid))
+
+    The interaction matrices of the datasets stored in files are cached
+    (see `merlin.models.utils.dataset.dataset_to_csr`), and persisted in `cache_dir` if set.
     """
 
-    def __init__(self, implicit_model):
+    def __init__(self, implicit_model, cache_dir: Optional[str] = None):
         self.implicit_model = implicit_model
+        self.cache_dir = cache_dir
         self.train_data = None
+        self.user_id_column = "user_id"
 
     def fit(self, train: Dataset):
         """Trains the implicit model
@@ -58,9 +69,10 @@ class ImplicitModelAdaptor:
             If there is a column tagged as Tags.TARGET we will also use that for the values,
             otherwise will be set to 1
         """
-        data = dataset_to_coo(train).tocsr()
+        data = dataset_to_csr(train, cache_dir=self.cache_dir)
         self.implicit_model.fit(data)
         self.train_data = data
+        self.user_id_column = train.schema.select_by_tag(Tags.USER_ID).first.name
 
     def evaluate(self, test_dataset: Dataset, k=10):
         """Evaluates the model
@@ -77,7 +89,7 @@ class ImplicitModelAdaptor:
             return metrics like 'map@10' , but by increasing k you can generate
             different versions
         """
-        test = dataset_to_coo(test_dataset).tocsr()
+        test = dataset_to_csr(test_dataset, cache_dir=self.cache_dir)
         ret = ranking_metrics_at_k(
             self.implicit_model,
             self.train_data,
@@ -86,7 +98,7 @@ class ImplicitModelAdaptor:
         )
         return {metric + f"@{k}": value for metric, value in ret.items()}
 
-    def predict(self, dataset: Dataset, k=10):
+    def predict(self, dataset: Dataset, k=10, **kwargs):
         """Generate predictions from the dataset
         Parameters
         ----------
@@ -95,21 +107,129 @@ class ImplicitModelAdaptor:
             will get recommendations generated for them
         k: int
             The number of recommendations to generate for each user
+        **kwargs:
+            Arguments of `recommend`, e.g. to filter the items seen in training
+            or to write the recommendations to parquet by batches of users.
+            By default all the users are scored at once, without filtering.
         """
         # Get the userids for the dataset,
         user_id_column = dataset.schema.select_by_tag(Tags.USER_ID).first.name
-        userids = _to_numpy(
+        userids = to_numpy(
             dataset.to_ddf()[user_id_column].unique().compute(scheduler="synchronous")
         )
+        kwargs.setdefault("filter_already_liked_items", False)
+        kwargs.setdefault("batch_size", None)
+        kwargs.setdefault("user_id_column", user_id_column)
+
+        return self.recommend(userids, k=k, **kwargs)
+
+    def recommend(
+        self,
+        user_ids: np.ndarray,
+        k: int = 10,
+        filter_already_liked_items: bool = True,
+        batch_size: Optional[int] = 10_000,
+        num_workers: int = 1,
+        output_path: Optional[str] = None,
+        user_id_column: Optional[str] = None,
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Recommends the top-k items of the users, by batches of users
 
-        return self.implicit_model.recommend(userids, None, filter_already_liked_items=False, N=k)
+        Parameters
+        ----------
+        user_ids : np.ndarray
+            The ids of the users
+        k : int, optional
+            The number of recommendations for each user, by default 10
+        filter_already_liked_items : bool, optional
+            Whether the items of the users in the training data (cached by `fit`) are
+            excluded from their recommendations, by default True
+        batch_size : int, optional
+            Number of users recommended at a time, by default 10_000.
+            None recommends all the users at once.
+        num_workers : int, optional
+            Number of threads recommending batches, by default 1
+        output_path : str, optional
+            If set, the recommendations are written to this parquet file as they are computed,
+            one row group of (user id, item_ids, scores) per batch, instead of being returned.
+            The file is only created once all the batches are written.
+        user_id_column : str, optional
+            Name of the user id column of the parquet file, by default the column tagged
+            with `Tags.USER_ID` in the training dataset
+
+        Returns
+        -------
+        Optional[Tuple[np.ndarray, np.ndarray]]
+            The (num_users, k) arrays of recommended item ids and scores,
+            or None if they are written to `output_path`
+        """
+        if filter_already_liked_items and self.train_data is None:
+            raise ValueError("The model should be fitted to filter the items of the users")
+
+        user_ids = np.asarray(user_ids)
+        batch_size = batch_size or max(len(user_ids), 1)
+        batches = (user_ids[i : i + batch_size] for i in range(0, len(user_ids), batch_size))
+
+        def recommend_batch(batch_user_ids):
+            user_items = None
+            if filter_already_liked_items:
+                user_items = csr_rows(self.train_data, batch_user_ids)
+            return batch_user_ids, self.implicit_model.recommend(
+                batch_user_ids,
+                user_items,
+                N=k,
+                filter_already_liked_items=filter_already_liked_items,
+            )
+
+        recommendations = _map_bounded(recommend_batch, batches, num_workers)
+        if output_path is not None:
+            user_id_column = user_id_column or self.user_id_column
+            with ParquetBatchWriter(output_path) as writer:
+                for batch_user_ids, (batch_item_ids, batch_scores) in recommendations:
+                    writer.write(
+                        recommendations_table(
+                            batch_user_ids, batch_item_ids, batch_scores, id_column=user_id_column
+                        )
+                    )
+            return None
+
+        item_ids, scores = [], []
+        for _, (batch_item_ids, batch_scores) in recommendations:
+            item_ids.append(batch_item_ids)
+            scores.append(batch_scores)
+
+        if not item_ids:
+            return np.empty((0, k), dtype=np.int32), np.empty((0, k), dtype=np.float32)
+        if len(item_ids) == 1:
+            return item_ids[0], scores[0]
+
+        return np.concatenate(item_ids), np.concatenate(scores)
+
+
+def _map_bounded(fn, iterable, num_workers: int):
+    """Like `ThreadPoolExecutor.map`, but with at most 2 * num_workers pending results,
+    so the memory is bounded when the results are consumed slower than they are computed"""
+    if num_workers <= 1:
+        yield from map(fn, iterable)
+        return
+
+    with ThreadPoolExecutor(num_workers) as executor:
+        pending: Deque[Future] = deque()
+        for item in iterable:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= 2 * num_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
 
 class AlternatingLeastSquares(ImplicitModelAdaptor):
-    def __init__(self, *args, **kwargs):
-        super().__init__(implicit.als.AlternatingLeastSquares(*args, **kwargs))
+    def __init__(self, *args, cache_dir=None, **kwargs):
+        super().__init__(implicit.als.AlternatingLeastSquares(*args, **kwargs), cache_dir=cache_dir)
 
 
 class BayesianPersonalizedRanking(ImplicitModelAdaptor):
-    def __init__(self, *args, **kwargs):
-        super().__init__(implicit.bpr.BayesianPersonalizedRanking(*args, **kwargs))
+    def __init__(self, *args, cache_dir=None, **kwargs):
+        super().__init__(
+            implicit.bpr.BayesianPersonalizedRanking(*args, **kwargs), cache_dir=cache_dir
+        )
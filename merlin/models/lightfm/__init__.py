@@ -14,12 +14,18 @@
 # limitations under the License.
 #
 import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Sequence, Tuple, Union
 
 import lightfm
 import lightfm.evaluation
+import numpy as np
+from scipy import sparse
+from threadpoolctl import threadpool_limits
 
 from merlin.io import Dataset
-from merlin.models.utils.dataset import dataset_to_coo
+from merlin.models.utils.dataset import dataset_to_coo, dataset_to_csr
+from merlin.models.utils.top_k import blockwise_top_k, select_top_k, sort_top_k
 
 
 class LightFM:
@@ -41,12 +47,16 @@ class LightFM:
 
         # evaluate the model given the validation set
         print(model.evaluate(valid))
+
+    The interaction matrices of the datasets stored in files are cached
+    (see `merlin.models.utils.dataset.dataset_to_csr`), and persisted in `cache_dir` if set.
     """
 
-    def __init__(self, *args, epochs=10, num_threads=0, **kwargs):
+    def __init__(self, *args, epochs=10, num_threads=0, cache_dir=None, **kwargs):
         self.lightfm_model = lightfm.LightFM(*args, **kwargs)
         self.epochs = epochs
         self.num_threads = num_threads or multiprocessing.cpu_count()
+        self.cache_dir = cache_dir
 
     def fit(self, train: Dataset):
         """Trains the lightfm model
@@ -59,7 +69,7 @@ class LightFM:
             If there is a column tagged as Tags.TARGET we will also use that for the values,
             otherwise will be set to 1
         """
-        data = dataset_to_coo(train).tocsr()
+        data = dataset_to_csr(train, cache_dir=self.cache_dir)
         self.lightfm_model.fit(data, epochs=self.epochs, num_threads=self.num_threads)
         self.train_data = data
 
@@ -77,16 +87,16 @@ class LightFM:
             How many items to return per prediction
         """
 
-        test = dataset_to_coo(test_dataset).tocsr()
-
         # lightfm needs the test set to have the same dimensionality as the train set
-        test.resize(self.train_data.shape)
+        test = _with_shape(
+            dataset_to_csr(test_dataset, cache_dir=self.cache_dir), self.train_data.shape
+        )
 
         precision = lightfm.evaluation.precision_at_k(
             self.lightfm_model, test, self.train_data, k=k, num_threads=self.num_threads
         ).mean()
         auc = lightfm.evaluation.auc_score(
-            self.lightfm_model, test, self.train_data, k=k, num_threads=self.num_threads
+            self.lightfm_model, test, self.train_data, num_threads=self.num_threads
         ).mean()
         return {f"precisions@{k}": precision, f"auc@{k}": auc}
 
@@ -101,3 +111,175 @@ class LightFM:
         """
         data = dataset_to_coo(dataset)
         return self.lightfm_model.predict(data.row, data.col)
+
+    def recommend(
+        self,
+        users: np.ndarray,
+        k: int = 10,
+        candidates: Optional[Union[sparse.spmatrix, Sequence[np.ndarray]]] = None,
+        batch_size: int = 1024,
+        item_block_size: Optional[int] = 65_536,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Recommends the top-k items of the users, scoring them with the learned
+        embeddings and biases by blocks of users (on `num_threads` threads, each using
+        a single BLAS thread) and items,
+        so the memory is bounded by `num_threads * batch_size * item_block_size` scores.
+        With `candidates`, the candidates of a batch are scored by chunks of users of at most
+        `batch_size * item_block_size` candidates, padded to the largest number of candidates
+        of a user of the chunk.
+
+        The model should be fitted without user or item features (as `fit` does),
+        and the scores are the same as `predict`'s.
+
+        Parameters
+        ----------
+        users : np.ndarray
+            The ids of the users
+        k : int, optional
+            The number of recommendations for each user, by default 10
+        candidates : Union[sparse.spmatrix, Sequence[np.ndarray]], optional
+            The candidate item ids of each user (aligned with `users`), either a sparse
+            matrix of shape (len(users), num_items) with the candidates as non-zero values,
+            or a sequence of arrays of ids. By default None (all the items)
+        batch_size : int, optional
+            Number of users scored at a time, by default 1024
+        item_block_size : int, optional
+            Number of items scored at a time, by default 65_536. None scores all the items
+            at once
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            The (len(users), k) arrays of item ids and scores by decreasing score,
+            padded with -1 ids and -inf scores for the users with less than k candidates
+        """
+        model = self.lightfm_model
+        users = np.asarray(users)
+        if candidates is not None and not sparse.issparse(candidates):
+            candidates = _candidates_matrix(candidates, model.item_embeddings.shape[0])
+        if candidates is not None:
+            candidates = sparse.csr_matrix(candidates, copy=True)
+            candidates.eliminate_zeros()
+            if candidates.shape[0] != len(users):
+                raise ValueError(
+                    f"The candidates have {candidates.shape[0]} rows, one per user was expected "
+                    f"({len(users)} users)"
+                )
+
+        def recommend_batch(start):
+            batch_users = users[start : start + batch_size]
+            user_vectors = model.user_embeddings[batch_users]
+            if candidates is None:
+                positions, top_scores = blockwise_top_k(
+                    user_vectors,
+                    model.item_embeddings,
+                    k,
+                    item_block_size,
+                    biases=model.item_biases,
+                )
+                item_ids = np.full((len(batch_users), k), -1, dtype=np.int64)
+                scores = np.full((len(batch_users), k), -np.inf, dtype=np.float32)
+                item_ids[:, : positions.shape[1]] = positions
+                scores[:, : top_scores.shape[1]] = top_scores
+            else:
+                item_ids, scores = _candidates_top_k(
+                    user_vectors,
+                    model.item_embeddings,
+                    model.item_biases,
+                    candidates[start : start + batch_size],
+                    k,
+                    max_scores=len(batch_users)
+                    * (item_block_size or model.item_embeddings.shape[0]),
+                )
+            scores += model.user_biases[batch_users][:, None]
+
+            return item_ids, scores
+
+        starts = range(0, len(users), batch_size)
+        # The batches are parallelized over the threads, so the matrix products
+        # of each batch are single-threaded to avoid oversubscribing the CPUs
+        with threadpool_limits(limits=1, user_api="blas"):
+            with ThreadPoolExecutor(self.num_threads) as executor:
+                results = list(executor.map(recommend_batch, starts))
+
+        if not results:
+            return np.empty((0, k), dtype=np.int64), np.empty((0, k), dtype=np.float32)
+
+        return (
+            np.concatenate([item_ids for item_ids, _ in results]),
+            np.concatenate([scores for _, scores in results]),
+        )
+
+
+def _candidates_top_k(
+    user_vectors: np.ndarray,
+    item_vectors: np.ndarray,
+    item_biases: np.ndarray,
+    candidates: sparse.csr_matrix,
+    k: int,
+    max_scores: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k of the candidate items of each user, scoring only the candidates.
+    The candidates are padded to the largest number of candidates of a chunk of users,
+    with chunks of at most `max_scores` padded scores (or a single user)."""
+    counts = np.diff(candidates.indptr)
+    item_ids = np.full((len(counts), k), -1, dtype=np.int64)
+    scores = np.full((len(counts), k), -np.inf, dtype=np.float32)
+
+    for start, end in _candidate_chunks(counts, max_scores):
+        chunk = candidates[start:end]
+        chunk_counts = counts[start:end]
+        rows = np.repeat(np.arange(end - start), chunk_counts)
+        columns = np.arange(len(rows)) - np.repeat(chunk.indptr[:-1], chunk_counts)
+        width = max(int(chunk_counts.max()), 1)
+
+        padded_scores = np.full((end - start, width), -np.inf, dtype=np.float32)
+        padded_ids = np.full((end - start, width), -1, dtype=np.int64)
+        padded_scores[rows, columns] = (
+            np.einsum("ij,ij->i", user_vectors[start:end][rows], item_vectors[chunk.indices])
+            + item_biases[chunk.indices]
+        )
+        padded_ids[rows, columns] = chunk.indices
+
+        chunk_ids, chunk_scores = sort_top_k(*select_top_k(padded_ids, padded_scores, k))
+        item_ids[start:end, : chunk_ids.shape[1]] = chunk_ids
+        scores[start:end, : chunk_scores.shape[1]] = chunk_scores
+
+    return item_ids, scores
+
+
+def _candidate_chunks(counts: np.ndarray, max_scores: int):
+    """Ranges of consecutive users with at most `max_scores` padded candidate scores"""
+    start, width = 0, 0
+    for end, count in enumerate(counts):
+        width = max(width, count)
+        if end > start and (end + 1 - start) * width > max_scores:
+            yield start, end
+            start, width = end, count
+    if start < len(counts):
+        yield start, len(counts)
+
+
+def _with_shape(matrix: sparse.csr_matrix, shape: Tuple[int, int]) -> sparse.csr_matrix:
+    """The matrix with more rows and/or columns, sharing its data and indices
+    (e.g. with the matrices cached by `dataset_to_csr`) instead of copying them"""
+    num_rows, num_columns = shape
+    if num_rows < matrix.shape[0] or num_columns < matrix.shape[1]:
+        matrix = matrix[: min(num_rows, matrix.shape[0]), : min(num_columns, matrix.shape[1])]
+    indptr = matrix.indptr
+    if num_rows > matrix.shape[0]:
+        indptr = np.concatenate(
+            [indptr, np.full(num_rows - matrix.shape[0], indptr[-1], dtype=indptr.dtype)]
+        )
+
+    return sparse.csr_matrix((matrix.data, matrix.indices, indptr), shape=shape, copy=False)
+
+
+def _candidates_matrix(candidates: Sequence[np.ndarray], num_items: int) -> sparse.csr_matrix:
+    rows = np.repeat(np.arange(len(candidates)), [len(ids) for ids in candidates])
+    columns = np.concatenate([np.asarray(ids) for ids in candidates]) if len(rows) else rows
+
+    return sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(len(candidates), num_items),
+    )
@@ -52,6 +52,7 @@ from merlin.models.tf.blocks.core.transformations import (
     AsSparseFeatures,
     CategoricalOneHot,
     ExpandDims,
+    ItemFrequencyEstimator,
     LabelToOneHot,
     StochasticSwapNoise,
 )
@@ -61,6 +62,7 @@ from merlin.models.tf.blocks.experts import CGCBlock, MMOEBlock, MMOEGate
 from merlin.models.tf.blocks.interaction import DotProductInteraction, FMPairwiseInteraction
 from merlin.models.tf.blocks.mlp import DenseResidualBlock, MLPBlock
 from merlin.models.tf.blocks.retrieval.base import DualEncoderBlock, ItemRetrievalScorer
+from merlin.models.tf.blocks.retrieval.cache import CachedQueryBlock, QueryEmbeddingCache
 from merlin.models.tf.blocks.retrieval.matrix_factorization import (
     MatrixFactorizationBlock,
     QueryItemIdsEmbeddingsBlock,
@@ -70,8 +72,10 @@ from merlin.models.tf.blocks.sampling.base import ItemSampler
 from merlin.models.tf.blocks.sampling.cross_batch import (
     CachedCrossBatchSampler,
     CachedUniformSampler,
+    FrequencyBasedSampler,
     PopularityBasedSampler,
 )
+from merlin.models.tf.blocks.sampling.hard_negatives import HardNegativeSampler
 from merlin.models.tf.blocks.sampling.in_batch import InBatchSampler
 from merlin.models.tf.blocks.sampling.queue import FIFOQueue
 from merlin.models.tf.features.continuous import ContinuousFeatures
@@ -84,12 +88,14 @@ from merlin.models.tf.features.embedding import (
     TableConfig,
 )
 from merlin.models.tf.losses import LossType
+from merlin.models.tf.metrics.classification import GroupAUC, HistogramAUC
 from merlin.models.tf.metrics.ranking import (
     AvgPrecisionAt,
     MRRAt,
     NDCGAt,
     PrecisionAt,
     RecallAt,
+    TopKMetricsBundle,
     ranking_metrics,
 )
 from merlin.models.tf.models import benchmark
@@ -169,12 +175,17 @@ __all__ = [
     "RegressionTask",
     "ItemRetrievalTask",
     "ItemRetrievalScorer",
+    "CachedQueryBlock",
+    "QueryEmbeddingCache",
     "NextItemPredictionTask",
     "NDCGAt",
     "PrecisionAt",
     "MRRAt",
     "AvgPrecisionAt",
     "RecallAt",
+    "TopKMetricsBundle",
+    "HistogramAUC",
+    "GroupAUC",
     "ranking_metrics",
     "Model",
     "RetrievalModel",
@@ -182,6 +193,7 @@ __all__ = [
     "PredictionTasks",
     "StochasticSwapNoise",
     "ExpandDims",
+    "ItemFrequencyEstimator",
     "NoOp",
     "data",
     "SyntheticData",
@@ -191,6 +203,8 @@ __all__ = [
     "CachedCrossBatchSampler",
     "CachedUniformSampler",
     "PopularityBasedSampler",
+    "FrequencyBasedSampler",
+    "HardNegativeSampler",
     "FIFOQueue",
     "YoutubeDNNRetrievalModel",
     "TwoTowerModel",
@@ -17,13 +17,25 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Sequence, Type, Union
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
 import tensorflow as tf
 from tensorflow.keras.layers import Layer
 
 from merlin.models.config.schema import SchemaMixin
 from merlin.models.tf.typing import TabularData
+from merlin.models.tf.utils import tf_utils
 from merlin.models.tf.utils.mixins import ModelLikeBlock
 from merlin.models.utils.registry import Registry
 from merlin.schema import Schema, Tags
@@ -50,6 +62,26 @@ class PredictionOutput(NamedTuple):
     label_relevant_counts: Optional[tf.Tensor] = None
 
 
+class _TopKResult(NamedTuple):
+    # The queries and candidates are kept so that their references stay unique
+    queries: tf.Tensor
+    candidates: Union[tf.Tensor, tf.Variable]
+    k: int
+    scores: tf.Tensor
+    indices: tf.Tensor
+
+
+class _TopKCache:
+    """Results of `BlockContext.shared_top_k` for the current batch,
+    kept out of the tracking of the layer attributes."""
+
+    def __init__(self):
+        self.results: Dict[Tuple[int, int], _TopKResult] = {}
+
+    def clear(self):
+        self.results.clear()
+
+
 @tf.keras.utils.register_keras_serializable(package="merlin.models")
 class BlockContext(Layer):
     """BlockContext is part of each block.
@@ -65,6 +97,7 @@ class BlockContext(Layer):
         super(BlockContext, self).__init__(**kwargs)
         self._feature_names = feature_names
         self._feature_dtypes = feature_dtypes
+        self._top_k_cache = _TopKCache()
 
     def add_embedding_weight(self, name, **kwargs):
         table = self.add_weight(name=f"{str(name)}/embedding", **kwargs)
@@ -114,6 +147,48 @@ class BlockContext(Layer):
             )
         return mask_schema
 
+    def shared_top_k(
+        self,
+        queries: tf.Tensor,
+        candidates: Union[tf.Tensor, tf.Variable],
+        k: int,
+        top_k_fn: Callable[[tf.Tensor, int], Tuple[tf.Tensor, tf.Tensor]],
+    ) -> Tuple[tf.Tensor, tf.Tensor]:
+        """Top-k scores and indices of the `queries` against the `candidates`,
+        shared by the blocks scoring the same batch of queries against the same candidates,
+        e.g. the retrieval tasks of a `ParallelPredictionBlock` with the same query tower.
+
+        The results are cached by the batch reference (`tf_utils.batch_ref`) of the
+        queries and of the candidates, so the blocks must pass the same tensors to share them.
+        The cache only holds the results of the current batch: it is cleared when the
+        context is called with the features of the next batch.
+
+        Parameters
+        ----------
+        queries : tf.Tensor
+            2D Tensor of query embeddings
+        candidates : Union[tf.Tensor, tf.Variable]
+            The candidates embeddings (e.g. the items embedding table)
+        k : int
+            Number of top candidates to retrieve
+        top_k_fn : Callable[[tf.Tensor, int], Tuple[tf.Tensor, tf.Tensor]]
+            Function computing the top-k scores and indices of the queries,
+            called when they are not cached
+
+        Returns
+        -------
+        top_scores, top_indices: tf.Tensor, tf.Tensor
+        """
+        key = (tf_utils.batch_ref(queries), tf_utils.batch_ref(candidates))
+        cached = self._top_k_cache.results.get(key)
+        if cached is not None and cached.k >= k:
+            return cached.scores[:, :k], cached.indices[:, :k]
+
+        scores, indices = top_k_fn(queries, k)
+        self._top_k_cache.results[key] = _TopKResult(queries, candidates, k, scores, indices)
+
+        return scores, indices
+
     @property
     def named_variables(self) -> Dict[str, tf.Variable]:
         outputs = {}
@@ -172,6 +247,8 @@ class BlockContext(Layer):
         super(BlockContext, self).build(input_shape)
 
     def call(self, features, **kwargs):
+        # The top-k results are shared within a batch only
+        self._top_k_cache.clear()
         for feature_name in self._feature_names:
             self.named_variables[feature_name].assign(features[feature_name])
 
@@ -92,13 +92,16 @@ class IndexBlock(Block):
     def update(self, values: tf.Tensor, ids: Optional[tf.Tensor] = None):
         if len(tf.shape(values)) != 2:
             raise ValueError(f"The candidates embeddings tensor must be 2D (got {values.shape}).")
-        _ids: tf.Tensor = ids if ids else tf.range(values.shape[0])
+        _ids: tf.Tensor = ids if ids is not None else tf.range(values.shape[0])
 
-        if self.ids:
+        if isinstance(self.ids, tf.Variable):
             self.ids.assign(_ids)
         else:
             self.ids = _ids
-        self.values.assign(values)
+        if isinstance(self.values, tf.Variable):
+            self.values.assign(values)
+        else:
+            self.values = values
         return self
 
     def call(self, inputs: tf.Tensor, **kwargs) -> tf.Tensor:
@@ -133,12 +136,40 @@ class TopKIndexBlock(IndexBlock):
             The pre-computed embedddings of candidates.
         ids: tf.Tensor
             The candidates ids.
+        block_size: Optional[int]
+            If set, the scores are computed and reduced to the top-k
+            for blocks of `block_size` candidates at a time, which bounds
+            the memory of the scores matrix. By default None (a single block).
     """
 
-    def __init__(self, k, values: tf.Tensor, ids: Optional[tf.Tensor] = None, **kwargs):
+    def __init__(
+        self,
+        k,
+        values: tf.Tensor,
+        ids: Optional[tf.Tensor] = None,
+        block_size: Optional[int] = None,
+        **kwargs,
+    ):
         self._k = k
+        self.block_size = block_size
         super(TopKIndexBlock, self).__init__(values, ids, **kwargs)
         self.false_negatives_score = MIN_FLOAT
+        self._index_ids()
+
+    def _index_ids(self):
+        # Sorted candidates ids, used to map the excluded ids to positions
+        if self.ids is not None:
+            ids = tf.convert_to_tensor(self.ids)
+            self._ids_order = tf.argsort(ids)
+            self._sorted_ids = tf.gather(ids, self._ids_order)
+        else:
+            self._ids_order, self._sorted_ids = None, None
+
+    def update(self, values: tf.Tensor, ids: Optional[tf.Tensor] = None):
+        super().update(values, ids)
+        self._index_ids()
+
+        return self
 
     @classmethod
     def from_block(  # type: ignore
@@ -171,7 +202,9 @@ class TopKIndexBlock(IndexBlock):
         """
         return super().from_block(block=block, data=data, id_column=id_column, k=k, **kwargs)
 
-    def call(self, inputs: tf.Tensor, k=None, **kwargs) -> Union[tf.Tensor, tf.Tensor]:
+    def call(
+        self, inputs: tf.Tensor, k=None, exclude_ids=None, block_size=None, **kwargs
+    ) -> Union[tf.Tensor, tf.Tensor]:
         """
         Compute Top-k scores and related indices from query inputs
 
@@ -182,18 +215,113 @@ class TopKIndexBlock(IndexBlock):
         k: int
             Number of top candidates to retrieve
             Defaults to constructor `_k` parameter.
+        exclude_ids: Union[tf.RaggedTensor, tf.SparseTensor, tf.Tensor], optional
+            Candidates to exclude from the top-k of each query
+            (e.g. the items already consumed by the user), either:
+            a ragged (or sparse) tensor with the candidates ids for each query,
+            or a boolean tensor of shape (batch_size, num_candidates)
+            set to True for the candidate positions to exclude.
+            Excluded candidates get a score of `MIN_FLOAT`, so they
+            are only returned if a query has fewer than k other candidates.
+        block_size: int
+            Number of candidates to score at a time.
+            Defaults to constructor `block_size` parameter.
         Returns
         -------
         top_scores, top_indices: tf.Tensor, tf.Tensor
             2D Tensors with the scores for the top-k candidates and related ids.
         """
         k = k if k is not None else self._k
-        scores = tf.matmul(inputs, self.values, transpose_b=True)
-        top_scores, top_indices = tf.math.top_k(scores, k=k)
-        top_indices = tf.gather(self.ids, top_indices)
+        block_size = block_size if block_size is not None else self.block_size
+        exclusions = None
+        if exclude_ids is not None:
+            exclusions = self._exclusion_indices(exclude_ids)
+
+        num_candidates = self.values.shape[0]
+        # k is converted to a tensor when the layer is called in graph mode
+        k = tf.minimum(k, num_candidates) if tf.is_tensor(k) else min(k, num_candidates)
+        if not block_size or block_size >= num_candidates:
+            scores = tf.matmul(inputs, self.values, transpose_b=True)
+            if exclusions is not None:
+                scores = self._exclude(scores, exclusions)
+            top_scores, top_indices = tf.math.top_k(scores, k=k)
+        else:
+            top_scores, top_indices = self._blockwise_top_k(inputs, k, block_size, exclusions)
+
+        if self.ids is not None:
+            top_indices = tf.gather(self.ids, top_indices)
+
+        return top_scores, top_indices
+
+    def _blockwise_top_k(self, inputs, k, block_size, exclusions=None):
+        """Keeps a running top-k in a `tf.while_loop`
+        while scoring `block_size` candidates at a time"""
+        num_candidates = self.values.shape[0]
+        batch_size = tf.shape(inputs)[0]
+
+        def body(start, top_scores, top_indices):
+            size = tf.minimum(block_size, num_candidates - start)
+            values = tf.slice(self.values, [start, 0], [size, -1])
+            scores = tf.matmul(inputs, values, transpose_b=True)
+            if exclusions is not None:
+                block_start = tf.cast(start, exclusions.dtype)
+                positions = exclusions[:, 1]
+                in_block = tf.logical_and(
+                    positions >= block_start,
+                    positions < block_start + tf.cast(size, positions.dtype),
+                )
+                block_exclusions = tf.boolean_mask(exclusions, in_block)
+                block_exclusions -= tf.stack([tf.zeros_like(block_start), block_start])
+                scores = self._exclude(scores, block_exclusions)
+            indices = tf.broadcast_to(tf.range(start, start + size), tf.shape(scores))
+
+            scores = tf.concat([top_scores, scores], axis=-1)
+            indices = tf.concat([top_indices, indices], axis=-1)
+            top_scores, merged = tf.math.top_k(scores, k=k)
+            top_indices = tf.gather(indices, merged, batch_dims=1)
+
+            return start + block_size, top_scores, top_indices
+
+        _, top_scores, top_indices = tf.while_loop(
+            lambda start, *_: start < num_candidates,
+            body,
+            (
+                tf.constant(0),
+                tf.fill([batch_size, k], tf.constant(float("-inf"), dtype=inputs.dtype)),
+                tf.zeros([batch_size, k], dtype=tf.int32),
+            ),
+        )
 
         return top_scores, top_indices
 
+    def _exclusion_indices(self, exclude_ids) -> tf.Tensor:
+        """Converts `exclude_ids` to a 2D tensor of (query, candidate position) pairs"""
+        if isinstance(exclude_ids, tf.SparseTensor):
+            exclude_ids = tf.RaggedTensor.from_sparse(exclude_ids)
+        if not isinstance(exclude_ids, tf.RaggedTensor):
+            return tf.where(tf.cast(exclude_ids, tf.bool))
+
+        rows = exclude_ids.value_rowids()
+        ids = exclude_ids.flat_values
+        if self._sorted_ids is None:
+            positions = tf.cast(ids, tf.int64)
+            found = tf.logical_and(positions >= 0, positions < self.values.shape[0])
+        else:
+            ids = tf.cast(ids, self._sorted_ids.dtype)
+            sorted_positions = tf.searchsorted(self._sorted_ids, ids)
+            sorted_positions = tf.minimum(sorted_positions, tf.size(self._sorted_ids) - 1)
+            found = tf.equal(tf.gather(self._sorted_ids, sorted_positions), ids)
+            positions = tf.cast(tf.gather(self._ids_order, sorted_positions), tf.int64)
+
+        return tf.boolean_mask(tf.stack([tf.cast(rows, tf.int64), positions], axis=1), found)
+
+    def _exclude(self, scores: tf.Tensor, exclusions: tf.Tensor) -> tf.Tensor:
+        return tf.tensor_scatter_nd_update(
+            scores,
+            exclusions,
+            tf.fill([tf.shape(exclusions)[0]], tf.cast(MIN_FLOAT, scores.dtype)),
+        )
+
     def call_outputs(
         self, outputs: PredictionOutput, training=False, **kwargs
     ) -> "PredictionOutput":
@@ -367,6 +367,128 @@ class RemovePad3D(Block):
         return PredictionOutput(predictions, targets)
 
 
+@tf.keras.utils.register_keras_serializable(package="merlin_models")
+class ItemFrequencyEstimator(Block):
+    """Streaming estimation of the probability of each item to be in a training batch,
+    using the hashed estimator of [1]: for each hash bucket, it keeps the step
+    when it was last seen and a moving average of the number of steps between
+    two consecutive hits (delta), so that the probability is estimated as `1 / delta`.
+
+    The estimator is updated in-graph with the item ids of the training batches, using
+    a bounded memory of `num_buckets`. When called, it adds the probability of the
+    batch items to the features (as `output_feature_name`), for `SamplingBiasCorrection`.
+    It can also be given to `ItemRetrievalScorer` to apply the logQ correction
+    of the positive and sampled items logits.
+
+    References
+    ----------
+    [1] Yi, Xinyang, et al.
+        "Sampling-bias-corrected neural modeling for large corpus item recommendations."
+        Proceedings of the 13th ACM Conference on Recommender Systems. 2019.
+
+    Parameters
+    ----------
+    num_buckets: int
+        Number of hash buckets (the item ids are hashed with
+        `tf.strings.to_hash_bucket_fast`), by default 2**20.
+    alpha: float
+        Learning rate of the moving average of the steps between two hits,
+        by default 0.01.
+    item_id_feature_name: str
+        Name of the column containing the item ids, by default `item_id`
+    output_feature_name: str
+        Name of the feature with the estimated probabilities, by default `popularity`
+    """
+
+    def __init__(
+        self,
+        num_buckets: int = 2**20,
+        alpha: float = 0.01,
+        item_id_feature_name: str = "item_id",
+        output_feature_name: str = "popularity",
+        **kwargs,
+    ):
+        super(ItemFrequencyEstimator, self).__init__(**kwargs)
+        self.num_buckets = num_buckets
+        self.alpha = alpha
+        self.item_id_feature_name = item_id_feature_name
+        self.output_feature_name = output_feature_name
+
+        self.step = tf.Variable(
+            tf.zeros((), dtype=tf.int64), trainable=False, name="frequency_estimator_step"
+        )
+        self.last_step = tf.Variable(
+            tf.zeros([num_buckets], dtype=tf.int64),
+            trainable=False,
+            name="frequency_estimator_last_step",
+        )
+        self.delta = tf.Variable(
+            tf.zeros([num_buckets], dtype=tf.float32),
+            trainable=False,
+            name="frequency_estimator_delta",
+        )
+
+    def _buckets(self, item_ids: tf.Tensor) -> tf.Tensor:
+        item_ids = tf.reshape(item_ids, [-1])
+        if item_ids.dtype != tf.string:
+            item_ids = tf.strings.as_string(item_ids)
+
+        return tf.strings.to_hash_bucket_fast(item_ids, self.num_buckets)
+
+    def update(self, item_ids: tf.Tensor) -> None:
+        """Updates the estimates with the item ids of a training batch"""
+        self.step.assign_add(1)
+        buckets, _ = tf.unique(self._buckets(item_ids))
+        last_step = tf.gather(self.last_step, buckets)
+        previous_delta = tf.gather(self.delta, buckets)
+        steps = tf.cast(self.step - last_step, tf.float32)
+        delta = tf.where(
+            previous_delta > 0,
+            (1 - self.alpha) * previous_delta + self.alpha * steps,
+            # The first hit of the bucket only sets its last step,
+            # and the second hit sets delta to the steps between them
+            tf.where(last_step > 0, steps, tf.zeros_like(steps)),
+        )
+
+        indices = tf.expand_dims(buckets, -1)
+        self.delta.scatter_nd_update(indices, delta)
+        self.last_step.scatter_nd_update(indices, tf.fill(tf.shape(buckets), self.step))
+
+    def probability(self, item_ids: tf.Tensor) -> tf.Tensor:
+        """Estimated probability of the items to be in a batch (`1 / step` for
+        the items not seen twice yet, i.e. at most once since the first step)"""
+        delta = tf.gather(self.delta, self._buckets(item_ids))
+        unseen_delta = tf.cast(tf.maximum(self.step, 1), tf.float32)
+        probs = 1.0 / tf.where(delta > 0, tf.maximum(delta, 1.0), unseen_delta)
+
+        return tf.reshape(probs, tf.shape(item_ids))
+
+    def log_q(self, item_ids: tf.Tensor) -> tf.Tensor:
+        """The log-Q correction of the logits of the items, to be subtracted from the logits"""
+        return tf.math.log(self.probability(item_ids))
+
+    def call(self, inputs: TabularData, training=False, **kwargs) -> TabularData:
+        item_ids = inputs[self.item_id_feature_name]
+        if training:
+            self.update(item_ids)
+
+        return {**inputs, self.output_feature_name: self.probability(item_ids)}
+
+    def compute_output_shape(self, input_shape):
+        return {**input_shape, self.output_feature_name: input_shape[self.item_id_feature_name]}
+
+    def get_config(self):
+        config = super().get_config()
+        config.update(
+            num_buckets=self.num_buckets,
+            alpha=self.alpha,
+            item_id_feature_name=self.item_id_feature_name,
+            output_feature_name=self.output_feature_name,
+        )
+
+        return config
+
+
 @Block.registry.register_with_multiple_names("sampling-bias-correction")
 @tf.keras.utils.register_keras_serializable(package="merlin_models")
 class SamplingBiasCorrection(Block):
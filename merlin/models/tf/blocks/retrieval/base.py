@@ -17,6 +17,7 @@ import logging
 from typing import List, Optional, Sequence, Union
 
 import tensorflow as tf
+from tensorflow.keras.layers import Layer
 from tensorflow.python.ops import embedding_ops
 
 from merlin.models.tf.blocks.core.base import (
@@ -26,6 +27,7 @@ from merlin.models.tf.blocks.core.base import (
     PredictionOutput,
 )
 from merlin.models.tf.blocks.core.combinators import ParallelBlock
+from merlin.models.tf.blocks.core.index import TopKIndexBlock
 from merlin.models.tf.blocks.core.tabular import Filter, TabularAggregationType
 from merlin.models.tf.blocks.sampling.base import ItemSampler
 from merlin.models.tf.models.base import ModelBlock
@@ -34,6 +36,8 @@ from merlin.models.tf.utils.tf_utils import (
     maybe_deserialize_keras_objects,
     maybe_serialize_keras_objects,
     rescore_false_negatives,
+    rescore_false_negatives_sorted,
+    unique_items,
 )
 from merlin.models.utils.constants import MIN_FLOAT
 from merlin.schema import Schema
@@ -111,13 +115,22 @@ class ItemRetrievalScorer(Block):
     Parameters
     ----------
     samplers : List[ItemSampler], optional
-        List of item samplers that provide negative samples when `training=True`
+        List of item samplers that provide negative samples when `training=True`.
+        The logits of the negatives of samplers returning the expected count of their
+        samples (e.g. `FrequencyBasedSampler`) are corrected by subtracting its log,
+        instead of the correction of `item_frequency_estimator`
     sampling_downscore_false_negatives : bool, optional
         Identify false negatives (sampled item ids equal to the positive item and downscore them
         to the `sampling_downscore_false_negatives_value`), by default True
     sampling_downscore_false_negatives_value : int, optional
         Value to be used to downscore false negatives when
         `sampling_downscore_false_negatives=True`, by default `np.finfo(np.float32).min / 100.0`
+    sampling_downscore_false_negatives_method : str, optional
+        How the false negatives are identified: "dense" compares all pairs of positive and
+        negative ids (a mask of shape (batch size, number of negatives)), and "sorted"
+        searches the positive ids in the sorted negative ids, which only materializes
+        the false negatives and scales to a large number of negatives.
+        By default "sorted" if `deduplicate_negatives=True`, otherwise "dense"
     item_id_feature_name: str
         Name of the column containing the item ids
         Defaults to `item_id`
@@ -125,6 +138,29 @@ class ItemRetrievalScorer(Block):
         Identify query tower for query/user embeddings, by default 'query'
     item_name: str
         Identify item tower for item embeddings, by default'item'
+    item_frequency_estimator: ItemFrequencyEstimator, optional
+        If set, it is updated with the positive item ids of each training batch,
+        and the logits of the positive and sampled items are corrected by subtracting
+        the log of their estimated sampling probability (logQ correction), except
+        the negatives of samplers providing their own correction.
+        By default None
+    deduplicate_negatives: bool, optional
+        Remove the repeated item ids from the negatives of all samplers before scoring them,
+        keeping the first occurrence (e.g. the in-batch negative, which has gradients,
+        over the same cached item). The false negatives are then found with the
+        "sorted" `sampling_downscore_false_negatives_method`. By default False
+    eval_top_k: int, optional
+        When the inputs are the query embeddings (e.g. next-item prediction with sampled
+        softmax), evaluation does not score all the items of the catalog but only the
+        positive items and the top-k other items of each query, which are retrieved
+        (blocks of `eval_block_size` items at a time) by `TopKIndexBlock`.
+        The top-k is shared with the other tasks scoring the same query tensor
+        (e.g. normalized by the `pre` block of a `ParallelPredictionBlock`).
+        The model then outputs the query embeddings at inference.
+        By default None, which scores all the items of the catalog
+    eval_block_size: int, optional
+        Number of items scored at a time when `eval_top_k` is set, by default None
+        (all items at once)
     """
 
     def __init__(
@@ -132,20 +168,46 @@ class ItemRetrievalScorer(Block):
         samplers: Sequence[ItemSampler] = (),
         sampling_downscore_false_negatives=True,
         sampling_downscore_false_negatives_value: int = MIN_FLOAT,
+        sampling_downscore_false_negatives_method: Optional[str] = None,
         item_id_feature_name: str = "item_id",
         query_name: str = "query",
         item_name: str = "item",
         cache_query: bool = False,
+        item_frequency_estimator: Optional[Layer] = None,
+        deduplicate_negatives: bool = False,
+        eval_top_k: Optional[int] = None,
+        eval_block_size: Optional[int] = None,
         **kwargs,
     ):
         super().__init__(**kwargs)
 
         self.downscore_false_negatives = sampling_downscore_false_negatives
         self.false_negatives_score = sampling_downscore_false_negatives_value
+        if sampling_downscore_false_negatives_method is None:
+            sampling_downscore_false_negatives_method = (
+                "sorted" if deduplicate_negatives else "dense"
+            )
+        if sampling_downscore_false_negatives_method not in ("dense", "sorted"):
+            raise ValueError(
+                "sampling_downscore_false_negatives_method must be 'dense' or 'sorted' "
+                f"(got {sampling_downscore_false_negatives_method})"
+            )
+        if deduplicate_negatives and sampling_downscore_false_negatives_method != "sorted":
+            raise ValueError(
+                "deduplicate_negatives=True finds the false negatives with the 'sorted' "
+                "sampling_downscore_false_negatives_method "
+                f"(got {sampling_downscore_false_negatives_method})"
+            )
+        self.false_negatives_method = sampling_downscore_false_negatives_method
         self.item_id_feature_name = item_id_feature_name
         self.query_name = query_name
         self.item_name = item_name
         self.cache_query = cache_query
+        self.item_frequency_estimator = item_frequency_estimator
+        self.deduplicate_negatives = deduplicate_negatives
+        self.eval_top_k = eval_top_k
+        self.eval_block_size = eval_block_size
+        self._top_k_index = None
 
         if not isinstance(samplers, (list, tuple)):
             samplers = (samplers,)  # type: ignore
@@ -174,11 +236,18 @@ class ItemRetrievalScorer(Block):
                     shape=tf.TensorShape([None, query_shape[-1]]),
                 )
             )
+        if self.eval_top_k is not None:
+            embedding_table = self.context.get_embedding(self.item_id_feature_name)
+            self._top_k_index = TopKIndexBlock(
+                min(self.eval_top_k + 1, embedding_table.shape[0]),
+                values=embedding_table,
+                block_size=self.eval_block_size,
+            )
         super().build(input_shapes)
 
     def set_required_features(self):
         required_features = set()
-        if self.downscore_false_negatives:
+        if self._requires_item_ids:
             required_features.add(self.item_id_feature_name)
 
         required_features.update(
@@ -187,6 +256,14 @@ class ItemRetrievalScorer(Block):
 
         self._required_features = list(required_features)
 
+    @property
+    def _requires_item_ids(self) -> bool:
+        return (
+            self.downscore_false_negatives
+            or self.deduplicate_negatives
+            or self.item_frequency_estimator is not None
+        )
+
     def add_features_to_context(self, feature_shapes) -> List[str]:
         return self._required_features
 
@@ -240,6 +317,9 @@ class ItemRetrievalScorer(Block):
             return inputs
 
         if isinstance(inputs, tf.Tensor):
+            if self.eval_top_k:
+                # The top-k items are scored by `call_outputs()`
+                return inputs
             embedding_table = self.context.get_embedding(self.item_id_feature_name)
             all_scores = tf.matmul(inputs, tf.transpose(embedding_table))
             return all_scores
@@ -250,7 +330,6 @@ class ItemRetrievalScorer(Block):
         )
         return positive_scores
 
-    @tf.function
     def call_outputs(
         self, outputs: PredictionOutput, training=True, **kwargs
     ) -> "PredictionOutput":
@@ -278,6 +357,14 @@ class ItemRetrievalScorer(Block):
         else:
             positive_item_ids = self.context[self.item_id_feature_name]
 
+        if not training and self.eval_top_k and isinstance(predictions, tf.Tensor):
+            # Out of the tf.function, so that the top-k can be shared with other tasks
+            return self._top_k_outputs(predictions, positive_item_ids)
+
+        return self._sampled_outputs(predictions, targets, positive_item_ids, training=training)
+
+    @tf.function
+    def _sampled_outputs(self, predictions, targets, positive_item_ids, training=True):
         if training:
             assert (
                 len(self.samplers) > 0
@@ -297,21 +384,40 @@ class ItemRetrievalScorer(Block):
                 axis=-1,
             )
 
+            if self.item_frequency_estimator is not None:
+                # logQ correction of the sampling bias
+                estimator = self.item_frequency_estimator
+                estimator.update(positive_item_ids)
+                positive_scores -= tf.cast(
+                    tf.reshape(estimator.log_q(positive_item_ids), [-1, 1]), positive_scores.dtype
+                )
+
             neg_items_embeddings_list = []
             neg_items_ids_list = []
+            neg_items_log_q_list = []
 
             # Adds items from the current batch into samplers and sample a number of negatives
             for sampler in self.samplers:
                 input_data = EmbeddingWithMetadata(batch_items_embeddings, batch_items_metadata)
                 if "item_weights" in sampler._call_fn_args:
                     neg_items = sampler(input_data.__dict__, item_weights=embedding_table)
+                elif "query_embeddings" in sampler._call_fn_args:
+                    # e.g. hard negatives, which are mined for the queries of the batch
+                    neg_items = sampler(
+                        input_data.__dict__, query_embeddings=predictions[self.query_name]
+                    )
                 else:
                     neg_items = sampler(input_data.__dict__)
 
+                # Out of the condition below, which is converted to a tf.cond by autograph
+                # (the negatives of samplers returning no samples have an empty log_q)
+                neg_items_log_q_list.append(
+                    (self._negatives_log_q(sampler, neg_items), neg_items.embeddings)
+                )
                 if tf.shape(neg_items.embeddings)[0] > 0:
                     # Accumulates sampled negative items from all samplers
                     neg_items_embeddings_list.append(neg_items.embeddings)
-                    if self.downscore_false_negatives:
+                    if self._requires_item_ids:
                         neg_items_ids_list.append(neg_items.metadata[self.item_id_feature_name])
                 else:
                     LOG.warn(
@@ -325,25 +431,59 @@ class ItemRetrievalScorer(Block):
             else:
                 neg_items_embeddings = tf.concat(neg_items_embeddings_list, axis=0)
 
-            negative_scores = tf.linalg.matmul(
-                predictions[self.query_name], neg_items_embeddings, transpose_b=True
-            )
-
-            if self.downscore_false_negatives:
-                if isinstance(targets, tf.Tensor):
-                    positive_item_ids = targets
-                else:
-                    positive_item_ids = self.context[self.item_id_feature_name]
-
+            if neg_items_ids_list:
                 if len(neg_items_ids_list) == 1:
                     neg_items_ids = neg_items_ids_list[0]
                 else:
                     neg_items_ids = tf.concat(neg_items_ids_list, axis=0)
 
-                negative_scores = rescore_false_negatives(
-                    positive_item_ids, neg_items_ids, negative_scores, self.false_negatives_score
+            neg_items_log_q = None
+            if any(log_q is not None for log_q, _ in neg_items_log_q_list):
+                # The negatives of the other samplers are not corrected
+                neg_items_log_q = tf.concat(
+                    [
+                        tf.zeros([tf.shape(embeddings)[0]]) if log_q is None else log_q
+                        for log_q, embeddings in neg_items_log_q_list
+                    ],
+                    axis=0,
                 )
 
+            if self.deduplicate_negatives:
+                if neg_items_log_q is None:
+                    neg_items_ids, neg_items_embeddings = unique_items(
+                        neg_items_ids, neg_items_embeddings
+                    )
+                else:
+                    neg_items_ids, neg_items_embeddings, neg_items_log_q = unique_items(
+                        neg_items_ids, neg_items_embeddings, neg_items_log_q
+                    )
+
+            negative_scores = tf.linalg.matmul(
+                predictions[self.query_name], neg_items_embeddings, transpose_b=True
+            )
+
+            if neg_items_log_q is not None:
+                # logQ correction of the negatives
+                negative_scores -= tf.cast(
+                    tf.reshape(neg_items_log_q, [1, -1]), negative_scores.dtype
+                )
+
+            if self.downscore_false_negatives:
+                if self.false_negatives_method == "sorted":
+                    negative_scores = rescore_false_negatives_sorted(
+                        positive_item_ids,
+                        neg_items_ids,
+                        negative_scores,
+                        self.false_negatives_score,
+                    )
+                else:
+                    negative_scores = rescore_false_negatives(
+                        positive_item_ids,
+                        neg_items_ids,
+                        negative_scores,
+                        self.false_negatives_score,
+                    )
+
             predictions = tf.concat([positive_scores, negative_scores], axis=-1)
 
             # To ensure that the output is always fp32, avoiding numerical
@@ -365,21 +505,96 @@ class ItemRetrievalScorer(Block):
         )
         return PredictionOutput(predictions, targets, positive_item_ids=positive_item_ids)
 
+    def _top_k_outputs(self, queries: tf.Tensor, positive_item_ids: tf.Tensor) -> PredictionOutput:
+        """Scores the positive items and the top-k other items of the catalog,
+        which are retrieved by the `TopKIndexBlock` built over the item embeddings table.
+
+        The top-k of the catalog is shared (through the context) with the other tasks
+        scoring the same queries, so the positive items are removed from the top-(k + 1)
+        afterwards rather than excluded from the scores of the catalog."""
+        embedding_table = self.context.get_embedding(self.item_id_feature_name)
+        queries = tf.cast(queries, embedding_table.dtype)
+        positive_item_ids = tf.reshape(positive_item_ids, [-1])
+
+        positive_scores = tf.reduce_sum(
+            queries * embedding_ops.embedding_lookup(embedding_table, positive_item_ids),
+            axis=-1,
+            keepdims=True,
+        )
+
+        def top_k_fn(queries, k):
+            return self._top_k_index.call(queries, k=k)
+
+        top_scores, top_ids = self.context.shared_top_k(
+            queries, embedding_table, self._top_k_index._k, top_k_fn
+        )
+        is_positive = tf.equal(
+            tf.cast(top_ids, tf.int64), tf.cast(tf.expand_dims(positive_item_ids, -1), tf.int64)
+        )
+        top_scores = tf.where(is_positive, tf.cast(MIN_FLOAT, top_scores.dtype), top_scores)
+        top_scores, _ = tf.math.top_k(top_scores, k=self.eval_top_k)
+
+        predictions = tf.cast(tf.concat([positive_scores, top_scores], axis=-1), tf.float32)
+
+        targets = tf.concat(
+            [
+                tf.ones([tf.shape(predictions)[0], 1], dtype=predictions.dtype),
+                tf.zeros([tf.shape(predictions)[0], self.eval_top_k], dtype=predictions.dtype),
+            ],
+            axis=1,
+        )
+        return PredictionOutput(predictions, targets, positive_item_ids=positive_item_ids)
+
+    def _negatives_log_q(self, sampler: ItemSampler, neg_items: EmbeddingWithMetadata):
+        """The logQ correction of the negatives of a sampler: the log of their expected
+        count if the sampler provides it, otherwise the log of their sampling probability
+        estimated by `item_frequency_estimator` (if set), so that the negatives are never
+        corrected twice"""
+        sampler_log_q = self._sampler_log_q(sampler, neg_items)
+        if sampler_log_q is not None or self.item_frequency_estimator is None:
+            return sampler_log_q
+
+        return tf.cast(
+            tf.reshape(
+                self.item_frequency_estimator.log_q(neg_items.metadata[self.item_id_feature_name]),
+                [-1],
+            ),
+            tf.float32,
+        )
+
+    @staticmethod
+    def _sampler_log_q(sampler: ItemSampler, neg_items: EmbeddingWithMetadata):
+        """The log of the expected count of the sampled items, if the sampler provides it
+        in its `bias_feature_name` metadata feature (e.g. `FrequencyBasedSampler`)"""
+        bias_feature_name = getattr(sampler, "bias_feature_name", None)
+        if bias_feature_name is None or bias_feature_name not in neg_items.metadata:
+            return None
+
+        return tf.math.log(
+            tf.cast(tf.reshape(neg_items.metadata[bias_feature_name], [-1]), tf.float32)
+        )
+
     def get_batch_items_metadata(self):
         result = {feat_name: self.context[feat_name] for feat_name in self._required_features}
         return result
 
     def get_config(self):
         config = super().get_config()
-        config = maybe_serialize_keras_objects(self, config, ["samplers"])
-        config["downscore_false_negatives"] = self.downscore_false_negatives
-        config["false_negatives_score"] = self.false_negatives_score
+        config = maybe_serialize_keras_objects(
+            self, config, ["samplers", "item_frequency_estimator"]
+        )
+        config["sampling_downscore_false_negatives"] = self.downscore_false_negatives
+        config["sampling_downscore_false_negatives_value"] = self.false_negatives_score
+        config["sampling_downscore_false_negatives_method"] = self.false_negatives_method
         config["item_id_feature_name"] = self.item_id_feature_name
+        config["deduplicate_negatives"] = self.deduplicate_negatives
+        config["eval_top_k"] = self.eval_top_k
+        config["eval_block_size"] = self.eval_block_size
 
         return config
 
     @classmethod
     def from_config(cls, config):
-        config = maybe_deserialize_keras_objects(config, ["samplers"])
+        config = maybe_deserialize_keras_objects(config, ["samplers", "item_frequency_estimator"])
 
         return super().from_config(config)
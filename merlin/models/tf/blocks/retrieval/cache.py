@@ -0,0 +1,278 @@
+#
+# Copyright (c) 2021, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from merlin.models.tf.blocks.core.base import Block
+from merlin.schema import Schema, Tags
+
+
+class QueryEmbeddingCache:
+    """In-memory cache of query embeddings keyed by the query id
+    (e.g. the user id), with LRU and (optional) TTL eviction.
+
+    The cache is invalidated when the `version` passed to `check_version()`
+    changes, which is used by `CachedQueryBlock` to drop the embeddings
+    computed before the model weights were updated.
+
+    Parameters
+    ----------
+    max_size : int
+        Maximum number of embeddings to keep, the least recently used
+        are evicted first. By default 100_000.
+    ttl : Optional[float]
+        Time-to-live of the embeddings in seconds. By default None,
+        which means that embeddings only expire by LRU eviction.
+    clock : Callable[[], float]
+        Function returning the current time in seconds, by default `time.monotonic`.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 100_000,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_size <= 0:
+            raise ValueError(f"max_size must be greater than 0 (got {max_size})")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.version: Any = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._data: "OrderedDict[Hashable, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, count=False) is not None
+
+    def get(self, key: Hashable, count: bool = True) -> Optional[np.ndarray]:
+        with self._lock:
+            value = self._get(key)
+            if count:
+                if value is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+
+            return value
+
+    def get_many(self, keys: Sequence[Hashable]) -> Tuple[np.ndarray, Dict[int, np.ndarray]]:
+        """Looks-up many keys at once
+
+        Returns
+        -------
+        Tuple[np.ndarray, Dict[int, np.ndarray]]
+            A boolean mask of the keys found and a dict with the embeddings
+            found by position of the key.
+        """
+        found = np.zeros(len(keys), dtype=bool)
+        values = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                value = self._get(key)
+                if value is not None:
+                    found[i] = True
+                    values[i] = value
+            num_hits = int(found.sum())
+            self.hits += num_hits
+            self.misses += len(keys) - num_hits
+
+        return found, values
+
+    def put(self, key: Hashable, value: np.ndarray) -> None:
+        with self._lock:
+            self._put(key, value)
+
+    def put_many(self, keys: Sequence[Hashable], values: np.ndarray) -> None:
+        with self._lock:
+            for key, value in zip(keys, values):
+                self._put(key, value)
+
+    def check_version(self, version: Any) -> None:
+        """Clears the cache if `version` differs from the version of the cached embeddings"""
+        with self._lock:
+            if version != self.version:
+                self._data.clear()
+                self.version = version
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def reset_counters(self) -> None:
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+    def _get(self, key: Hashable) -> Optional[np.ndarray]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, timestamp = item
+        if self.ttl is not None and self.clock() - timestamp > self.ttl:
+            del self._data[key]
+            self.evictions += 1
+            return None
+        self._data.move_to_end(key)
+
+        return value
+
+    def _put(self, key: Hashable, value: np.ndarray) -> None:
+        self._data[key] = (value, self.clock())
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
+@tf.keras.utils.register_keras_serializable(package="merlin_models")
+class CachedQueryBlock(Block):
+    """Wraps a query tower so that the embeddings of queries already seen
+    (by their id feature) are retrieved from a `QueryEmbeddingCache`,
+    and only the queries missing in the cache go through the query tower.
+
+    The cache lookup and update run as `tf.py_function`, so the cache is used
+    eagerly as well as in graph mode (`tf.function`, `Model.predict`), but the
+    Python process must run the graph: a SavedModel served without the Python
+    code (e.g. by Triton or TF Serving) can't run them.
+
+    Parameters
+    ----------
+    block : Block
+        The query tower
+    cache : Optional[QueryEmbeddingCache]
+        The cache to use, by default a `QueryEmbeddingCache()`
+    id_feature_name : Optional[str]
+        Name of the query id feature, by default the feature tagged
+        with `Tags.USER_ID` in the schema of `block`
+    version_fn : Optional[Callable[[], Any]]
+        Function that returns the version of the weights of `block`, the cache
+        is cleared whenever it changes (e.g. after a training step).
+    """
+
+    def __init__(
+        self,
+        block: Block,
+        cache: Optional[QueryEmbeddingCache] = None,
+        id_feature_name: Optional[str] = None,
+        version_fn: Optional[Callable[[], Any]] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.block = block
+        self.cache = cache if cache is not None else QueryEmbeddingCache()
+        self.version_fn = version_fn
+        if not id_feature_name:
+            schema: Optional[Schema] = getattr(block, "schema", None)
+            id_features = schema.select_by_tag(Tags.USER_ID) if schema else None
+            if not id_features:
+                raise ValueError(
+                    "Could not infer the query id feature from the block schema, "
+                    "please set `id_feature_name`."
+                )
+            id_feature_name = id_features.first.name
+        self.id_feature_name = id_feature_name
+
+    def call(self, inputs, **kwargs):
+        ids = inputs.get(self.id_feature_name) if isinstance(inputs, dict) else None
+        if ids is None or not all(
+            isinstance(val, (tf.Tensor, tf.RaggedTensor)) for val in inputs.values()
+        ):
+            return self.block(inputs, **kwargs)
+
+        keys = tf.reshape(ids, (-1,))
+        found, cached = tf.py_function(self._lookup, [keys], [tf.bool, tf.float32])
+        found = tf.ensure_shape(found, keys.shape)
+        found_positions = tf.cast(tf.reshape(tf.where(found), (-1,)), tf.int32)
+        missing = tf.cast(tf.reshape(tf.where(tf.logical_not(found)), (-1,)), tf.int32)
+
+        missing_inputs = {name: tf.gather(val, missing) for name, val in inputs.items()}
+        missing_outputs = self.block(missing_inputs, **kwargs)
+        cached = tf.reshape(
+            tf.cast(cached, missing_outputs.dtype),
+            tf.concat([[-1], tf.shape(missing_outputs)[1:]], axis=0),
+        )
+        outputs = tf.dynamic_stitch([found_positions, missing], [cached, missing_outputs])
+
+        stored = tf.py_function(self._store, [tf.gather(keys, missing), missing_outputs], tf.bool)
+        with tf.control_dependencies([stored]):
+            return tf.identity(outputs)
+
+    def _lookup(self, keys: tf.Tensor) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the mask of the keys found in the cache and their flattened embeddings"""
+        if self.version_fn is not None:
+            self.cache.check_version(self.version_fn())
+
+        found, cached = self.cache.get_many(keys.numpy().tolist())
+        if not cached:
+            return found, np.zeros((0,), dtype=np.float32)
+        values = np.stack([cached[i] for i in sorted(cached)]).astype(np.float32)
+
+        return found, values.reshape(-1)
+
+    def _store(self, keys: tf.Tensor, embeddings: tf.Tensor) -> bool:
+        self.cache.put_many(keys.numpy().tolist(), embeddings.numpy())
+
+        return True
+
+    def compute_output_shape(self, input_shape):
+        return self.block.compute_output_shape(input_shape)
+
+    @property
+    def schema(self) -> Schema:
+        return self.block.schema
+
+    def get_config(self):
+        config = super().get_config()
+        config["block"] = tf.keras.utils.serialize_keras_object(self.block)
+        config["id_feature_name"] = self.id_feature_name
+        config["max_size"] = self.cache.max_size
+        config["ttl"] = self.cache.ttl
+
+        return config
+
+    @classmethod
+    def from_config(cls, config):
+        block = tf.keras.utils.deserialize_keras_object(config.pop("block"))
+        cache = QueryEmbeddingCache(max_size=config.pop("max_size"), ttl=config.pop("ttl"))
+
+        return cls(block, cache=cache, **config)
@@ -13,11 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Union
 
+import numpy as np
 import tensorflow as tf
 from tensorflow.python.ops import embedding_ops
 
+import merlin.io
 from merlin.models.tf.blocks.sampling.base import EmbeddingWithMetadata, ItemSampler
 from merlin.models.tf.blocks.sampling.queue import FIFOQueue
 from merlin.models.tf.typing import TabularData
@@ -58,17 +60,24 @@ class CachedCrossBatchSampler(ItemSampler):
         Whether should include the last batch in the sampling. By default `False`,
         as for sampling from the current batch we recommend `InBatchSampler()`, which
         allows computing gradients for in-batch negative items
+    embeddings_storage_dtype: Union[tf.DType, str], optional
+        The dtype used to store the cached item embeddings, which are converted back
+        to float32 when sampled: tf.float16 or tf.bfloat16 halve the memory of the cache,
+        and tf.int8 (quantized with a scale per embedding) divides it by ~4.
+        By default None, which stores the embeddings as float32
     """
 
     def __init__(
         self,
         capacity: int,
         ignore_last_batch_on_sample: bool = True,
+        embeddings_storage_dtype: Optional[Union[tf.DType, str]] = None,
         **kwargs,
     ):
         assert capacity > 0
         super().__init__(max_num_samples=capacity, **kwargs)
         self.ignore_last_batch_on_sample = ignore_last_batch_on_sample
+        self.embeddings_storage_dtype = embeddings_storage_dtype
         self.item_metadata_dtypes: Dict[str, tf.dtypes.DType] = {}
 
         self._last_batch_size = 0
@@ -97,6 +106,7 @@ class CachedCrossBatchSampler(ItemSampler):
             capacity=queue_size,
             dims=item_embeddings_dims,
             dtype=tf.float32,
+            storage_dtype=self.embeddings_storage_dtype,
             name="item_emb",
         )
 
@@ -108,6 +118,8 @@ class CachedCrossBatchSampler(ItemSampler):
                 dims=list(items_metadata[feat_name][1:]),
                 dtype=self.item_metadata_dtypes[feat_name],
                 name=f"item_metadata_{feat_name}",
+                # Only the item ids of CachedUniformSampler are searched with index_of()
+                index_values=feat_name == getattr(self, "item_id_feature_name", None),
             )
 
     def _check_built(self) -> None:
@@ -222,6 +234,9 @@ class CachedUniformSampler(CachedCrossBatchSampler):
     item_id_feature_name: str
         Name of the column containing the item ids
         Defaults to `item_id`
+    embeddings_storage_dtype: Union[tf.DType, str], optional
+        The dtype used to store the cached item embeddings
+        (see `CachedCrossBatchSampler`). By default None (float32)
     """
 
     def __init__(
@@ -461,3 +476,230 @@ class PopularityBasedSampler(ItemSampler):
             items_embeddings,
             metadata={self.item_id_feature_name: tf.cast(sampled_ids, tf.int32)},
         )
+
+
+class FrequencyBasedSampler(ItemSampler):
+    """
+    Provides a negative sampling from the actual item frequencies (e.g. the number of
+    interactions of each item), which can be smoothed as `frequency^alpha`.
+    Differently from the `PopularityBasedSampler`, it doesn't require the item ids
+    to be encoded by decreasing frequency.
+
+    The samples are drawn (with replacement) with the alias method [1]_, which takes
+    constant time per sample after building the alias tables with vectorized numpy
+    operations.
+    The expected count Q of each sampled item (`max_num_samples` times its sampling
+    probability, not its popularity) is returned in the `bias_feature_name` metadata
+    feature, and `ItemRetrievalScorer` subtracts log(Q) from the logits of the samples
+    (logQ correction) [2]_.
+
+    P.s. Ignoring the false negatives (negative items equal to the positive ones) is
+    managed by `ItemRetrievalScorer(..., sampling_downscore_false_negatives=True)`
+
+    References
+    ----------
+    .. [1] Walker, Alastair J. "An efficient method for generating discrete random
+       variables with general distributions." ACM Transactions on Mathematical Software
+       (TOMS) 3.3 (1977): 253-256.
+    .. [2] Yi, Xinyang, et al. "Sampling-bias-corrected neural modeling for large corpus
+       item recommendations." Proceedings of the 13th ACM Conference on Recommender
+       Systems. 2019.
+
+    Parameters
+    ----------
+    item_frequencies: Union[np.ndarray, tf.Tensor, List[float]]
+        The frequency of each item id, indexed by item id. Items with zero frequency
+        (e.g. the ids reserved for <nulls> or padding) are never sampled.
+    alpha: float
+        Smoothing exponent of the frequencies, e.g. 0.75 (as in word2vec)
+        flattens the distribution. Defaults to 1.0.
+    max_num_samples: int
+        The number of negatives to sample at each batch. Defaults to 100.
+    seed: int
+        Fix the random values returned by the sampler to ensure reproducibility
+        Defaults to None
+    item_id_feature_name: str
+        Name of the column containing the item ids
+        Defaults to `item_id`
+    bias_feature_name: str
+        Name of the metadata feature with the expected count Q of the sampled items,
+        whose log is the logQ correction. Defaults to `popularity`, the feature
+        `SamplingBiasCorrection` subtracts the log of by default.
+    """
+
+    def __init__(
+        self,
+        item_frequencies,
+        alpha: float = 1.0,
+        max_num_samples: int = 100,
+        seed: Optional[int] = None,
+        item_id_feature_name: str = "item_id",
+        bias_feature_name: str = "popularity",
+        **kwargs,
+    ):
+        super().__init__(max_num_samples=max_num_samples, **kwargs)
+        self.alpha = alpha
+        self.seed = seed
+        self.item_id_feature_name = item_id_feature_name
+        self.bias_feature_name = bias_feature_name
+        self._generator = (
+            tf.random.Generator.from_seed(seed)
+            if seed is not None
+            else tf.random.Generator.from_non_deterministic_state()
+        )
+
+        probs, alias_probs, alias = self._alias_tables(item_frequencies)
+        self.num_items = len(probs)
+        self.probs = tf.Variable(probs, trainable=False, dtype=tf.float32)
+        self.alias_probs = tf.Variable(alias_probs, trainable=False, dtype=tf.float32)
+        self.alias = tf.Variable(alias, trainable=False, dtype=tf.int64)
+
+    @classmethod
+    def from_dataset(
+        cls,
+        data: merlin.io.Dataset,
+        item_id_feature_name: str = "item_id",
+        num_items: Optional[int] = None,
+        **kwargs,
+    ) -> "FrequencyBasedSampler":
+        """Builds the sampler from the item frequencies of a dataset of interactions
+
+        Parameters
+        ----------
+        data: merlin.io.Dataset
+            Dataset with the item id column.
+        item_id_feature_name: str
+            Name of the column containing the item ids. Defaults to `item_id`
+        num_items: int, optional
+            Number of item ids (e.g. the item id cardinality).
+            By default, the maximum item id found in `data` + 1.
+        """
+        counts = data.to_ddf()[item_id_feature_name].value_counts().compute()
+        if hasattr(counts, "to_pandas"):
+            counts = counts.to_pandas()
+        num_items = num_items or int(counts.index.max()) + 1
+        frequencies = np.zeros(num_items, dtype=np.float64)
+        frequencies[counts.index.values] = counts.values
+
+        return cls(frequencies, item_id_feature_name=item_id_feature_name, **kwargs)
+
+    def update_frequencies(self, item_frequencies) -> None:
+        """Rebuilds the alias tables from new item frequencies (e.g. streaming counts).
+        The number of items must not change."""
+        probs, alias_probs, alias = self._alias_tables(item_frequencies)
+        if len(probs) != self.num_items:
+            raise ValueError(
+                f"The number of item frequencies ({len(probs)}) must match "
+                f"the number of items of the sampler ({self.num_items})."
+            )
+        self.probs.assign(probs)
+        self.alias_probs.assign(alias_probs)
+        self.alias.assign(alias)
+
+    def _alias_tables(self, item_frequencies):
+        if isinstance(item_frequencies, tf.Tensor):
+            item_frequencies = item_frequencies.numpy()
+        frequencies = np.power(np.asarray(item_frequencies, dtype=np.float64), self.alpha)
+        if len(frequencies.shape) != 1 or not (frequencies >= 0).all() or frequencies.sum() <= 0:
+            raise ValueError("The item frequencies must be a 1D array of non-negative values.")
+        probs = frequencies / frequencies.sum()
+
+        return (probs,) + _build_alias_tables(probs)
+
+    def _check_inputs(self, inputs):
+        assert self.item_id_feature_name in inputs["metadata"], (
+            f"The '{self.item_id_feature_name}' metadata feature is required "
+            "by FrequencyBasedSampler."
+        )
+
+    def add(self, embeddings: tf.Tensor, items_metadata: TabularData, training=True):
+        pass
+
+    def call(
+        self, inputs: TabularData, item_weights: tf.Tensor, training=True
+    ) -> EmbeddingWithMetadata:
+        if training:
+            self._check_inputs(inputs)
+
+        tf.assert_less(
+            tf.cast(self.num_items - 1, tf.int64),
+            tf.cast(tf.shape(item_weights)[0], tf.int64),
+            f"The number of items of the sampler ({self.num_items}) should not be "
+            "greater than the first dimension of the items embeddings.",
+        )
+
+        return self.sample(item_weights)
+
+    @property
+    def required_features(self) -> List[str]:
+        return [self.item_id_feature_name]
+
+    def sample(self, item_weights) -> EmbeddingWithMetadata:  # type: ignore
+        # Alias method: draws a bucket uniformly, then either the bucket item
+        # or its alias depending on the bucket probability
+        buckets = self._generator.uniform(
+            (self.max_num_samples,), maxval=self.num_items, dtype=tf.int64
+        )
+        coins = self._generator.uniform((self.max_num_samples,))
+        sampled_ids = tf.where(
+            coins < tf.gather(self.alias_probs, buckets), buckets, tf.gather(self.alias, buckets)
+        )
+
+        items_embeddings = embedding_ops.embedding_lookup(item_weights, sampled_ids)
+
+        return EmbeddingWithMetadata(
+            items_embeddings,
+            metadata={
+                self.item_id_feature_name: tf.cast(sampled_ids, tf.int32),
+                self.bias_feature_name: self.expected_count(sampled_ids),
+            },
+        )
+
+    def expected_count(self, item_ids: tf.Tensor) -> tf.Tensor:
+        """Expected number of times that the items are sampled in a batch (Q)"""
+        return self.max_num_samples * tf.gather(self.probs, tf.cast(item_ids, tf.int64))
+
+    def log_q(self, item_ids: tf.Tensor) -> tf.Tensor:
+        """The log-Q correction of the logits of the items, i.e. the log of their
+        expected count in the samples, to be subtracted from the logits"""
+        return tf.math.log(self.expected_count(item_ids))
+
+
+def _build_alias_tables(probs: np.ndarray):
+    """Builds the tables of the alias method for the discrete distribution `probs`,
+    returning the probability of keeping the item of each bucket and the alias item
+    of each bucket.
+
+    Vose's algorithm fills the small buckets (scaled probability < 1) one at a time
+    from the excess of the large ones. Here all the small buckets are filled at once
+    in each round: their deficits are laid out one after the other and each one is
+    filled by the large bucket whose cumulated excess covers the start of the deficit.
+    The large buckets left below 1 are the small buckets of the next round.
+    """
+    num_items = len(probs)
+    scaled_probs = probs * num_items
+    alias_probs = np.ones(num_items, dtype=np.float64)
+    alias = np.arange(num_items, dtype=np.int64)
+
+    small = np.flatnonzero(scaled_probs < 1.0)
+    large = np.flatnonzero(scaled_probs >= 1.0)
+    while len(small) and len(large):
+        deficits = 1.0 - scaled_probs[small]
+        starts = np.cumsum(deficits) - deficits
+        excesses = np.cumsum(scaled_probs[large] - 1.0)
+        donors = np.minimum(np.searchsorted(excesses, starts, side="right"), len(large) - 1)
+
+        alias_probs[small] = scaled_probs[small]
+        alias[small] = large[donors]
+        scaled_probs[large] -= np.bincount(donors, weights=deficits, minlength=len(large))
+
+        is_small = scaled_probs[large] < 1.0
+        small, large = large[is_small], large[~is_small]
+
+    # The remaining buckets (up to numerical errors) are kept with probability 1
+    # (but zero-probability items must never be sampled)
+    never_sampled = small[probs[small] == 0]
+    alias_probs[never_sampled] = 0.0
+    alias[never_sampled] = int(np.argmax(probs))
+
+    return alias_probs, alias
@@ -0,0 +1,339 @@
+#
+# Copyright (c) 2021, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import threading
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+import merlin.io
+from merlin.models.tf.blocks.core.base import Block
+from merlin.models.tf.blocks.core.index import TopKIndexBlock
+from merlin.models.tf.blocks.sampling.base import EmbeddingWithMetadata, ItemSampler
+from merlin.models.tf.typing import TabularData
+from merlin.schema import Tags
+
+ItemEmbeddingsFn = Callable[[], Tuple[np.ndarray, np.ndarray]]
+
+
+class HardNegativeSampler(ItemSampler):
+    """Provides hard negatives for two-tower item retrieval models, i.e. the items
+    with the highest scores for each query of the batch, other than its positive item.
+
+    The items are retrieved from a snapshot of the item tower embeddings, which is
+    refreshed every `refresh_every` training steps by the callback returned
+    by `refresh_callback()`. The new snapshot is computed in a background thread
+    (if `asynchronous=True`) while training goes on, and it replaces the previous
+    one at the beginning of the next training step.
+    The hard negatives of all queries of the batch are (deduplicated and) returned
+    as negatives for the whole batch. As the snapshot embeddings are fixed,
+    no gradients are computed for them (like `CachedCrossBatchSampler`).
+    A common combination is `[InBatchSampler(), HardNegativeSampler(...)]`.
+    P.s. Ignoring the false negatives (negative items equal to the positive ones) is
+    managed by `ItemRetrievalScorer(..., sampling_downscore_false_negatives=True)`
+
+    Example usage::
+
+        sampler = HardNegativeSampler(
+            lambda: HardNegativeSampler.item_embeddings_from_block(
+                model.retrieval_block.item_block(), items_dataset
+            ),
+            num_hard_negatives=10,
+            refresh_every=1000,
+        )
+        ...
+        model.fit(train_data, callbacks=[sampler.refresh_callback()])
+
+    Parameters
+    ----------
+    item_embeddings_fn: Callable[[], Tuple[np.ndarray, np.ndarray]]
+        Function that returns the ids and the embeddings of all candidate items,
+        with the current weights of the item tower
+        (e.g. using `HardNegativeSampler.item_embeddings_from_block()`).
+        The number of items must be the same for all refreshes.
+    num_hard_negatives: int
+        Number of hard negatives to retrieve for each query. Defaults to 10
+    refresh_every: int
+        Number of training steps between refreshes of the items snapshot.
+        Defaults to 1000
+    asynchronous: bool
+        Whether the snapshot is refreshed in a background thread. The first
+        snapshot is always computed synchronously. Defaults to True
+    block_size: Optional[int]
+        If set, the items are scored and reduced to the top-k `block_size` items
+        at a time, which bounds the memory of the scores matrix.
+        By default None (a single block).
+    item_id_feature_name: str
+        Name of the column containing the item ids
+        Defaults to `item_id`
+    """
+
+    def __init__(
+        self,
+        item_embeddings_fn: ItemEmbeddingsFn,
+        num_hard_negatives: int = 10,
+        refresh_every: int = 1000,
+        asynchronous: bool = True,
+        block_size: Optional[int] = None,
+        item_id_feature_name: str = "item_id",
+        **kwargs,
+    ):
+        super().__init__(max_num_samples=num_hard_negatives, **kwargs)
+        if refresh_every <= 0:
+            raise ValueError(f"refresh_every must be greater than 0 (got {refresh_every})")
+        self.item_embeddings_fn = item_embeddings_fn
+        self.num_hard_negatives = num_hard_negatives
+        self.refresh_every = refresh_every
+        self.asynchronous = asynchronous
+        self.block_size = block_size
+        self.item_id_feature_name = item_id_feature_name
+        self.num_refreshes = 0
+
+        self._item_ids: Optional[tf.Variable] = None
+        self._item_embeddings: Optional[tf.Variable] = None
+        self._sorted_item_ids: Optional[tf.Variable] = None
+        self._item_ids_order: Optional[tf.Variable] = None
+        self._top_k_index: Optional[TopKIndexBlock] = None
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._pending: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._pending_error: Optional[BaseException] = None
+
+    @staticmethod
+    def item_embeddings_from_block(
+        block: Block,
+        data: merlin.io.Dataset,
+        id_column: Optional[str] = None,
+        batch_size: int = 1024,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Computes the embeddings of the items of `data` with the item tower `block`
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            The item ids and the item embeddings
+        """
+        from merlin.models.tf.utils.batch_utils import data_iterator_func
+
+        if not id_column:
+            id_column = block.schema.select_by_tag(Tags.ITEM_ID).first.name
+
+        ids, embeddings = [], []
+        ddf = data.to_ddf() if hasattr(data, "to_ddf") else data
+        for batch in data_iterator_func(block.schema, batch_size=batch_size)(ddf):
+            embeddings.append(block(batch[0], training=False).numpy())
+            ids.append(np.reshape(batch[0][id_column].numpy(), (-1,)))
+
+        return np.concatenate(ids), np.concatenate(embeddings)
+
+    @property
+    def required_features(self) -> List[str]:
+        return [self.item_id_feature_name]
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether an items snapshot is available for sampling"""
+        return self._item_embeddings is not None
+
+    def refresh(self, asynchronous: Optional[bool] = None) -> None:
+        """Refreshes the items snapshot.
+
+        Parameters
+        ----------
+        asynchronous: Optional[bool]
+            Whether to compute the snapshot in a background thread, in which case
+            it is only used after `apply_refresh()` is called. Defaults to `self.asynchronous`
+        """
+        asynchronous = self.asynchronous if asynchronous is None else asynchronous
+        if not asynchronous or not self.is_ready:
+            self._set_items(*self.item_embeddings_fn())
+            return
+
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            # The previous refresh is not done yet
+            return
+        self._refresh_thread = threading.Thread(target=self._compute_snapshot, daemon=True)
+        self._refresh_thread.start()
+
+    def apply_refresh(self, wait: bool = False) -> bool:
+        """Replaces the items snapshot by the one computed in background, if available.
+
+        Parameters
+        ----------
+        wait: bool
+            Whether to wait for the background refresh in progress (if any)
+
+        Returns
+        -------
+        bool
+            Whether the items snapshot was replaced
+        """
+        if wait and self._refresh_thread is not None:
+            self._refresh_thread.join()
+        if self._pending_error is not None:
+            error, self._pending_error = self._pending_error, None
+            raise RuntimeError("The refresh of the hard negatives snapshot failed") from error
+        if self._pending is None:
+            return False
+        pending, self._pending = self._pending, None
+        self._set_items(*pending)
+
+        return True
+
+    def refresh_callback(self) -> tf.keras.callbacks.Callback:
+        """Returns the Keras callback that refreshes the items snapshot
+        every `refresh_every` training steps"""
+        return _HardNegativeRefreshCallback(self)
+
+    def _compute_snapshot(self) -> None:
+        try:
+            self._pending = self.item_embeddings_fn()
+        except Exception as e:
+            self._pending_error = e
+
+    def _set_items(self, ids, embeddings) -> None:
+        ids, embeddings = np.asarray(ids), np.asarray(embeddings)
+        if embeddings.ndim != 2 or ids.shape != embeddings.shape[:1]:
+            raise ValueError(
+                "The item embeddings must be a 2D array with one row per item id "
+                f"(got ids of shape {ids.shape} and embeddings of shape {embeddings.shape})."
+            )
+        order = np.argsort(ids, kind="stable")
+        if self._item_embeddings is None:
+            with tf.init_scope():
+                self._item_ids = tf.Variable(
+                    ids, trainable=False, dtype=tf.int64, name="hard_negatives_item_ids"
+                )
+                self._item_embeddings = tf.Variable(
+                    embeddings,
+                    trainable=False,
+                    dtype=tf.float32,
+                    name="hard_negatives_item_embeddings",
+                )
+                # Sorted item ids and their positions, to exclude the positive items
+                self._sorted_item_ids = tf.Variable(
+                    ids[order], trainable=False, dtype=tf.int64, name="hard_negatives_sorted_ids"
+                )
+                self._item_ids_order = tf.Variable(
+                    order, trainable=False, dtype=tf.int64, name="hard_negatives_ids_order"
+                )
+            self._top_k_index = TopKIndexBlock(
+                min(self.num_hard_negatives, len(ids)),
+                values=self._item_embeddings,
+                block_size=self.block_size,
+            )
+        else:
+            if embeddings.shape != tuple(self._item_embeddings.shape):
+                raise ValueError(
+                    f"The shape of the refreshed item embeddings {embeddings.shape} differs "
+                    f"from the shape of the current ones {tuple(self._item_embeddings.shape)}."
+                )
+            self._item_ids.assign(ids.astype(np.int64))
+            self._item_embeddings.assign(embeddings.astype(np.float32))
+            self._sorted_item_ids.assign(ids[order].astype(np.int64))
+            self._item_ids_order.assign(order.astype(np.int64))
+        self.num_refreshes += 1
+
+    def _check_inputs(self, inputs):
+        assert (
+            self.item_id_feature_name in inputs["metadata"]
+        ), "The 'item_id' metadata feature is required by HardNegativeSampler."
+
+    def add(self, embeddings: tf.Tensor, items_metadata: TabularData, training=True):
+        pass
+
+    def call(
+        self, inputs: TabularData, query_embeddings: tf.Tensor, training=True
+    ) -> EmbeddingWithMetadata:
+        """Returns the hard negatives of the queries of the batch
+
+        Parameters
+        ----------
+        inputs : TabularData
+            Dict with two keys:
+              "embeddings": Items embeddings tensor
+              "metadata": Dict like {"<feature name>": "<feature tensor>"} which contains
+              features that might be relevant for the sampler, including the item ids
+              of the positive items.
+        query_embeddings: tf.Tensor
+            The query embeddings of the batch
+        training : bool, optional
+            Flag indicating if on training mode, by default True
+
+        Returns
+        -------
+        EmbeddingWithMetadata
+            Value object with the sampled item embeddings and item metadata
+        """
+        self._check_inputs(inputs)
+        if not self.is_ready:
+            raise RuntimeError(
+                "The HardNegativeSampler has no items snapshot yet, please call "
+                "`refresh()` or add `refresh_callback()` to the callbacks of `fit()`."
+            )
+
+        return self.sample(query_embeddings, inputs["metadata"][self.item_id_feature_name])
+
+    def sample(  # type: ignore
+        self, query_embeddings: tf.Tensor, positive_item_ids: tf.Tensor
+    ) -> EmbeddingWithMetadata:
+        top_indices = self._top_k(query_embeddings, positive_item_ids)
+        indices, _ = tf.unique(tf.reshape(top_indices, [-1]))
+
+        items_embeddings = tf.gather(self._item_embeddings, indices)
+        items_ids = tf.gather(self._item_ids, indices)
+
+        return EmbeddingWithMetadata(
+            tf.cast(items_embeddings, query_embeddings.dtype),
+            metadata={self.item_id_feature_name: tf.cast(items_ids, positive_item_ids.dtype)},
+        )
+
+    def _top_k(self, query_embeddings: tf.Tensor, positive_item_ids: tf.Tensor) -> tf.Tensor:
+        """Positions of the top-k items (other than the positive one) of each query"""
+        positive_ids = tf.cast(tf.reshape(positive_item_ids, [-1]), self._sorted_item_ids.dtype)
+        sorted_positions = tf.searchsorted(self._sorted_item_ids, positive_ids)
+        sorted_positions = tf.minimum(sorted_positions, tf.size(self._sorted_item_ids) - 1)
+        found = tf.equal(tf.gather(self._sorted_item_ids, sorted_positions), positive_ids)
+        exclude_positions = tf.RaggedTensor.from_value_rowids(
+            tf.boolean_mask(tf.gather(self._item_ids_order, sorted_positions), found),
+            tf.boolean_mask(tf.range(tf.size(positive_ids), dtype=tf.int64), found),
+            nrows=tf.cast(tf.size(positive_ids), tf.int64),
+        )
+        queries = tf.cast(query_embeddings, self._item_embeddings.dtype)
+        _, top_indices = self._top_k_index(queries, exclude_ids=exclude_positions)
+
+        return top_indices
+
+
+class _HardNegativeRefreshCallback(tf.keras.callbacks.Callback):
+    def __init__(self, sampler: HardNegativeSampler):
+        super().__init__()
+        self.sampler = sampler
+        self._steps = 0
+
+    def on_train_begin(self, logs=None):
+        if not self.sampler.is_ready:
+            self.sampler.refresh(asynchronous=False)
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.sampler.apply_refresh()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._steps += 1
+        if self._steps % self.sampler.refresh_every == 0:
+            self.sampler.refresh()
+
+    def on_train_end(self, logs=None):
+        self.sampler.apply_refresh(wait=True)
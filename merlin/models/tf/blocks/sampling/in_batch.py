@@ -44,10 +44,16 @@ class InBatchSampler(ItemSampler):
     ----------
     batch_size : int, optional
         The batch size. If not set it is inferred when the layer is built (first call())
+    cross_replica : bool, optional
+        When training with a `tf.distribute` strategy, gathers the item embeddings and
+        metadata of the batches of all replicas, so that the number of negatives scales
+        with the number of replicas. The gradients only flow to the items of the local batch.
+        By default False
     """
 
-    def __init__(self, batch_size: Optional[int] = None, **kwargs):
+    def __init__(self, batch_size: Optional[int] = None, cross_replica: bool = False, **kwargs):
         super().__init__(max_num_samples=batch_size, **kwargs)
+        self.cross_replica = cross_replica
         self._last_batch_items_embeddings: tf.Tensor = None  # type: ignore
         self._last_batch_items_metadata: TabularData = {}
         self.set_batch_size(batch_size)
@@ -98,8 +104,36 @@ class InBatchSampler(ItemSampler):
 
     def add(self, inputs: TabularData, training=True) -> None:  # type: ignore
         self._check_inputs_batch_sizes(inputs)
-        self._last_batch_items_embeddings = inputs["embeddings"]
-        self._last_batch_items_metadata = inputs["metadata"]
+        items_embeddings, items_metadata = inputs["embeddings"], inputs["metadata"]
+        if self.cross_replica:
+            items_embeddings, items_metadata = self._gather_replicas(
+                items_embeddings, items_metadata
+            )
+        self._last_batch_items_embeddings = items_embeddings
+        self._last_batch_items_metadata = items_metadata
+
+    def _gather_replicas(self, items_embeddings: tf.Tensor, items_metadata: TabularData):
+        """Gathers the items of the batches of all replicas (in the replicas order),
+        keeping the gradients only for the items of the local batch"""
+        context = tf.distribute.get_replica_context()
+        if context is None or context.num_replicas_in_sync == 1:
+            return items_embeddings, items_metadata
+
+        batch_size = tf.shape(items_embeddings)[:1]
+        batch_sizes = context.all_gather(batch_size, axis=0)
+        start = tf.reduce_sum(batch_sizes[: context.replica_id_in_sync_group])
+        end = start + batch_size[0]
+
+        all_embeddings = tf.stop_gradient(context.all_gather(items_embeddings, axis=0))
+        all_embeddings = tf.concat(
+            [all_embeddings[:start], items_embeddings, all_embeddings[end:]], axis=0
+        )
+        all_metadata = {
+            feat_name: context.all_gather(items_metadata[feat_name], axis=0)
+            for feat_name in items_metadata
+        }
+
+        return all_embeddings, all_metadata
 
     def sample(self) -> EmbeddingWithMetadata:
         return EmbeddingWithMetadata(
@@ -13,7 +13,7 @@
 # limitations under the License.
 #
 
-from typing import List
+from typing import List, Optional, Union
 
 import tensorflow as tf
 from tensorflow.python.layers.base import Layer
@@ -46,6 +46,20 @@ class FIFOQueue(Layer):
             P.s. It is important that for categorical features the storage Variable is not
             initialized with a valid categorical value (e.g. values >= 0), so that `index_of()`
             works properly
+        storage_dtype : Union[tf.DType, str], optional
+            For queues of floats, the dtype used to store the examples, which are converted
+            back to `dtype` when read. It can be tf.float16 or tf.bfloat16 (half the memory
+            of tf.float32) or tf.int8 (a quarter of the memory), in which case each example
+            is quantized with its own scale (the max absolute value / 127).
+            By default None, which stores the examples with `dtype`
+        index_values : bool, optional
+            For queues of int scalars, whether to keep a hash table mapping each value
+            to its index in the storage up-to-date with the queue operations, so that
+            `index_of()` scales with the number of searched ids instead of the queue
+            capacity, by default True.
+            P.s. The hash table only has CPU kernels, so on GPU the queue operations
+            copy the values to the host. With `index_values=False` the queue stays on
+            the device and `index_of()` compares the ids with the whole storage.
     """
 
     def __init__(
@@ -55,9 +69,20 @@ class FIFOQueue(Layer):
         dims: List[int] = [],
         queue_name: str = "",
         initialize_tensor: tf.Tensor = None,
+        storage_dtype: Optional[Union[tf.DType, str]] = None,
+        index_values: bool = True,
         **kwargs,
     ):
         assert capacity > 0
+        storage_dtype = tf.as_dtype(storage_dtype) if storage_dtype is not None else dtype
+        if storage_dtype != dtype and (
+            not dtype.is_floating
+            or storage_dtype not in [tf.float16, tf.bfloat16, tf.float32, tf.int8]
+        ):
+            raise ValueError(
+                f"Storing a {dtype.name} queue as {storage_dtype.name} is not supported, "
+                "the storage dtype of float queues can be float16, bfloat16, float32 or int8."
+            )
 
         super(FIFOQueue, self).__init__(**kwargs)
         self.capacity = capacity
@@ -65,6 +90,7 @@ class FIFOQueue(Layer):
         self.dims = dims
         self.queue_name = queue_name
         self.initialize_tensor = initialize_tensor
+        self.storage_dtype = storage_dtype
 
         self.first_pointer = tf.Variable(
             initial_value=tf.Variable(lambda: tf.zeros((), dtype=tf.int32)),
@@ -90,14 +116,35 @@ class FIFOQueue(Layer):
                 lambda: tf.zeros([capacity] + self.dims, dtype=dtype) - 1
             )
 
+        initialize_tensor, initialize_scales = self._encode(tf.convert_to_tensor(initialize_tensor))
         self.storage = tf.Variable(
             initial_value=initialize_tensor,
             name=f"{self.queue_name}/fifo_queue_storage",
             trainable=False,
             synchronization=tf.VariableSynchronization.NONE,
             shape=tf.TensorShape([self.capacity] + self.dims),
-            dtype=self.queue_dtype,
+            dtype=self.storage_dtype,
         )
+        # Quantization scales of the examples stored as int8
+        self.scales = None
+        if initialize_scales is not None:
+            self.scales = tf.Variable(
+                initial_value=initialize_scales,
+                name=f"{self.queue_name}/fifo_queue_scales",
+                trainable=False,
+                synchronization=tf.VariableSynchronization.NONE,
+                shape=tf.TensorShape([self.capacity]),
+                dtype=tf.float32,
+            )
+
+        self._index = None
+        if index_values and self.queue_dtype.is_integer and self.dims == []:
+            self._index = tf.lookup.experimental.MutableHashTable(
+                key_dtype=tf.int64,
+                value_dtype=tf.int64,
+                default_value=-1,
+                name=f"{self.queue_name}/fifo_queue_index",
+            )
 
     def enqueue(self, val: tf.Tensor) -> None:
         """Enqueues an example into the queue
@@ -111,15 +158,7 @@ class FIFOQueue(Layer):
         assert len(val.shape) == len(self.dims), "The rank of val and self.dims should match"
         assert list(val.shape) == self.dims, "The shape of val and self.dims should match"
 
-        self.storage[self.next_available_pointer].assign(val)
-
-        self.next_available_pointer.assign_add(1)
-        if self.next_available_pointer >= self.capacity:
-            self.next_available_pointer.assign(0)
-
-        if self.at_full_capacity or self.next_available_pointer == self.first_pointer:
-            self.first_pointer.assign(self.next_available_pointer)
-            self.at_full_capacity.assign(True)
+        self._enqueue(tf.expand_dims(val, 0))
 
     def _check_input_values(self, values):
         assert len(tf.shape(values)) == len(self.dims) + 1, (
@@ -145,33 +184,25 @@ class FIFOQueue(Layer):
         self._check_input_values(vals)
 
         # if values are larger than the queue capacity N, enqueueing only the last N items
-        vals = vals[-self.capacity :]
-        num_vals = int(tf.shape(vals)[0])
-
-        next_pos_start = self.next_available_pointer
-        next_pos_end = next_pos_start + num_vals
-        if next_pos_end < self.capacity:
-            self.storage[next_pos_start:next_pos_end].assign(vals)
-
-            if self.at_full_capacity or (
-                next_pos_start < self.first_pointer and next_pos_end >= self.first_pointer
-            ):
-                self.first_pointer.assign(next_pos_end)
-                self.at_full_capacity.assign(True)
-        else:
-            num_overplus_items = next_pos_end - self.capacity
-            next_pos_end = self.capacity
-            self.storage[next_pos_start:next_pos_end].assign(vals[: num_vals - num_overplus_items])
-
-            next_pos_start = 0
-            next_pos_end = num_overplus_items
-            self.storage[next_pos_start:next_pos_end].assign(vals[num_vals - num_overplus_items :])
-
-            if self.at_full_capacity or next_pos_end >= self.first_pointer:
-                self.first_pointer.assign(next_pos_end)
-                self.at_full_capacity.assign(True)
-
-        self.next_available_pointer.assign(next_pos_end)
+        self._enqueue(vals[-self.capacity :])
+
+    def _enqueue(self, vals: tf.Tensor) -> None:
+        # The examples are written with a single scatter in the slots following
+        # the next available pointer, wrapping around the end of the storage
+        num_vals = tf.shape(vals)[0]
+        count = self.count()
+        slots = self._slots(self.next_available_pointer, num_vals)
+
+        self._remove_from_index(slots)
+        self._write(slots, vals)
+        self._add_to_index(slots, vals)
+
+        next_pointer = tf.math.floormod(self.next_available_pointer + num_vals, self.capacity)
+        at_full_capacity = count + num_vals >= self.capacity
+        # When at full capacity the oldest examples were overwritten
+        self.first_pointer.assign(tf.where(at_full_capacity, next_pointer, self.first_pointer))
+        self.next_available_pointer.assign(next_pointer)
+        self.at_full_capacity.assign(at_full_capacity)
 
     def dequeue(self) -> tf.Tensor:
         """Dequeues a single example from the queue
@@ -186,14 +217,9 @@ class FIFOQueue(Layer):
         IndexError
             The queue is empty
         """
-        if self.first_pointer == self.next_available_pointer:
-            raise IndexError("The queue is empty")
-        self.at_full_capacity.assign(False)
-        val = self.storage[self.first_pointer]
-        self.first_pointer.assign_add(1)
-        if self.first_pointer >= self.capacity:
-            self.first_pointer.assign(0)
-        return val
+        self._check_not_empty()
+
+        return self._dequeue(1)[0]
 
     def dequeue_many(self, n: int) -> tf.Tensor:
         """Dequeues many examples from the queue
@@ -215,33 +241,34 @@ class FIFOQueue(Layer):
         ValueError
             The number of elements to dequeue must be greater than 0
         """
-        if self.first_pointer == self.next_available_pointer:
-            raise IndexError("The queue is empty")
+        self._check_not_empty()
         if n <= 0:
             raise ValueError("The number of elements to dequeue must be greater than 0.")
-        self.at_full_capacity.assign(False)
-        next_pos_start = self.first_pointer
-        next_pos_end = next_pos_start + n
 
-        if self.next_available_pointer > self.first_pointer:
-            next_pos_end = min(next_pos_end, self.next_available_pointer)
+        return self._dequeue(n)
 
-        if next_pos_end < self.capacity:
-            vals = self.storage[next_pos_start:next_pos_end]
-        else:
-            num_missing_items = next_pos_end - self.capacity
-            next_pos_end = self.capacity
-            vals1 = self.storage[next_pos_start:next_pos_end]
+    def _dequeue(self, n) -> tf.Tensor:
+        num_vals = tf.minimum(tf.cast(n, tf.int32), self.count())
+        slots = self._slots(self.first_pointer, num_vals)
+        vals = self._read(slots)
 
-            next_pos_start = 0
-            next_pos_end = min(num_missing_items, self.next_available_pointer)
-            vals2 = self.storage[next_pos_start:next_pos_end]
-
-            vals = tf.concat([vals1, vals2], axis=0)
+        self._remove_from_index(slots)
+        self.first_pointer.assign(tf.math.floormod(self.first_pointer + num_vals, self.capacity))
+        self.at_full_capacity.assign(False)
 
-        self.first_pointer.assign(next_pos_end)
         return vals
 
+    def _check_not_empty(self) -> None:
+        if tf.executing_eagerly():
+            if self.count() == 0:
+                raise IndexError("The queue is empty")
+        else:
+            tf.debugging.assert_positive(self.count(), message="The queue is empty")
+
+    def _slots(self, start: tf.Tensor, num_vals: tf.Tensor) -> tf.Tensor:
+        """Returns the `num_vals` indices of the storage from `start`, wrapping around"""
+        return tf.math.floormod(start + tf.range(num_vals), self.capacity)
+
     def list_all(self) -> tf.Tensor:
         """Returns all items in the queue, sorted by the
         order they were added (FIFO)
@@ -251,38 +278,30 @@ class FIFOQueue(Layer):
         tf.Tensor
             Returns a tensor with all examples added to the queue
         """
-        if self.first_pointer < self.next_available_pointer:
-            return self.storage[self.first_pointer : self.next_available_pointer]
-        elif self.first_pointer == self.next_available_pointer and not self.at_full_capacity:
-            return self.storage[0:0]  # Returns empty Tensor when queue is empty
-        else:
-            return tf.concat(
-                [self.storage[self.first_pointer :], self.storage[: self.next_available_pointer]],
-                axis=0,
-            )
+        return self._read(self._slots(self.first_pointer, self.count()))
 
-    def count(self) -> int:
+    def count(self) -> tf.Tensor:
         """Returns the number of examples added to the queue
 
         Returns
         -------
-        int
+        tf.Tensor
             The number of examples added to the queue
         """
-        if self.first_pointer < self.next_available_pointer:
-            return self.next_available_pointer - self.first_pointer
-        elif self.at_full_capacity:
-            return self.capacity
-        elif self.first_pointer == self.next_available_pointer:
-            return 0
-        else:
-            return self.capacity - self.first_pointer + self.next_available_pointer
+        return tf.where(
+            self.at_full_capacity,
+            self.capacity,
+            tf.math.floormod(self.next_available_pointer - self.first_pointer, self.capacity),
+        )
 
     def clear(self) -> None:
         """Removes all examples from the queue"""
         self.first_pointer.assign(0)
         self.next_available_pointer.assign(0)
         self.at_full_capacity.assign(False)
+        if self._index is not None:
+            keys, _ = self._index.export()
+            self._index.remove(keys)
 
     def index_of(self, ids: tf.Tensor) -> tf.Tensor:
         """Retrieves the indices of the input ids if they exist in the queue,
@@ -297,7 +316,8 @@ class FIFOQueue(Layer):
         -------
         tf.Tensor
             1D tensor with the same size of the input ids, containing the indices of the
-            ids in the queue (-1 if not found)
+            ids in the queue (-1 if not found). If an id was added many times to the queue,
+            the index of its last occurrence is returned.
         """
         assert self.queue_dtype in [tf.int8, tf.int16, tf.int32, tf.int64], (
             "The index_of method is only available for queues with an int dtype "
@@ -307,18 +327,44 @@ class FIFOQueue(Layer):
             self.dims == []
         ), "The index_of method is only available for queues of scalars (dims=[])"
 
-        # item_ids_indices = tf.where(tf.equal(ids, self.storage))
-        equal_tensor = tf.cast(tf.equal(self.storage, tf.expand_dims(ids, -1)), tf.int32)
-        # Artificially adding a first zero column so that index 0 is returned if
-        # there is not an equal value (1) row-wise
-        equal_tensor_extended = tf.concat(
-            [tf.zeros(shape=(tf.shape(equal_tensor)[0], 1), dtype=tf.int32), equal_tensor],
-            axis=1,
+        ids = tf.reshape(tf.cast(ids, tf.int64), [-1])
+        if self._index is not None:
+            return tf.reshape(self._index.lookup(ids), [-1])
+
+        # Position of each slot in the FIFO order, -1 for the slots not in the queue
+        positions = tf.math.floormod(tf.range(self.capacity) - self.first_pointer, self.capacity)
+        positions = tf.where(positions < self.count(), positions, -1)
+        matches = tf.equal(tf.cast(self.storage, tf.int64), tf.expand_dims(ids, -1))
+        # Keeping the last occurrence of each id, i.e. the one with the greatest position
+        last_positions = tf.reduce_max(tf.where(matches, positions, -1), axis=1)
+
+        return tf.cast(
+            tf.where(
+                last_positions >= 0,
+                tf.math.floormod(self.first_pointer + last_positions, self.capacity),
+                -1,
+            ),
+            tf.int64,
         )
-        # Subtracting the indices to account for the first collumn added, so that
-        # values not found become -1
-        item_ids_indices = tf.argmax(equal_tensor_extended, axis=1) - 1
-        return item_ids_indices
+
+    def _add_to_index(self, slots: tf.Tensor, vals: tf.Tensor) -> None:
+        if self._index is not None:
+            # The insert order of repeated keys in the hash table is not specified,
+            # so only the last slot of each value is inserted
+            vals, idx = tf.unique(tf.reshape(tf.cast(vals, tf.int64), [-1]))
+            last_occurrences = tf.math.unsorted_segment_max(
+                tf.range(tf.shape(idx)[0]), idx, tf.shape(vals)[0]
+            )
+            self._index.insert(vals, tf.cast(tf.gather(slots, last_occurrences), tf.int64))
+
+    def _remove_from_index(self, slots: tf.Tensor) -> None:
+        """Removes from the index the values stored in `slots`, unless they
+        were added again in another slot of the queue"""
+        if self._index is not None:
+            slots = tf.cast(slots, tf.int64)
+            vals = tf.cast(tf.gather(self.storage, slots), tf.int64)
+            in_slots = tf.equal(tf.reshape(self._index.lookup(vals), [-1]), slots)
+            self._index.remove(tf.boolean_mask(vals, in_slots))
 
     def get_values_by_indices(self, indices: tf.Tensor) -> tf.Tensor:
         """Retrieves values of the queue based on their index
@@ -333,7 +379,7 @@ class FIFOQueue(Layer):
         tf.Tensor
             Values corresponding to the indices
         """
-        result = tf.gather(self.storage, indices)
+        result = self._read(indices)
         return result
 
     def update_by_indices(self, indices: tf.Tensor, values: tf.Tensor) -> None:
@@ -353,4 +399,35 @@ class FIFOQueue(Layer):
             "The number of indices and values should match",
         )
 
-        self.storage.scatter_nd_update(indices, values)
+        slots = tf.reshape(indices, [-1])
+        self._remove_from_index(slots)
+        self._write(slots, values)
+        self._add_to_index(slots, values)
+
+    def _encode(self, vals: tf.Tensor):
+        """Converts the examples to the storage dtype, also returning
+        their quantization scales when stored as int8"""
+        if self.storage_dtype != tf.int8 or self.queue_dtype == tf.int8:
+            return tf.cast(vals, self.storage_dtype), None
+
+        vals = tf.cast(vals, tf.float32)
+        scales = tf.reduce_max(tf.abs(vals), axis=list(range(1, len(self.dims) + 1))) / 127.0
+        scales = tf.where(scales > 0, scales, tf.ones_like(scales))
+        quantized = tf.round(vals / tf.reshape(scales, [-1] + [1] * len(self.dims)))
+
+        return tf.cast(tf.clip_by_value(quantized, -127.0, 127.0), tf.int8), scales
+
+    def _write(self, slots: tf.Tensor, vals: tf.Tensor) -> None:
+        stored, scales = self._encode(vals)
+        indices = tf.expand_dims(slots, -1)
+        self.storage.scatter_nd_update(indices, stored)
+        if self.scales is not None:
+            self.scales.scatter_nd_update(indices, scales)
+
+    def _read(self, slots: tf.Tensor) -> tf.Tensor:
+        vals = tf.gather(self.storage, slots)
+        if self.scales is not None:
+            scales = tf.gather(self.scales, slots)
+            vals = tf.cast(vals, tf.float32) * tf.reshape(scales, [-1] + [1] * len(self.dims))
+
+        return tf.cast(vals, self.queue_dtype)
@@ -0,0 +1,164 @@
+#
+# Copyright (c) 2022, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from typing import Optional
+
+import tensorflow as tf
+
+from merlin.models.tf.metrics import metrics_registry
+from merlin.models.utils.evaluation import BinaryHistogram
+
+
+@metrics_registry.register_with_multiple_names("histogram_auc")
+@tf.keras.utils.register_keras_serializable(package="merlin.models")
+class HistogramAUC(tf.keras.metrics.Metric):
+    """AUC computed from the histograms of the predicted probabilities
+    of the positive and negative examples.
+
+    The state has the same layout as `merlin.models.utils.evaluation.BinaryHistogram`,
+    which `histogram` returns, so it can be merged with the states of other models or of
+    an offline evaluation.
+
+    Parameters
+    ----------
+    num_buckets : int, optional
+        Number of equal-width buckets of the predicted probabilities, by default 1000
+    """
+
+    num_shards = 1
+
+    def __init__(self, num_buckets: int = 1000, name: str = "histogram_auc", **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.num_buckets = num_buckets
+        shape = (self.num_shards, num_buckets)
+        self.positives = self.add_weight("positives", shape, initializer="zeros", dtype=tf.float64)
+        self.negatives = self.add_weight("negatives", shape, initializer="zeros", dtype=tf.float64)
+
+    def update_state(
+        self,
+        y_true: tf.Tensor,
+        y_pred: tf.Tensor,
+        sample_weight: Optional[tf.Tensor] = None,
+        groups: Optional[tf.Tensor] = None,
+    ):
+        y_true = tf.reshape(tf.cast(y_true, tf.float64), (-1,))
+        y_pred = tf.reshape(tf.cast(y_pred, tf.float64), (-1,))
+        weights = tf.ones_like(y_true)
+        if sample_weight is not None:
+            weights = weights * tf.reshape(tf.cast(sample_weight, tf.float64), (-1,))
+
+        buckets = tf.cast(tf.clip_by_value(y_pred, 0.0, 1.0) * self.num_buckets, tf.int64)
+        buckets = tf.minimum(buckets, self.num_buckets - 1)
+        shards = tf.zeros_like(buckets)
+        if groups is not None and self.num_shards > 1:
+            shards = tf.math.floormod(tf.reshape(tf.cast(groups, tf.int64), (-1,)), self.num_shards)
+        indices = tf.stack([shards, buckets], axis=-1)
+        shape = tf.constant([self.num_shards, self.num_buckets], dtype=tf.int64)
+
+        update_positives = self.positives.assign_add(
+            tf.scatter_nd(indices, weights * y_true, shape)
+        )
+        with tf.control_dependencies([update_positives]):
+            return self.negatives.assign_add(
+                tf.scatter_nd(indices, weights * (1.0 - y_true), shape)
+            )
+
+    def result(self):
+        auc, _ = _histogram_auc(
+            tf.reduce_sum(self.positives, axis=0), tf.reduce_sum(self.negatives, axis=0)
+        )
+
+        return tf.cast(auc, tf.float32)
+
+    def reset_state(self):
+        self.positives.assign(tf.zeros_like(self.positives))
+        self.negatives.assign(tf.zeros_like(self.negatives))
+
+    def histogram(self) -> BinaryHistogram:
+        """Returns the current state as a `BinaryHistogram` (without log-loss)"""
+        histogram = BinaryHistogram(self.num_buckets, self.num_shards)
+        histogram.positives += self.positives.numpy()
+        histogram.negatives += self.negatives.numpy()
+
+        return histogram
+
+    def get_config(self):
+        config = super().get_config()
+        config["num_buckets"] = self.num_buckets
+
+        return config
+
+
+@metrics_registry.register_with_multiple_names("gauc", "group_auc")
+@tf.keras.utils.register_keras_serializable(package="merlin.models")
+class GroupAUC(HistogramAUC):
+    """Group AUC (GAUC), the AUC of each group of examples (e.g. each user),
+    averaged weighted by the number of examples of the groups.
+
+    The groups are hashed into `num_shards` shards, with a histogram each, so the memory
+    doesn't depend on the number of groups. It's exact (up to the bucketing) when
+    every group has its own shard, e.g. with integer ids lower than `num_shards`, and
+    otherwise the AUC of the shards approximates the AUC of their groups.
+
+    When used in a prediction task, the groups are read from the `group_feature`
+    input feature.
+
+    Parameters
+    ----------
+    group_feature : str, optional
+        The feature with the group id of each example, by default "user_id"
+    num_shards : int, optional
+        Number of shards of groups, by default 1024
+    num_buckets : int, optional
+        Number of equal-width buckets of the predicted probabilities, by default 100
+    """
+
+    def __init__(
+        self,
+        group_feature: str = "user_id",
+        num_shards: int = 1024,
+        num_buckets: int = 100,
+        name: str = "gauc",
+        **kwargs,
+    ):
+        self.group_feature = group_feature
+        self.num_shards = num_shards
+        super().__init__(num_buckets=num_buckets, name=name, **kwargs)
+
+    def result(self):
+        aucs, weights = _histogram_auc(self.positives, self.negatives)
+        gauc = tf.math.divide_no_nan(tf.reduce_sum(aucs * weights), tf.reduce_sum(weights))
+
+        return tf.cast(gauc, tf.float32)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update(group_feature=self.group_feature, num_shards=self.num_shards)
+
+        return config
+
+
+def _histogram_auc(positives: tf.Tensor, negatives: tf.Tensor):
+    # Same as merlin.models.utils.evaluation.histogram_auc
+    negatives_below = tf.cumsum(negatives, axis=-1, exclusive=True)
+    area = tf.reduce_sum(positives * (negatives_below + 0.5 * negatives), axis=-1)
+    num_positives = tf.reduce_sum(positives, axis=-1)
+    num_negatives = tf.reduce_sum(negatives, axis=-1)
+    pairs = num_positives * num_negatives
+
+    aucs = tf.math.divide_no_nan(area, pairs)
+    weights = tf.where(pairs > 0, num_positives + num_negatives, tf.zeros_like(pairs))
+
+    return aucs, weights
@@ -15,7 +15,7 @@
 #
 
 # Adapted from source code: https://github.com/karlhigley/ranking-metrics-torch
-from typing import List, Optional, Sequence
+from typing import List, Optional, Sequence, Union
 
 import tensorflow as tf
 from keras.utils import losses_utils, metrics_utils
@@ -25,7 +25,7 @@ from tensorflow.keras.metrics import Mean
 from tensorflow.keras.metrics import get as get_metric
 
 from merlin.models.tf.metrics import metrics_registry
-from merlin.models.tf.utils.tf_utils import extract_topk
+from merlin.models.tf.utils.tf_utils import extract_topk, extract_topk_ragged, is_relevant_ids
 
 METRIC_PARAMETERS_DOCSTRING = """
     y_true : tf.Tensor
@@ -43,6 +43,10 @@ METRIC_PARAMETERS_DOCSTRING = """
         the label_relevant_counts will contain the total relevant counts per example.
     k : int
         The cut-off for ranking metrics
+
+    The metric classes also accept `y_true` as the relevant item ids of each example
+    (a `tf.RaggedTensor` or `tf.SparseTensor`) with `pre_sorted=False`, where the
+    columns of `y_pred` are the item ids.
 """
 
 
@@ -96,7 +100,8 @@ def average_precision_at(
     {METRIC_PARAMETERS_DOCSTRING}
     """
     # Computing the precision from 1 to k range
-    precisions = tf.stack([precision_at(y_true, y_pred, k=_k) for _k in range(1, k + 1)], axis=-1)
+    positions = tf.cast(tf.range(1, tf.shape(y_true[:, :k])[-1] + 1), y_true.dtype)
+    precisions = tf.cumsum(y_true[:, :k], axis=-1) / positions
     # Keeping only the precision at the position of relevant items
     rel_precisions = precisions * y_true[:, :k]
 
@@ -130,7 +135,11 @@ def dcg_at(
     discount_log_base = tf.math.log(tf.convert_to_tensor([log_base], dtype=backend.floatx()))
 
     discounts = 1 / (tf.math.log(discount_positions + 2) / discount_log_base)
-    m = y_true[:, :k] * tf.repeat(tf.expand_dims(discounts[:k], 0), tf.shape(y_true)[0], axis=0)
+    # y_true can have fewer columns than k
+    num_columns = tf.shape(y_true[:, :k])[-1]
+    m = y_true[:, :k] * tf.repeat(
+        tf.expand_dims(discounts[:num_columns], 0), tf.shape(y_true)[0], axis=0
+    )
 
     results = tf.cast(tf.reduce_sum(m, axis=-1), backend.floatx())
     return results
@@ -184,6 +193,16 @@ def mrr_at(
     return results
 
 
+def _extract_topk_relevant_ids(k, y_pred, relevant_ids, pre_sorted):
+    if pre_sorted:
+        raise ValueError(
+            "Labels given as the relevant item ids require pre_sorted=False, "
+            "as the top-k item ids are extracted from the prediction scores."
+        )
+
+    return extract_topk_ragged(k, y_pred, relevant_ids)
+
+
 @tf.keras.utils.register_keras_serializable(package="merlin.models")
 class RankingMetric(Mean):
     def __init__(self, fn, k=5, pre_sorted=True, name=None, dtype=None, **kwargs):
@@ -202,18 +221,23 @@ class RankingMetric(Mean):
         label_relevant_counts: Optional[tf.Tensor] = None,
         sample_weight: Optional[tf.Tensor] = None,
     ):
-        y_true, y_pred = self.check_cast_inputs(y_true, y_pred)
-        [
-            y_true,
-            y_pred,
-        ], sample_weight = metrics_utils.ragged_assert_compatible_and_get_flat_values(
-            [y_true, y_pred], sample_weight
-        )
-        y_pred, y_true = losses_utils.squeeze_or_expand_dimensions(y_pred, y_true)
-
-        y_pred, y_true, label_relevant_counts = self._maybe_sort_top_k(
-            y_pred, y_true, label_relevant_counts
-        )
+        if is_relevant_ids(y_true):
+            y_pred, y_true, label_relevant_counts = _extract_topk_relevant_ids(
+                self.k, tf.cast(y_pred, self._dtype), y_true, self.pre_sorted
+            )
+        else:
+            y_true, y_pred = self.check_cast_inputs(y_true, y_pred)
+            [
+                y_true,
+                y_pred,
+            ], sample_weight = metrics_utils.ragged_assert_compatible_and_get_flat_values(
+                [y_true, y_pred], sample_weight
+            )
+            y_pred, y_true = losses_utils.squeeze_or_expand_dimensions(y_pred, y_true)
+
+            y_pred, y_true, label_relevant_counts = self._maybe_sort_top_k(
+                y_pred, y_true, label_relevant_counts
+            )
 
         ag_fn = tf.__internal__.autograph.tf_convert(
             self._fn, tf.__internal__.autograph.control_status_ctx()
@@ -305,7 +329,179 @@ class NDCGAt(RankingMetric):
         super().__init__(ndcg_at, k=k, pre_sorted=pre_sorted, name=name)
 
 
-def ranking_metrics(top_ks: Sequence[int], **kwargs) -> Sequence[RankingMetric]:
+@tf.keras.utils.register_keras_serializable(package="merlin.models")
+class TopKMetricsBundle(tf.keras.metrics.Metric):
+    """Computes several ranking metrics at several cut-offs in a single pass.
+
+    The predictions are sorted once at the highest k (unless they are `pre_sorted`),
+    and the cumulative hits, DCG gains and first relevant position of the top-k labels
+    are computed once and read at every k. It is equivalent to
+    `ranking_metrics(top_ks)`, without calling `top_k` and repeating the computation
+    for every metric and k.
+
+    The MRR at k is cut at k: unlike `MRRAt(k, pre_sorted=True)`, which reads the first
+    relevant item among all the columns of the pre-sorted labels, it is 0 when the first
+    relevant item is below k (as with `MRRAt(k, pre_sorted=False)`).
+
+    Parameters
+    ----------
+    top_ks : Sequence[int]
+        The cut-offs for the ranking metrics
+    metrics : Sequence[str], optional
+        The ranking metrics to compute, among "recall_at", "precision_at", "map_at",
+        "mrr_at" and "ndcg". By default all of them.
+    pre_sorted : bool, optional
+        Whether `y_true` was already sorted by the prediction scores and truncated to the
+        highest k, in which case `label_relevant_counts` must be provided.
+        By default True. With `pre_sorted=False`, `y_true` can also be the relevant
+        item ids of each example (a `tf.RaggedTensor` or `tf.SparseTensor`).
+    log_base : int, optional
+        Base of the log discount of the DCG, by default 2
+    """
+
+    METRICS = ("recall_at", "mrr_at", "ndcg", "map_at", "precision_at")
+
+    def __init__(
+        self,
+        top_ks: Sequence[int] = (10,),
+        metrics: Optional[Sequence[str]] = None,
+        pre_sorted: bool = True,
+        log_base: int = 2,
+        name: str = "top_k_metrics",
+        dtype=None,
+        **kwargs,
+    ):
+        super().__init__(name=name, dtype=dtype, **kwargs)
+        metrics = list(metrics or self.METRICS)
+        unknown = [metric for metric in metrics if metric not in self.METRICS]
+        if unknown:
+            raise ValueError(f"Unknown ranking metrics {unknown}, expected any of {self.METRICS}")
+        self.top_ks = sorted(set(int(k) for k in top_ks))
+        self.ranking_metrics = metrics
+        self.k = self.top_ks[-1]
+        self.pre_sorted = pre_sorted
+        self.log_base = log_base
+
+        self.totals = self.add_weight(
+            "totals", shape=(len(self.ranking_metrics), len(self.top_ks)), initializer="zeros"
+        )
+        self.count = self.add_weight("count", shape=(), initializer="zeros")
+
+    def update_state(
+        self,
+        y_true: tf.Tensor,
+        y_pred: tf.Tensor,
+        label_relevant_counts: Optional[tf.Tensor] = None,
+        sample_weight: Optional[tf.Tensor] = None,
+    ):
+        y_pred = tf.cast(y_pred, self._dtype)
+        if is_relevant_ids(y_true):
+            y_pred, y_true, label_relevant_counts = _extract_topk_relevant_ids(
+                self.k, y_pred, y_true, self.pre_sorted
+            )
+        else:
+            y_true = tf.cast(y_true, self._dtype)
+            if not self.pre_sorted:
+                y_pred, y_true, label_relevant_counts = extract_topk(self.k, y_pred, y_true)
+            elif label_relevant_counts is None:
+                raise Exception(
+                    "If y_true was pre-sorted (and truncated to top-k) you must "
+                    "provide label_relevant_counts argument."
+                )
+        label_relevant_counts = tf.cast(label_relevant_counts, self._dtype)
+
+        results = self._compute(y_true[:, : self.k], label_relevant_counts)
+
+        if sample_weight is None:
+            sample_weight = tf.ones_like(label_relevant_counts)
+        sample_weight = tf.reshape(tf.cast(sample_weight, self._dtype), (-1, 1, 1))
+        sample_weight = tf.broadcast_to(sample_weight, (tf.shape(results)[0], 1, 1))
+
+        update_totals = self.totals.assign_add(tf.reduce_sum(results * sample_weight, axis=0))
+        with tf.control_dependencies([update_totals]):
+            return self.count.assign_add(tf.reduce_sum(sample_weight))
+
+    def _compute(self, y_true: tf.Tensor, label_relevant_counts: tf.Tensor) -> tf.Tensor:
+        """Returns the metrics per example, with shape (batch_size, n_metrics, n_ks)"""
+        num_columns = tf.shape(y_true)[-1]
+        ks = tf.constant(self.top_ks, dtype=self._dtype)
+        k_indices = tf.minimum(tf.constant(self.top_ks), num_columns) - 1
+        positions = tf.cast(tf.range(1, num_columns + 1), self._dtype)
+
+        def at_ks(cumulative):
+            return tf.gather(cumulative, k_indices, axis=-1)
+
+        hits = tf.cumsum(y_true, axis=-1)
+        hits_at_ks = at_ks(hits)
+        # Number of relevant items that can be retrieved at each k
+        relevant_at_ks = tf.minimum(tf.maximum(tf.expand_dims(label_relevant_counts, -1), 1.0), ks)
+
+        results = {}
+        results["recall_at"] = tf.math.divide_no_nan(hits_at_ks, relevant_at_ks)
+        # Like `precision_at`, averaged over the columns when there are fewer than k
+        results["precision_at"] = hits_at_ks / tf.minimum(ks, tf.cast(num_columns, self._dtype))
+        results["map_at"] = tf.math.divide_no_nan(
+            at_ks(tf.cumsum(hits / positions * y_true, axis=-1)), relevant_at_ks
+        )
+
+        first_hit = tf.argmax(tf.cast(y_true > 0, tf.int32), axis=-1, output_type=tf.int32)
+        has_hit = tf.reduce_any(y_true > 0, axis=-1)
+        first_hit = tf.expand_dims(tf.where(has_hit, first_hit, num_columns), -1)
+        results["mrr_at"] = tf.where(
+            first_hit <= tf.expand_dims(k_indices, 0),
+            1.0 / tf.cast(first_hit + 1, self._dtype),
+            tf.zeros_like(hits_at_ks),
+        )
+
+        log_base = tf.math.log(tf.cast(self.log_base, self._dtype))
+        discounts = log_base / tf.math.log(tf.cast(tf.range(1, self.k + 1), self._dtype) + 1)
+        gains = at_ks(tf.cumsum(y_true * discounts[:num_columns], axis=-1))
+        # Like `ndcg_at`, the ideal DCG at k sums the discounts of the first
+        # min(relevant, k) positions, even when there are fewer than k columns
+        ideal_gains = tf.gather(
+            tf.concat([[0.0], tf.cumsum(discounts)], axis=0),
+            tf.cast(relevant_at_ks, tf.int32)
+            * tf.cast(tf.expand_dims(label_relevant_counts, -1) > 0, tf.int32),
+        )
+        results["ndcg"] = tf.math.divide_no_nan(gains, ideal_gains)
+
+        return tf.stack([results[metric] for metric in self.ranking_metrics], axis=1)
+
+    def result(self):
+        results = tf.math.divide_no_nan(self.totals, self.count)
+
+        return {
+            f"{metric}_{k}": results[i, j]
+            for i, metric in enumerate(self.ranking_metrics)
+            for j, k in enumerate(self.top_ks)
+        }
+
+    def reset_state(self):
+        self.totals.assign(tf.zeros_like(self.totals))
+        self.count.assign(0.0)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update(
+            top_ks=self.top_ks,
+            metrics=self.ranking_metrics,
+            pre_sorted=self.pre_sorted,
+            log_base=self.log_base,
+        )
+
+        return config
+
+
+def ranking_metrics(
+    top_ks: Sequence[int], fused: bool = False, **kwargs
+) -> Sequence[Union[RankingMetric, TopKMetricsBundle]]:
+    """Recall, MRR, NDCG, MAP and precision at each of the `top_ks`.
+
+    With `fused=True` a single `TopKMetricsBundle` computes all of them in one pass,
+    reporting the same metric names.
+    """
+    if fused:
+        return [TopKMetricsBundle(top_ks, **kwargs)]
     metrics: List[RankingMetric] = []
     for k in top_ks:
         metrics.extend([RecallAt(k), MRRAt(k), NDCGAt(k), AvgPrecisionAt(k), PrecisionAt(k)])
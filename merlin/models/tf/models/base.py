@@ -1,34 +1,94 @@
 from collections import Sequence as SequenceCollection
-from typing import Dict, List, Optional, Protocol, Union, runtime_checkable
+from typing import TYPE_CHECKING, Dict, List, Optional, Protocol, Tuple, Union, runtime_checkable
 
 import tensorflow as tf
 
 import merlin.io
 from merlin.models.tf.blocks.core.base import Block, BlockContext
 from merlin.models.tf.blocks.core.combinators import SequentialBlock
-from merlin.models.tf.metrics.ranking import RankingMetric
-from merlin.models.tf.prediction_tasks.base import ParallelPredictionBlock, PredictionTask
+from merlin.models.tf.metrics.ranking import RankingMetric, TopKMetricsBundle
+from merlin.models.tf.prediction_tasks.base import (
+    AsyncMetricsUpdater,
+    ParallelPredictionBlock,
+    PredictionTask,
+)
 from merlin.models.tf.typing import TabularData
 from merlin.models.tf.utils.mixins import LossMixin, MetricsMixin, ModelLikeBlock
 from merlin.models.utils.dataset import unique_rows_by_features
 from merlin.schema import Schema, Tags
 
+if TYPE_CHECKING:
+    from merlin.models.tf.blocks.retrieval.cache import QueryEmbeddingCache
+    from merlin.models.tf.utils.batch_utils import InferenceStats
+
 
 class MetricsComputeCallback(tf.keras.callbacks.Callback):
-    def __init__(self, train_metrics_steps=1, **kwargs):
+    """Controls when the metrics are computed during training.
+
+    Parameters
+    ----------
+    train_metrics_steps : int, optional
+        Computes the train metrics every `train_metrics_steps` steps, by default 1
+    asynchronous : bool, optional
+        Whether the train metrics are computed in a background thread from a copy of the
+        predictions and targets, so they don't block the training steps. Their final values
+        are reported at the end of each epoch. By default False
+    """
+
+    def __init__(self, train_metrics_steps=1, asynchronous=False, **kwargs):
         self.train_metrics_steps = train_metrics_steps
+        self.asynchronous = asynchronous
+        self.async_metrics = AsyncMetricsUpdater() if asynchronous else None
+        self._train_logs = None
         self._is_fitting = False
         self._is_first_batch = True
         super().__init__(**kwargs)
 
     def on_train_begin(self, logs=None):
         self._is_fitting = True
+        traced_async_metrics = getattr(self.model, "_async_metrics_updater", None)
+        if self.asynchronous:
+            # The traced train step enqueues the outputs into the updater it was traced with,
+            # so the updater of the previous asynchronous fit is reused
+            self.async_metrics = traced_async_metrics or self.async_metrics
+            self.async_metrics.start()
+        if traced_async_metrics is not self.async_metrics:
+            # The train step was traced with synchronous metrics or another updater
+            self.model._async_metrics_updater = self.async_metrics
+            self.model.train_function = self.model.make_train_function(force=True)
+        self._set_async_metrics(self.async_metrics)
 
     def on_train_end(self, logs=None):
         self._is_fitting = False
+        self._set_async_metrics(None)
+        if self.asynchronous:
+            self.async_metrics.stop()
 
     def on_epoch_begin(self, epoch, logs=None):
         self._is_first_batch = True
+        self._train_logs = None
+
+    def on_epoch_end(self, epoch, logs=None):
+        if self.asynchronous and logs is not None:
+            if self._train_logs is None:
+                self._train_logs = self._wait_for_train_metrics()
+            logs.update(self._train_logs)
+
+    def _wait_for_train_metrics(self):
+        self.async_metrics.wait()
+
+        return {
+            name: float(value) for name, value in self.model.loss_block.metric_result_dict().items()
+        }
+
+    def _set_async_metrics(self, async_metrics):
+        loss_block = self.model.loss_block
+        if isinstance(loss_block, PredictionTask):
+            tasks = [loss_block]
+        else:
+            tasks = list(getattr(loss_block, "prediction_task_dict", {}).values())
+        for task in tasks:
+            task._async_metrics = async_metrics
 
     def on_train_batch_begin(self, batch, logs=None):
         value = self.train_metrics_steps > 0 and (
@@ -41,9 +101,15 @@ class MetricsComputeCallback(tf.keras.callbacks.Callback):
 
     def on_test_begin(self, logs=None):
         self.model._should_compute_eval_metrics_as_in_training.assign(self._is_fitting)
+        if self.asynchronous and self._is_fitting:
+            # The validation resets the metrics, so the train metrics are collected before
+            self._train_logs = self._wait_for_train_metrics()
+            self._set_async_metrics(None)
 
     def on_test_end(self, logs=None):
         self.model._should_compute_eval_metrics_as_in_training.assign(False)
+        if self.asynchronous and self._is_fitting:
+            self._set_async_metrics(self.async_metrics)
 
 
 @tf.keras.utils.register_keras_serializable(package="merlin_models")
@@ -326,6 +392,7 @@ class Model(tf.keras.Model, LossMixin, MetricsMixin):
         workers=1,
         use_multiprocessing=False,
         train_metrics_steps=1,
+        async_train_metrics=False,
         **kwargs,
     ):
         # Check if merlin-dataset is passed
@@ -346,7 +413,7 @@ class Model(tf.keras.Model, LossMixin, MetricsMixin):
                 validation_data, batch_size=batch_size, shuffle=False, **kwargs
             )
 
-        callbacks = self._add_metrics_callback(callbacks, train_metrics_steps)
+        callbacks = self._add_metrics_callback(callbacks, train_metrics_steps, async_train_metrics)
 
         return super().fit(
             x,
@@ -370,7 +437,7 @@ class Model(tf.keras.Model, LossMixin, MetricsMixin):
             use_multiprocessing,
         )
 
-    def _add_metrics_callback(self, callbacks, train_metrics_steps):
+    def _add_metrics_callback(self, callbacks, train_metrics_steps, async_train_metrics=False):
         if callbacks is None:
             callbacks = []
 
@@ -382,7 +449,7 @@ class Model(tf.keras.Model, LossMixin, MetricsMixin):
         callback_types = [type(callback) for callback in callbacks]
         if MetricsComputeCallback not in callback_types:
             # Adding a callback to control metrics computation
-            callbacks.append(MetricsComputeCallback(train_metrics_steps))
+            callbacks.append(MetricsComputeCallback(train_metrics_steps, async_train_metrics))
 
         return callbacks
 
@@ -433,8 +500,16 @@ class Model(tf.keras.Model, LossMixin, MetricsMixin):
         )
 
     def batch_predict(
-        self, dataset: merlin.io.Dataset, batch_size: int, **kwargs
-    ) -> merlin.io.Dataset:
+        self,
+        dataset: merlin.io.Dataset,
+        batch_size: int,
+        output_path: Optional[str] = None,
+        output_columns: Optional[List[str]] = None,
+        resume: bool = False,
+        pipelined: bool = False,
+        return_stats: bool = False,
+        **kwargs,
+    ) -> Union[merlin.io.Dataset, Tuple[merlin.io.Dataset, "InferenceStats"]]:
         """Batched prediction using the Dask.
         Parameters
         ----------
@@ -442,8 +517,27 @@ class Model(tf.keras.Model, LossMixin, MetricsMixin):
             Dataset to predict on.
         batch_size: int
             Batch size to use for prediction.
+        output_path: Optional[str]
+            If set, the predictions are streamed to Parquet files in this directory
+            (one file per partition, one row group per batch) instead of being kept
+            in memory, and the returned dataset reads from these files.
+        output_columns: Optional[List[str]]
+            Subset of the input and prediction columns to output.
+            By default all columns are returned.
+        resume: bool
+            Only used with `output_path`. Skip the partitions that were already
+            written by a previous run. Defaults to False.
+        pipelined: bool
+            Run the prediction in this process with `PipelinedModelEncode`, which
+            loads data, runs the model and writes outputs on separate threads.
+            The extra `kwargs` (e.g. `max_batch_size`, `intra_op_parallelism_threads`)
+            are passed to it. Defaults to False.
+        return_stats: bool
+            Only used with `pipelined=True`. Also returns the `InferenceStats`
+            (throughput and per-stage latency) of the run. Defaults to False.
         Returns merlin.io.Dataset
         -------
+            The predictions, and their `InferenceStats` if `return_stats=True`
         """
         if hasattr(dataset, "schema"):
             if not set(self.schema.column_names).issubset(set(dataset.schema.column_names)):
@@ -456,12 +550,47 @@ class Model(tf.keras.Model, LossMixin, MetricsMixin):
         if hasattr(dataset, "to_ddf"):
             dataset = dataset.to_ddf()
 
-        from merlin.models.tf.utils.batch_utils import TFModelEncode
+        from merlin.models.tf.utils.batch_utils import (
+            PipelinedModelEncode,
+            TFModelEncode,
+            encode_to_parquet,
+            select_output_columns,
+            split_output_columns,
+        )
+
+        if pipelined:
+            encoder = PipelinedModelEncode(self, batch_size=batch_size, **kwargs)
+            predictions = encoder.predict(
+                dataset, output_path=output_path, output_columns=output_columns, resume=resume
+            )
+
+            return (predictions, encoder.stats) if return_stats else predictions
+        if return_stats:
+            raise ValueError("`return_stats=True` requires `pipelined=True`.")
 
         model_encode = TFModelEncode(self, batch_size=batch_size, **kwargs)
-        predictions = dataset.map_partitions(model_encode)
 
-        return merlin.io.Dataset(predictions)
+        if output_path:
+            paths = encode_to_parquet(
+                model_encode,
+                dataset,
+                output_path,
+                output_columns=output_columns,
+                resume=resume,
+            )
+
+            return merlin.io.Dataset(paths, engine="parquet")
+
+        filter_input_columns, filter_output_columns = split_output_columns(
+            output_columns, dataset.columns
+        )
+        predictions = dataset.map_partitions(
+            model_encode,
+            filter_input_columns=filter_input_columns,
+            filter_output_columns=filter_output_columns,
+        )
+
+        return merlin.io.Dataset(select_output_columns(predictions, output_columns))
 
     @classmethod
     def from_config(cls, config, custom_objects=None):
@@ -498,6 +627,7 @@ class RetrievalModel(Model):
             raise ValueError("Model must contain a `RetrievalBlock`.")
 
         self.evaluation_candidates = evaluation_candidates
+        self._num_weights_loads = 0
 
     @property
     def retrieval_block(self) -> RetrievalBlock:
@@ -579,7 +709,11 @@ class RetrievalModel(Model):
         self.evaluation_candidates = unique_rows_by_features(candidates, Tags.ITEM, Tags.ITEM_ID)
 
         ranking_metrics = list(
-            [metric for metric in self.loss_block.eval_metrics if isinstance(metric, RankingMetric)]
+            [
+                metric
+                for metric in self.loss_block.eval_metrics
+                if isinstance(metric, (RankingMetric, TopKMetricsBundle))
+            ]
         )
         self._k = tf.reduce_max([metric.k for metric in ranking_metrics])
 
@@ -608,7 +742,13 @@ class RetrievalModel(Model):
 
         return self
 
-    def to_top_k_recommender(self, data: merlin.io.Dataset, k: int, **kwargs) -> ModelBlock:
+    def to_top_k_recommender(
+        self,
+        data: merlin.io.Dataset,
+        k: int,
+        query_cache: Union[bool, "QueryEmbeddingCache", None] = None,
+        **kwargs,
+    ) -> ModelBlock:
         """Convert the model to a Top-k Recommender.
         Parameters
         ----------
@@ -616,6 +756,11 @@ class RetrievalModel(Model):
             Dataset to convert to a Top-k Recommender.
         k: int
             Number of recommendations to make.
+        query_cache: Union[bool, QueryEmbeddingCache], optional
+            Cache the query embeddings by query id (`Tags.USER_ID`), so that
+            the query tower only runs for queries not seen recently.
+            Either a `QueryEmbeddingCache` or `True` to use a default one.
+            The cache is cleared whenever the model weights are updated.
         Returns
         -------
         SequentialBlock
@@ -625,6 +770,122 @@ class RetrievalModel(Model):
         topk_index = ml.TopKIndexBlock.from_block(
             self.retrieval_block.item_block(), data=data, k=k, **kwargs
         )
-        recommender = self.retrieval_block.query_block().connect(topk_index)
+        query_block = self.retrieval_block.query_block()
+        if query_cache is True:
+            query_cache = ml.QueryEmbeddingCache()
+        if query_cache is not None and query_cache is not False:
+            query_block = ml.CachedQueryBlock(
+                query_block, cache=query_cache, version_fn=self._weights_version
+            )
+        recommender = query_block.connect(topk_index)
 
         return ModelBlock(recommender)
+
+    def recommend_all(
+        self,
+        users_dataset: merlin.io.Dataset,
+        items_dataset: Optional[merlin.io.Dataset] = None,
+        k: int = 10,
+        output_path: Optional[str] = None,
+        batch_size: int = 512,
+        index: Optional[Block] = None,
+        block_size: Optional[int] = None,
+        num_workers: int = 1,
+        resume: bool = False,
+        query_tag=Tags.USER,
+        query_id_tag=Tags.USER_ID,
+    ) -> merlin.io.Dataset:
+        """Export the top-k recommendations of all users to Parquet.
+
+        The user embeddings are computed batch by batch and scored against an index
+        of item embeddings built once, so that only `num_workers` partitions
+        of users are in memory at a time.
+
+        Parameters
+        ----------
+        users_dataset: merlin.io.Dataset
+            Dataset with the user features. The rows are deduplicated by user id
+            within each partition (so that the partitions are still processed one at
+            a time), the rows of a user are expected to be in a single partition,
+            e.g. a dataset of unique users or shuffled by user id.
+        items_dataset: merlin.io.Dataset, optional
+            Dataset of unique items used to build a `TopKIndexBlock`.
+            Not needed if `index` is provided.
+        k: int
+            Number of recommendations per user. Defaults to 10.
+        output_path: str
+            Directory where the recommendations are written,
+            one Parquet file per partition of `users_dataset`.
+        batch_size: int
+            Number of users scored at a time. Defaults to 512.
+        index: Block, optional
+            A pre-built index returning the top-k `(scores, ids)` of query embeddings,
+            e.g. a `TopKIndexBlock` or an approximate nearest-neighbours index.
+        block_size: int, optional
+            Number of items scored at a time by the `TopKIndexBlock` built
+            from `items_dataset`, which bounds the memory of the scores.
+        num_workers: int
+            Number of partitions of users processed in parallel. Defaults to 1.
+        resume: bool
+            Skip the partitions that were already written by a previous run.
+        query_tag: Tags
+            Tag of the user features.
+        query_id_tag: Tags
+            Tag of the user id.
+
+        Returns
+        -------
+        merlin.io.Dataset
+            Dataset with the columns: user id, `item_ids` and `scores`
+            (lists of length k, sorted by decreasing score).
+        """
+        if not output_path:
+            raise ValueError("Please provide the `output_path` to write the recommendations to.")
+
+        import merlin.models.tf as ml
+        from merlin.models.tf.utils.batch_utils import recommend_to_parquet
+
+        if index is None:
+            if items_dataset is None:
+                raise ValueError("Either `items_dataset` or `index` must be provided.")
+            index = ml.TopKIndexBlock.from_block(
+                self.retrieval_block.item_block(), data=items_dataset, k=k, block_size=block_size
+            )
+
+        query_block = self.retrieval_block.query_block()
+        id_column = query_block.schema.select_by_tag(query_id_tag).first.name
+        query_columns = users_dataset.schema.select_by_tag(query_tag).column_names
+        ddf = users_dataset.to_ddf()[query_columns].map_partitions(
+            lambda df: df.drop_duplicates(id_column, keep="first")
+        )
+        paths = recommend_to_parquet(
+            query_block,
+            index,
+            ddf,
+            output_path,
+            k=k,
+            id_column=id_column,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            resume=resume,
+        )
+
+        return merlin.io.Dataset(paths, engine="parquet")
+
+    def load_weights(self, *args, **kwargs):
+        self._num_weights_loads += 1
+
+        return super().load_weights(*args, **kwargs)
+
+    def set_weights(self, weights):
+        self._num_weights_loads += 1
+
+        return super().set_weights(weights)
+
+    def _weights_version(self):
+        """Changes every time the model weights are updated, by the optimizer or
+        by loading/setting weights."""
+        optimizer = getattr(self, "optimizer", None)
+        num_steps = int(optimizer.iterations.numpy()) if optimizer is not None else 0
+
+        return num_steps, self._num_weights_loads
@@ -1,8 +1,12 @@
 import abc
+import functools
+import queue
+import threading
 from collections import Sequence as SequenceCollection
 from collections import defaultdict
 from typing import Dict, List, Optional, Sequence, Text, Union
 
+import numpy as np
 import tensorflow as tf
 from tensorflow.keras.layers import Layer
 from tensorflow.python.keras.utils import generic_utils
@@ -19,7 +23,7 @@ from merlin.models.tf.blocks.core.base import (
     name_fn,
 )
 from merlin.models.tf.blocks.core.combinators import ParallelBlock
-from merlin.models.tf.metrics.ranking import RankingMetric
+from merlin.models.tf.metrics.ranking import RankingMetric, TopKMetricsBundle
 from merlin.models.tf.typing import TabularData
 from merlin.models.tf.utils import tf_utils
 from merlin.models.tf.utils.mixins import LossMixin, MetricsMixin
@@ -28,6 +32,96 @@ from merlin.models.utils.schema_utils import tensorflow_metadata_json_to_schema
 from merlin.schema import Schema, Tags
 
 
+class AsyncMetricsUpdater:
+    """Updates the metrics of prediction tasks in a background thread.
+
+    The training step only copies the predictions and targets of the steps that compute
+    metrics to a queue, and a background thread updates the metrics of the task from them,
+    so the computation of the metrics doesn't block the optimizer step. If the queue is full,
+    the step is dropped from the metrics (counted by `num_dropped`) rather than waiting.
+
+    It's used by `MetricsComputeCallback(asynchronous=True)`,
+    i.e. `Model.fit(async_train_metrics=True)`.
+
+    Parameters
+    ----------
+    max_queue_size : int, optional
+        Maximum number of steps waiting for their metrics to be computed, by default 16
+    """
+
+    def __init__(self, max_queue_size: int = 16):
+        self.max_queue_size = max_queue_size
+        self.num_dropped = 0
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._errors: List[BaseException] = []
+
+    def start(self):
+        if self._thread is None:
+            self._queue = queue.Queue(self.max_queue_size)
+            self._thread = threading.Thread(
+                target=self._run, name="merlin-async-metrics", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._queue, self._thread = None, None
+        self._raise_errors()
+
+    def wait(self):
+        """Waits until the metrics of all the enqueued steps are computed"""
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_errors()
+
+    def attach(self, task: "PredictionTask", outputs: PredictionOutput, loss: tf.Tensor):
+        """Enqueues the outputs of a step, returning the loss depending on the copy"""
+        tensors = [outputs.predictions, outputs.targets]
+        if outputs.positive_item_ids is not None:
+            tensors.append(outputs.positive_item_ids)
+        enqueued = tf.numpy_function(functools.partial(self._enqueue, task), tensors, tf.bool)
+
+        with tf.control_dependencies([enqueued]):
+            return tf.identity(loss)
+
+    def _enqueue(self, task, *arrays):
+        if self._queue is None:
+            return np.bool_(False)
+        try:
+            # Copying, as the arrays can share the memory of the step tensors
+            self._queue.put_nowait((task, [np.array(array, copy=True) for array in arrays]))
+        except queue.Full:
+            self.num_dropped += 1
+            return np.bool_(False)
+
+        return np.bool_(True)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                task, arrays = item
+                task.calculate_metrics(
+                    PredictionOutput(*[tf.convert_to_tensor(array) for array in arrays]),
+                    forward=False,
+                    training=True,
+                )
+            except BaseException as e:  # noqa
+                self._errors.append(e)
+            finally:
+                self._queue.task_done()
+
+    def _raise_errors(self):
+        if self._errors:
+            error, self._errors = self._errors[0], []
+            raise error
+
+
 @tf.keras.utils.register_keras_serializable(package="merlin.models")
 class PredictionTask(Layer, LossMixin, MetricsMixin, ContextMixin):
     """Base-class for prediction tasks.
@@ -117,6 +211,13 @@ class PredictionTask(Layer, LossMixin, MetricsMixin, ContextMixin):
     def build_task(self, input_shape, schema: Schema, body: Block, **kwargs):
         return super().build(input_shape)
 
+    def add_features_to_context(self, feature_shapes) -> List[str]:
+        return [
+            metric.group_feature
+            for metric in self.eval_metrics
+            if getattr(metric, "group_feature", None)
+        ]
+
     def _create_metrics(
         self, metrics: Sequence[MetricOrMetricClass]
     ) -> List[tf.keras.metrics.Metric]:
@@ -189,6 +290,10 @@ class PredictionTask(Layer, LossMixin, MetricsMixin, ContextMixin):
     def attach_metrics_calculation_to_loss(
         self, outputs: PredictionOutput, loss: tf.Tensor, training: bool
     ):
+        async_metrics = getattr(self, "_async_metrics", None)
+        if async_metrics is not None and self._supports_async_metrics(outputs):
+            return async_metrics.attach(self, outputs, loss)
+
         update_ops = self.calculate_metrics(outputs, loss=loss, forward=False, training=training)
 
         update_ops = [x for x in update_ops if x is not None]
@@ -196,6 +301,15 @@ class PredictionTask(Layer, LossMixin, MetricsMixin, ContextMixin):
         with tf.control_dependencies(update_ops):
             return tf.identity(loss)
 
+    def _supports_async_metrics(self, outputs: PredictionOutput) -> bool:
+        # The metrics reading features from the context (e.g. GroupAUC) would read the
+        # features of the current step, and ragged targets can't be copied as one array
+        tensors = [outputs.predictions, outputs.targets, outputs.positive_item_ids]
+
+        return not self.add_features_to_context(None) and all(
+            tensor is None or isinstance(tensor, tf.Tensor) for tensor in tensors
+        )
+
     def repr_add(self):
         return [("loss", self.loss)]
 
@@ -235,18 +349,25 @@ class PredictionTask(Layer, LossMixin, MetricsMixin, ContextMixin):
             targets_eval = targets
 
             ranking_metrics = list(
-                [metric for metric in self.eval_metrics if isinstance(metric, RankingMetric)]
+                [
+                    metric
+                    for metric in self.eval_metrics
+                    if isinstance(metric, (RankingMetric, TopKMetricsBundle))
+                ]
             )
 
             if len(ranking_metrics) > 0:
 
-                tf.assert_equal(
-                    tf.shape(targets),
-                    tf.shape(predictions),
-                    f"Predictions ({tf.shape(predictions)}) and targets ({tf.shape(targets)}) "
-                    f"should have the same shape. Check if targets were one-hot encoded "
-                    f"(with LabelToOneHot() block for example).",
-                )
+                if not tf_utils.is_relevant_ids(targets):
+                    tf.assert_equal(
+                        tf.shape(targets),
+                        tf.shape(predictions),
+                        f"Predictions ({tf.shape(predictions)}) and targets "
+                        f"({tf.shape(targets)}) should have the same shape. Check if targets "
+                        f"were one-hot encoded (with LabelToOneHot() block for example), "
+                        f"or give them as the relevant ids of each example "
+                        f"(a tf.RaggedTensor or tf.SparseTensor).",
+                    )
 
                 max_k = tf.reduce_max([metric.k for metric in ranking_metrics])
                 tf.debugging.assert_greater_equal(
@@ -278,20 +399,33 @@ class PredictionTask(Layer, LossMixin, MetricsMixin, ContextMixin):
                         # The label_relevant_counts is necessary because when extracing the labels
                         # from the top-k predictions some relevant items might not be included, but
                         # the relevant count is necessary for many ranking metrics (recall, ndcg)
+                        extract_topk = (
+                            tf_utils.extract_topk_ragged
+                            if tf_utils.is_relevant_ids(targets)
+                            else tf_utils.extract_topk
+                        )
                         (
                             predictions_eval,
                             targets_eval,
                             label_relevant_counts_eval,
-                        ) = tf_utils.extract_topk(max_k, predictions, targets)
+                        ) = extract_topk(max_k, predictions, targets)
 
             for metric in self.eval_metrics:
-                if isinstance(metric, RankingMetric) and metric.pre_sorted:
+                if isinstance(metric, (RankingMetric, TopKMetricsBundle)) and metric.pre_sorted:
                     metric_state = metric.update_state(
                         targets_eval,
                         predictions_eval,
                         label_relevant_counts_eval,
                         sample_weight=sample_weight,
                     )
+                elif getattr(metric, "group_feature", None):
+                    # Metrics by group (e.g. GroupAUC) read the group of each example
+                    metric_state = metric.update_state(
+                        y_true=targets,
+                        y_pred=predictions,
+                        sample_weight=sample_weight,
+                        groups=self.context[metric.group_feature],
+                    )
                 else:
                     metric_state = metric.update_state(
                         y_true=targets, y_pred=predictions, sample_weight=sample_weight
@@ -312,7 +446,15 @@ class PredictionTask(Layer, LossMixin, MetricsMixin, ContextMixin):
         return update_ops
 
     def metric_results(self, mode: str = "val"):
-        return {metric.name: metric.result() for metric in self.metrics}
+        results = {}
+        for metric in self.metrics:
+            result = metric.result()
+            if isinstance(result, dict):
+                results.update(result)
+            else:
+                results[metric.name] = result
+
+        return results
 
     def metric_result_dict(self, mode=None):
         return self.metric_results(mode=mode)
@@ -206,7 +206,11 @@ class MultiClassClassificationTask(PredictionTask):
     def metric_results(self, mode: str = "val"):
         dict_results = {}
         for metric in self.metrics:
-            dict_results.update({metric.name: metric.result()})
+            result = metric.result()
+            if isinstance(result, dict):
+                dict_results.update(result)
+            else:
+                dict_results.update({metric.name: result})
 
         return dict_results
 
@@ -57,6 +57,8 @@ def ItemsPredictionSampled(
     num_sampled: int,
     min_id: int = 0,
     ignore_false_negatives: bool = True,
+    eval_top_k: Optional[int] = None,
+    eval_block_size: Optional[int] = None,
 ):
     """
     Compute the items logits on a subset of sampled candidates to optimize
@@ -77,6 +79,14 @@ def ItemsPredictionSampled(
         ignore_false_negatives: bool
             Ignore sampled items that are equal to the target classes
             Defaults to True
+        eval_top_k: Optional[int]
+            If set, evaluation scores only the target and the top-k other items
+            (retrieved by blocks of `eval_block_size` items) instead of the whole
+            catalog, and the model outputs the query embeddings at inference.
+            Defaults to None
+        eval_block_size: Optional[int]
+            Number of items scored at a time when `eval_top_k` is set.
+            Defaults to None (all items at once)
 
     Returns:
     -------
@@ -98,6 +108,8 @@ def ItemsPredictionSampled(
         samplers=[samplers],
         sampling_downscore_false_negatives=ignore_false_negatives,
         item_id_feature_name=item_id_feature_name,
+        eval_top_k=eval_top_k,
+        eval_block_size=eval_block_size,
     )
 
     return logits
@@ -118,6 +130,8 @@ def NextItemPredictionTask(
     sampled_softmax: bool = False,
     num_sampled: int = 100,
     min_sampled_id: int = 0,
+    eval_top_k: Optional[int] = None,
+    eval_block_size: Optional[int] = None,
 ) -> MultiClassClassificationTask:
     """
     Function to create the NextItemPrediction task with the right parameters.
@@ -166,6 +180,13 @@ def NextItemPredictionTask(
             The minimum id value to be sampled. Useful to ignore the first categorical
             encoded ids, which are usually reserved for <nulls>, out-of-vocabulary or padding.
             Defaults to 0.
+        eval_top_k: Optional[int]
+            When sampled_softmax is enabled, evaluate on the target and the top-k
+            other items only, instead of scoring the whole catalog.
+            Defaults to None
+        eval_block_size: Optional[int]
+            When eval_top_k is set, the number of items scored at a time.
+            Defaults to None
     Returns
     -------
         PredictionTask
@@ -175,7 +196,11 @@ def NextItemPredictionTask(
 
     if sampled_softmax:
         prediction_call = ItemsPredictionSampled(
-            schema, num_sampled=num_sampled, min_id=min_sampled_id
+            schema,
+            num_sampled=num_sampled,
+            min_id=min_sampled_id,
+            eval_top_k=eval_top_k,
+            eval_block_size=eval_block_size,
         )
 
     else:
@@ -19,7 +19,11 @@ import tensorflow as tf
 from tensorflow.python.layers.base import Layer
 
 from merlin.models.tf.blocks.core.base import Block, MetricOrMetrics
-from merlin.models.tf.blocks.core.transformations import L2Norm, LogitsTemperatureScaler
+from merlin.models.tf.blocks.core.transformations import (
+    ItemFrequencyEstimator,
+    L2Norm,
+    LogitsTemperatureScaler,
+)
 from merlin.models.tf.blocks.retrieval.base import ItemRetrievalScorer
 from merlin.models.tf.blocks.sampling.base import ItemSampler
 from merlin.models.tf.blocks.sampling.in_batch import InBatchSampler
@@ -62,6 +66,12 @@ class ItemRetrievalTask(MultiClassClassificationTask):
         normalize: bool
             Apply L2 normalization before computing dot interactions.
             Defaults to True.
+        item_frequency_estimator: Optional[ItemFrequencyEstimator]
+            Streaming estimator of the item sampling probabilities,
+            used for the logQ correction of the logits. Defaults to None.
+        deduplicate_negatives: bool
+            Remove the repeated negative items sampled by the different samplers
+            before scoring them. Defaults to False.
 
     Returns
     -------
@@ -85,10 +95,14 @@ class ItemRetrievalTask(MultiClassClassificationTask):
         logits_temperature: float = 1.0,
         normalize: bool = True,
         cache_query: bool = False,
+        item_frequency_estimator: Optional[ItemFrequencyEstimator] = None,
+        deduplicate_negatives: bool = False,
         **kwargs,
     ):
         self.item_id_feature_name = schema.select_by_tag(Tags.ITEM_ID).column_names[0]
         self.cache_query = cache_query
+        self.item_frequency_estimator = item_frequency_estimator
+        self.deduplicate_negatives = deduplicate_negatives
         pre = self._build_prediction_call(samplers, normalize, logits_temperature, extra_pre_call)
         self.loss = loss_registry.parse(loss)
 
@@ -116,6 +130,8 @@ class ItemRetrievalTask(MultiClassClassificationTask):
             samplers=samplers,
             item_id_feature_name=self.item_id_feature_name,
             cache_query=self.cache_query,
+            item_frequency_estimator=self.item_frequency_estimator,
+            deduplicate_negatives=self.deduplicate_negatives,
         )
 
         if normalize:
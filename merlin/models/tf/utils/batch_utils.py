@@ -1,16 +1,26 @@
+import logging
+import os
+import queue
 import tempfile
+import threading
+import time
 import typing as tp
+from dataclasses import dataclass, field
 
 import numpy as np
 import tensorflow as tf
 
+import merlin.io
 from merlin.core.dispatch import DataFrameType, concat_columns, get_lib
 from merlin.models.tf.blocks.core.base import Block
 from merlin.models.tf.dataset import BatchedDataset
 from merlin.models.tf.models.base import Model, RetrievalModel
+from merlin.models.utils.parquet import ParquetBatchWriter, recommendations_table
 from merlin.models.utils.schema_utils import select_targets
 from merlin.schema import Schema, Tags
 
+LOG = logging.getLogger("merlin.models")
+
 
 class ModelEncode:
     def __init__(
@@ -42,13 +52,68 @@ class ModelEncode:
         filter_input_columns: tp.Optional[tp.List[str]] = None,
         filter_output_columns: tp.Optional[tp.List[str]] = None,
     ) -> DataFrameType:
-        # Set defaults
+        iterator_func, encode_func, concat_func = self._default_funcs()
+
+        # Iterate over batches of df and collect predictions
+        outputs = concat_func([encode_func(self.model, batch) for batch in iterator_func(df)])
+
+        return self._to_output_df(df, outputs, filter_input_columns, filter_output_columns)
+
+    def iter_batches(
+        self,
+        df: DataFrameType,
+        filter_input_columns: tp.Optional[tp.List[str]] = None,
+        filter_output_columns: tp.Optional[tp.List[str]] = None,
+    ) -> tp.Iterator[DataFrameType]:
+        """Yields the output of each batch of `df` as soon as it's computed,
+        instead of collecting the outputs of all batches first.
+
+        The batches are produced in order, so the input rows of each output
+        batch are the next rows of `df`.
+        """
+        iterator_func, encode_func, concat_func = self._default_funcs()
+
+        offset = 0
+        for batch in iterator_func(df):
+            outputs = concat_func([encode_func(self.model, batch)])
+            num_rows = len(outputs)
+            batch_df = df.iloc[offset : offset + num_rows]
+            offset += num_rows
+
+            yield self._to_output_df(batch_df, outputs, filter_input_columns, filter_output_columns)
+
+    def to_parquet(
+        self,
+        df: DataFrameType,
+        path: str,
+        filter_input_columns: tp.Optional[tp.List[str]] = None,
+        filter_output_columns: tp.Optional[tp.List[str]] = None,
+    ) -> int:
+        """Encodes `df` batch by batch, writing each batch as a row group of
+        the Parquet file `path`.
+
+        Returns the number of rows written.
+        """
+        with ParquetBatchWriter(path) as writer:
+            for output_df in self.iter_batches(df, filter_input_columns, filter_output_columns):
+                writer.write(output_df)
+
+        return writer.num_rows
+
+    def _default_funcs(self):
         iterator_func = self.data_iterator_func or (lambda x: [x])
         encode_func = self.model_encode_func or (lambda x, y: x(y))
         concat_func = self.output_concat_func or np.concatenate
 
-        # Iterate over batches of df and collect predictions
-        outputs = concat_func([encode_func(self.model, batch) for batch in iterator_func(df)])
+        return iterator_func, encode_func, concat_func
+
+    def _to_output_df(
+        self,
+        df: DataFrameType,
+        outputs,
+        filter_input_columns: tp.Optional[tp.List[str]] = None,
+        filter_output_columns: tp.Optional[tp.List[str]] = None,
+    ) -> DataFrameType:
         output_names = self.output_names or [str(i) for i in range(outputs.shape[1])]
         model_output_df = type(df)(outputs, columns=output_names)
         if filter_output_columns:
@@ -59,10 +124,192 @@ class ModelEncode:
 
         return output_df
 
+    def _empty_output_df(
+        self,
+        df: DataFrameType,
+        filter_input_columns: tp.Optional[tp.List[str]] = None,
+        filter_output_columns: tp.Optional[tp.List[str]] = None,
+    ) -> DataFrameType:
+        """The (empty) output of an input without rows, e.g. the `_meta` of a dask DataFrame"""
+        if not self.output_names:
+            raise ValueError(
+                "The input data has no rows, and the output columns can't be inferred "
+                "without running the model, please provide the `output_names`."
+            )
+        outputs = np.empty((0, len(self.output_names)), dtype=np.float32)
+
+        return self._to_output_df(df.iloc[:0], outputs, filter_input_columns, filter_output_columns)
+
     def transform(self, col_selector, df: DataFrameType, **kwargs) -> DataFrameType:
         return self(df[col_selector], **kwargs)
 
 
+def split_output_columns(
+    output_columns: tp.Optional[tp.List[str]], input_columns
+) -> tp.Tuple[tp.Optional[tp.List[str]], tp.Optional[tp.List[str]]]:
+    """Splits `output_columns` into the `filter_input_columns` and
+    `filter_output_columns` arguments of `ModelEncode`.
+
+    An empty filter keeps all the columns, so the outputs must still be
+    selected with `select_output_columns`."""
+    if not output_columns:
+        return None, None
+
+    filter_input_columns = [col for col in output_columns if col in input_columns]
+    filter_output_columns = [col for col in output_columns if col not in input_columns]
+
+    return filter_input_columns, filter_output_columns
+
+
+def select_output_columns(
+    df: DataFrameType, output_columns: tp.Optional[tp.List[str]] = None
+) -> DataFrameType:
+    """Selects `output_columns` (in this order) of the outputs of `ModelEncode`"""
+    return df[output_columns] if output_columns else df
+
+
+def encode_to_parquet(
+    model_encode: ModelEncode,
+    ddf,
+    output_path: str,
+    output_columns: tp.Optional[tp.List[str]] = None,
+    resume: bool = False,
+) -> tp.List[str]:
+    """Encodes a dask DataFrame partition by partition, streaming the outputs of
+    every batch to one Parquet file per partition in `output_path`.
+
+    Only a single partition is loaded at a time and the outputs of a batch are
+    written as soon as they are computed, so the memory usage is bounded by the
+    partition size instead of the dataset size.
+
+    Parameters
+    ----------
+    model_encode: ModelEncode
+        The encoder used to generate the outputs of each batch.
+    ddf: dask.dataframe.DataFrame
+        The data to encode.
+    output_path: str
+        Directory where the Parquet files are written (`part_<partition>.parquet`).
+    output_columns: Optional[List[str]]
+        Subset of the input and output columns to write. By default all are written.
+    resume: bool
+        Skip partitions whose Parquet file already exists in `output_path`,
+        e.g. written by a previous interrupted run. Defaults to False.
+
+    Returns
+    -------
+    List[str]
+        The paths of the Parquet files of all partitions.
+    """
+    filter_input_columns, filter_output_columns = split_output_columns(output_columns, ddf.columns)
+
+    os.makedirs(output_path, exist_ok=True)
+    paths = []
+    for i in range(ddf.npartitions):
+        path = os.path.join(output_path, f"part_{i}.parquet")
+        if not (resume and os.path.exists(path)):
+            df = ddf.get_partition(i).compute(scheduler="synchronous")
+            with ParquetBatchWriter(path) as writer:
+                for output_df in model_encode.iter_batches(
+                    df, filter_input_columns, filter_output_columns
+                ):
+                    writer.write(select_output_columns(output_df, output_columns))
+        if os.path.exists(path):
+            paths.append(path)
+
+    return paths
+
+
+def recommend_to_parquet(
+    query_block: Block,
+    index: Block,
+    ddf,
+    output_path: str,
+    k: int,
+    id_column: str,
+    batch_size: int = 512,
+    num_workers: int = 1,
+    resume: bool = False,
+    schema: tp.Optional[Schema] = None,
+) -> tp.List[str]:
+    """Computes the top-k recommendations of every query (e.g. user) of a dask DataFrame,
+    writing `(id_column, item_ids, scores)` rows to one Parquet file per partition.
+
+    The queries of a batch are embedded with `query_block` and scored against
+    the pre-built `index` (e.g. a `TopKIndexBlock`, or any block returning the top-k
+    `(scores, ids)` of query embeddings), and the recommendations are written as soon
+    as they are computed. Each worker thread processes one partition at a time,
+    so the memory usage is bounded by `num_workers` partitions and the scores
+    of a batch (see the `block_size` of `TopKIndexBlock`).
+
+    Parameters
+    ----------
+    query_block: Block
+        The query tower.
+    index: Block
+        The index of candidates, called with the query embeddings and `k`.
+    ddf: dask.dataframe.DataFrame
+        The query features.
+    output_path: str
+        Directory where the Parquet files are written (`part_<partition>.parquet`).
+    k: int
+        Number of recommendations per query.
+    id_column: str
+        The query id column, written with the recommendations.
+    batch_size: int
+        Number of queries scored at a time. Defaults to 512.
+    num_workers: int
+        Number of partitions processed in parallel. Defaults to 1.
+    resume: bool
+        Skip partitions whose Parquet file already exists in `output_path`.
+    schema: Optional[Schema]
+        The schema of the query features, by default the schema of `query_block`.
+
+    Returns
+    -------
+    List[str]
+        The paths of the Parquet files of all partitions.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    schema = schema or query_block.schema
+    recommend_fn = tf.function(
+        lambda inputs: index(query_block(inputs, training=False), k=k),
+        experimental_relax_shapes=True,
+    )
+
+    def recommend_partition(i: int) -> None:
+        path = os.path.join(output_path, f"part_{i}.parquet")
+        if resume and os.path.exists(path):
+            return
+        df = ddf.get_partition(i).compute(scheduler="synchronous")
+        ids = df[id_column].values
+        ids = ids if isinstance(ids, np.ndarray) else ids.get()
+        offset = 0
+        with ParquetBatchWriter(path) as writer:
+            for batch in data_iterator_func(schema, batch_size=batch_size)(df):
+                scores, item_ids = recommend_fn(batch[0])
+                num_rows = scores.shape[0]
+                writer.write(
+                    recommendations_table(
+                        ids[offset : offset + num_rows],
+                        item_ids.numpy(),
+                        scores.numpy(),
+                        id_column=id_column,
+                    )
+                )
+                offset += num_rows
+
+    os.makedirs(output_path, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        # Consuming the results to raise the errors of the workers
+        list(executor.map(recommend_partition, range(ddf.npartitions)))
+
+    paths = [os.path.join(output_path, f"part_{i}.parquet") for i in range(ddf.npartitions)]
+
+    return [path for path in paths if os.path.exists(path)]
+
+
 class TFModelEncode(ModelEncode):
     def __init__(
         self,
@@ -110,6 +357,376 @@ class TFModelEncode(ModelEncode):
     #     return output
 
 
+@dataclass
+class InferenceStats:
+    """Throughput and per-stage latency of a `PipelinedModelEncode` run.
+    Stage times are the total seconds spent by each stage doing work,
+    i.e. excluding the time spent waiting on the other stages."""
+
+    num_rows: int = 0
+    num_batches: int = 0
+    elapsed: float = 0.0
+    stage_seconds: tp.Dict[str, float] = field(
+        default_factory=lambda: {"load": 0.0, "compute": 0.0, "write": 0.0}
+    )
+    batch_sizes: tp.List[int] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.num_rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def stage_latency_ms(self) -> tp.Dict[str, float]:
+        """Mean latency of each stage per batch, in milliseconds"""
+        num_batches = max(self.num_batches, 1)
+
+        return {stage: 1000 * sec / num_batches for stage, sec in self.stage_seconds.items()}
+
+    def as_dict(self) -> tp.Dict[str, float]:
+        output = {
+            "num_rows": self.num_rows,
+            "num_batches": self.num_batches,
+            "elapsed": self.elapsed,
+            "rows_per_second": self.rows_per_second,
+        }
+        output.update({f"{k}_latency_ms": v for k, v in self.stage_latency_ms().items()})
+
+        return output
+
+
+class _BatchSizeTuner:
+    """Hill-climbing search of the batch size with the highest compute throughput.
+    The batch size is doubled while that increases the rows/sec by at least
+    `min_improvement`, up to `max_batch_size`."""
+
+    def __init__(self, batch_size: int, max_batch_size: tp.Optional[int], min_improvement=0.05):
+        self.batch_size = batch_size
+        self.max_batch_size = max_batch_size or batch_size
+        self.min_improvement = min_improvement
+        self._best_throughput = 0.0
+        self._rows = 0
+        self._seconds = 0.0
+        self._is_warm = False
+        self._done = self.batch_size >= self.max_batch_size
+
+    def update(self, num_rows: int, seconds: float, min_rows: int) -> None:
+        # Ignores batches loaded with another batch size (or smaller last batches)
+        # and the first batch of each size, which includes the function tracing
+        if self._done or num_rows != self.batch_size:
+            return
+        if not self._is_warm:
+            self._is_warm = True
+            return
+
+        self._rows += num_rows
+        self._seconds += seconds
+        if self._rows < min_rows:
+            return
+
+        throughput = self._rows / max(self._seconds, 1e-9)
+        self._rows, self._seconds, self._is_warm = 0, 0.0, False
+        if throughput >= self._best_throughput * (1 + self.min_improvement):
+            self._best_throughput = throughput
+            if self.batch_size * 2 <= self.max_batch_size:
+                self.batch_size *= 2
+                return
+        else:
+            # Going back to the best batch size found
+            self.batch_size //= 2
+        self._done = True
+
+
+class PipelinedModelEncode(ModelEncode):
+    """Multi-threaded batch inference, where the data loading, the model execution
+    and the writing of outputs run on separate threads connected by bounded queues,
+    so that each stage overlaps with the others.
+
+    The model is executed by a graph-compiled function, and the TensorFlow thread
+    pools can be configured with `intra_op_parallelism_threads` and
+    `inter_op_parallelism_threads` (this only takes effect if set before TensorFlow
+    runtime is initialized). When `max_batch_size` is set, the batch size is
+    tuned on the fly (doubling it while the throughput increases)
+    to saturate the available cores.
+
+    Example usage::
+
+        encoder = PipelinedModelEncode(model, batch_size=1024, max_batch_size=16384)
+        predictions = encoder.predict(dataset, output_path="/predictions")
+        print(encoder.stats.as_dict())
+
+    Parameters
+    ----------
+    model: Union[Model, tf.keras.Model]
+        The model to run.
+    output_names: Optional[List[str]]
+        The names of the output columns, inferred from the prediction tasks by default.
+    batch_size: int
+        The (initial) batch size. Defaults to 512.
+    max_batch_size: Optional[int]
+        Enables dynamic batch sizing, up to this batch size.
+    queue_size: int
+        Maximum number of batches waiting between two stages. Defaults to 8.
+    intra_op_parallelism_threads: Optional[int]
+        Number of threads used within an individual op.
+    inter_op_parallelism_threads: Optional[int]
+        Number of threads used for parallelism between independent ops.
+    jit_compile: bool
+        Compile the model function with XLA. Defaults to False.
+    schema: Optional[Schema]
+        The input schema, by default the model schema.
+    chunk_size: Optional[int]
+        Number of rows loaded at once by the data loading stage, the batch size
+        can be updated after each chunk. Defaults to `16 * max_batch_size`.
+    """
+
+    def __init__(
+        self,
+        model: tp.Union[Model, tf.keras.Model],
+        output_names: tp.Optional[tp.List[str]] = None,
+        batch_size: int = 512,
+        max_batch_size: tp.Optional[int] = None,
+        queue_size: int = 8,
+        intra_op_parallelism_threads: tp.Optional[int] = None,
+        inter_op_parallelism_threads: tp.Optional[int] = None,
+        jit_compile: bool = False,
+        schema: tp.Optional[Schema] = None,
+        chunk_size: tp.Optional[int] = None,
+    ):
+        configure_threading(intra_op_parallelism_threads, inter_op_parallelism_threads)
+
+        if not output_names:
+            try:
+                output_names = model.block.last.task_names
+            except AttributeError:
+                pass
+        if output_names and len(output_names) > 1:
+            output_concat_func = get_lib().concat
+        else:
+            output_concat_func = np.concatenate
+
+        self.schema = schema or model.schema
+        self.batch_size = batch_size
+        self.max_batch_size = max_batch_size
+        self.queue_size = queue_size
+        self.chunk_size = chunk_size or 16 * (max_batch_size or batch_size)
+        self.stats = InferenceStats()
+
+        predict_fn = tf.function(
+            lambda inputs: model(inputs, training=False),
+            experimental_relax_shapes=True,
+            jit_compile=jit_compile,
+        )
+
+        super().__init__(
+            model,
+            output_names,
+            data_iterator_func=data_iterator_func(self.schema, batch_size=batch_size),
+            model_encode_func=lambda _, batch: model_encode(predict_fn, batch),
+            output_concat_func=output_concat_func,
+        )
+
+    def predict(
+        self,
+        dataset,
+        output_path: tp.Optional[str] = None,
+        output_columns: tp.Optional[tp.List[str]] = None,
+        resume: bool = False,
+    ) -> merlin.io.Dataset:
+        """Runs the pipelined inference over all partitions of `dataset`.
+
+        Parameters
+        ----------
+        dataset: Union[merlin.io.Dataset, dask.dataframe.DataFrame]
+            The data to predict on.
+        output_path: Optional[str]
+            If set, the outputs are written as Parquet files (one per partition)
+            to this directory, otherwise they are kept in memory.
+        output_columns: Optional[List[str]]
+            Subset of the input and output columns to output.
+        resume: bool
+            Skip the partitions whose output file already exists in `output_path`.
+
+        Returns
+        -------
+        merlin.io.Dataset
+        """
+        ddf = dataset.to_ddf() if hasattr(dataset, "to_ddf") else dataset
+        filter_input_columns, filter_output_columns = split_output_columns(
+            output_columns, ddf.columns
+        )
+        if output_path:
+            os.makedirs(output_path, exist_ok=True)
+
+        partitions = []
+        for i in range(ddf.npartitions):
+            path = os.path.join(output_path, f"part_{i}.parquet") if output_path else None
+            if not (path and resume and os.path.exists(path)):
+                partitions.append((i, path))
+
+        self.stats = InferenceStats()
+        tuner = _BatchSizeTuner(self.batch_size, self.max_batch_size)
+        load_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        write_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        errors: tp.List[BaseException] = []
+        outputs: tp.Dict[int, tp.List[DataFrameType]] = {}
+        _done = object()
+
+        # Stop waiting on the queues as soon as any of the stages fails
+        def _put(q, item):
+            while not errors:
+                try:
+                    return q.put(item, timeout=0.1)
+                except queue.Full:
+                    continue
+
+        def _get(q):
+            while not errors:
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _done
+
+        def load():
+            try:
+                for i, path in partitions:
+                    start = time.perf_counter()
+                    df = ddf.get_partition(i).compute(scheduler="synchronous")
+                    self.stats.stage_seconds["load"] += time.perf_counter() - start
+                    for offset in range(0, len(df), self.chunk_size):
+                        chunk = df.iloc[offset : offset + self.chunk_size]
+                        batch_size = tuner.batch_size
+                        batches = data_iterator_func(self.schema, batch_size=batch_size)(chunk)
+                        chunk_offset = 0
+                        iterator = iter(batches)
+                        while True:
+                            start = time.perf_counter()
+                            batch = next(iterator, None)
+                            self.stats.stage_seconds["load"] += time.perf_counter() - start
+                            if batch is None:
+                                break
+                            num_rows = min(batch_size, len(chunk) - chunk_offset)
+                            batch_df = chunk.iloc[chunk_offset : chunk_offset + num_rows]
+                            chunk_offset += num_rows
+                            _put(load_queue, (i, path, batch_df, batch))
+                            if errors:
+                                return
+                    _put(load_queue, (i, path, None, None))
+            except BaseException as e:  # noqa
+                errors.append(e)
+            finally:
+                _put(load_queue, _done)
+
+        def compute():
+            _, encode_func, concat_func = self._default_funcs()
+            try:
+                while True:
+                    item = _get(load_queue)
+                    if item is _done:
+                        break
+                    i, path, batch_df, batch = item
+                    if batch is not None:
+                        start = time.perf_counter()
+                        batch_outputs = concat_func([encode_func(self.model, batch)])
+                        seconds = time.perf_counter() - start
+                        self.stats.stage_seconds["compute"] += seconds
+                        self.stats.batch_sizes.append(len(batch_df))
+                        tuner.update(len(batch_df), seconds, min_rows=self.chunk_size // 2)
+                        item = (i, path, batch_df, batch_outputs)
+                    _put(write_queue, item)
+            except BaseException as e:  # noqa
+                errors.append(e)
+            finally:
+                _put(write_queue, _done)
+
+        def write():
+            writers: tp.Dict[int, ParquetBatchWriter] = {}
+            try:
+                while True:
+                    item = _get(write_queue)
+                    if item is _done:
+                        break
+                    i, path, batch_df, batch_outputs = item
+                    start = time.perf_counter()
+                    if batch_df is None:
+                        # End of partition
+                        if i in writers:
+                            writers.pop(i).close()
+                    else:
+                        output_df = select_output_columns(
+                            self._to_output_df(
+                                batch_df, batch_outputs, filter_input_columns, filter_output_columns
+                            ),
+                            output_columns,
+                        )
+                        if path:
+                            if i not in writers:
+                                writers[i] = ParquetBatchWriter(path)
+                            writers[i].write(output_df)
+                        else:
+                            outputs.setdefault(i, []).append(output_df)
+                        self.stats.num_rows += len(output_df)
+                        self.stats.num_batches += 1
+                    self.stats.stage_seconds["write"] += time.perf_counter() - start
+            except BaseException as e:  # noqa
+                errors.append(e)
+            finally:
+                for writer in writers.values():
+                    writer.abort()
+
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(target=fn, name=f"merlin-inference-{fn.__name__}", daemon=True)
+            for fn in (load, compute, write)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.stats.elapsed = time.perf_counter() - start
+
+        if errors:
+            raise errors[0]
+
+        LOG.info(f"Batch inference stats: {self.stats.as_dict()}")
+
+        if output_path:
+            paths = [os.path.join(output_path, f"part_{i}.parquet") for i in range(ddf.npartitions)]
+            paths = [p for p in paths if os.path.exists(p)]
+            if paths:
+                return merlin.io.Dataset(paths, engine="parquet")
+
+        output_dfs = [df for i in sorted(outputs) for df in outputs[i]]
+        if not output_dfs:
+            # All the partitions are empty, no file was written
+            return merlin.io.Dataset(
+                select_output_columns(
+                    self._empty_output_df(ddf._meta, filter_input_columns, filter_output_columns),
+                    output_columns,
+                )
+            )
+
+        return merlin.io.Dataset(get_lib().concat(output_dfs, ignore_index=True))
+
+
+def configure_threading(
+    intra_op_parallelism_threads: tp.Optional[int] = None,
+    inter_op_parallelism_threads: tp.Optional[int] = None,
+) -> None:
+    """Sets the number of threads of the TensorFlow thread pools, if not set yet"""
+    try:
+        if intra_op_parallelism_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_parallelism_threads)
+        if inter_op_parallelism_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_parallelism_threads)
+    except RuntimeError:
+        LOG.warning(
+            "The TensorFlow thread pools can't be configured after the runtime "
+            "is initialized, using the current settings: "
+            f"intra_op={tf.config.threading.get_intra_op_parallelism_threads()}, "
+            f"inter_op={tf.config.threading.get_inter_op_parallelism_threads()}"
+        )
+
+
 class ItemEmbeddings(TFModelEncode):
     def __init__(self, model: Model, batch_size: int = 512, save_path: tp.Optional[str] = None):
         item_block = model.block.first.item_block()
@@ -131,6 +131,60 @@ def rescore_false_negatives(
     return tf.squeeze(negative_scores)
 
 
+def rescore_false_negatives_sorted(
+    positive_item_ids: tf.Tensor,
+    neg_samples_item_ids: tf.Tensor,
+    negative_scores: tf.Tensor,
+    false_negatives_score: float,
+):
+    """
+    Zeroes the logits of accidental negatives, like `rescore_false_negatives()`,
+    but without the (batch size, number of negatives) equality mask: the range of
+    each positive id in the sorted negative ids is found by binary search, so that
+    only the indices of the false negatives are materialized.
+    The negative ids are shared by all the positives (1D), they may be unique
+    (e.g. deduplicated) or contain repeated ids.
+    """
+    positive_item_ids = tf.reshape(positive_item_ids, [-1])
+    neg_samples_item_ids = tf.reshape(neg_samples_item_ids, [-1])
+    positive_item_ids = tf.cast(positive_item_ids, neg_samples_item_ids.dtype)
+
+    sorted_neg_idx = tf.argsort(neg_samples_item_ids)
+    sorted_neg_ids = tf.gather(neg_samples_item_ids, sorted_neg_idx)
+    matches = tf.ragged.range(
+        tf.searchsorted(sorted_neg_ids, positive_item_ids, side="left"),
+        tf.searchsorted(sorted_neg_ids, positive_item_ids, side="right"),
+    )
+
+    rows = tf.cast(matches.value_rowids(), sorted_neg_idx.dtype)
+    cols = tf.gather(sorted_neg_idx, matches.flat_values)
+    indices = tf.stack([rows, cols], axis=1)
+
+    negative_scores = tf.tensor_scatter_nd_update(
+        negative_scores,
+        indices,
+        tf.fill([tf.shape(indices)[0]], tf.cast(false_negatives_score, negative_scores.dtype)),
+    )
+
+    return tf.squeeze(negative_scores)
+
+
+def unique_items(item_ids: tf.Tensor, items_embeddings: tf.Tensor, *items_values: tf.Tensor):
+    """
+    Removes the repeated item ids (and corresponding embeddings and other
+    `items_values` aligned with the ids), keeping their first occurrence.
+    """
+    item_ids = tf.reshape(item_ids, [-1])
+    unique_ids, idx = tf.unique(item_ids)
+    first_occurrence = tf.math.unsorted_segment_min(
+        tf.range(tf.shape(item_ids)[0]), idx, tf.shape(unique_ids)[0]
+    )
+
+    return (unique_ids, tf.gather(items_embeddings, first_occurrence)) + tuple(
+        tf.gather(values, first_occurrence) for values in items_values
+    )
+
+
 def extract_topk(k, predictions, labels):
     # Computes the number of relevant items per row (before extracting only the top-k)
     label_relevant_counts = tf.reduce_sum(labels, axis=-1)
@@ -141,6 +195,55 @@ def extract_topk(k, predictions, labels):
     return topk_predictions, topk_labels, label_relevant_counts
 
 
+def extract_topk_ragged(k, predictions, relevant_ids):
+    """Like `extract_topk`, for labels given as the relevant item ids of each row
+    (a `tf.RaggedTensor` or a `tf.SparseTensor` whose values are the ids) instead of
+    a dense multi-hot matrix. The columns of `predictions` are the item ids.
+
+    The top-k ids are looked up in the sorted relevant ids of their row, so the memory
+    scales with k and the number of relevant items rather than with the number of items.
+    """
+    k = tf.minimum(k, tf.shape(predictions)[-1])
+    topk_predictions, topk_indices = tf.math.top_k(predictions, k)
+    topk_labels, label_relevant_counts = relevant_ids_membership(topk_indices, relevant_ids)
+
+    return (
+        topk_predictions,
+        tf.cast(topk_labels, predictions.dtype),
+        tf.cast(label_relevant_counts, predictions.dtype),
+    )
+
+
+def relevant_ids_membership(ids, relevant_ids):
+    """Returns whether each of the (batch_size, k) `ids` is among the relevant ids of its row,
+    and the number of unique relevant ids of each row.
+    """
+    if isinstance(relevant_ids, tf.SparseTensor):
+        relevant_ids = tf.RaggedTensor.from_sparse(relevant_ids)
+    relevant_ids = tf.cast(relevant_ids, tf.int64)
+    ids = tf.cast(ids, tf.int64)
+
+    # Pads the rows with the highest id, which is sorted last and never matches the ids
+    padding = relevant_ids.dtype.max
+    sorted_ids = tf.sort(relevant_ids.to_tensor(default_value=padding), axis=-1)
+    sorted_ids = tf.concat([sorted_ids, tf.fill([tf.shape(sorted_ids)[0], 1], padding)], -1)
+
+    positions = tf.searchsorted(sorted_ids, ids, side="left")
+    is_relevant = tf.gather(sorted_ids, positions, batch_dims=1) == ids
+
+    is_unique = tf.concat(
+        [sorted_ids[:, :1] != padding, sorted_ids[:, 1:] != sorted_ids[:, :-1]], axis=-1
+    ) & (sorted_ids != padding)
+    relevant_counts = tf.reduce_sum(tf.cast(is_unique, tf.int32), axis=-1)
+
+    return is_relevant, relevant_counts
+
+
+def is_relevant_ids(labels) -> bool:
+    """Whether the labels are given as the relevant ids of each row"""
+    return isinstance(labels, (tf.RaggedTensor, tf.SparseTensor))
+
+
 def transform_label_to_onehot(labels, vocab_size):
     return tf.one_hot(tf.reshape(labels, (-1,)), vocab_size)
 
@@ -160,9 +263,9 @@ def gather_torch_like(labels, indices, max_k):
 
 
 def batch_ref(inputs: Union[tf.Tensor, TabularData]):
-    """Get hash-code of a tensor or a dictionary of tensors."""
+    """Get hash-code of a tensor (or variable) or a dictionary of tensors."""
 
-    if isinstance(inputs, tf.Tensor):
+    if isinstance(inputs, (tf.Tensor, tf.Variable)):
         return hash(inputs.ref())
 
     refs = []
@@ -13,22 +13,239 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-from typing import Union
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple, Union
 
+import dask
 import numpy as np
 import pandas as pd
+from scipy import sparse
 from scipy.sparse import coo_matrix
 
 from merlin.io import Dataset
 from merlin.schema import Tags
 
+# In-memory cache of the interaction matrices of file-backed datasets, by cache key
+_CSR_CACHE: "OrderedDict[str, sparse.csr_matrix]" = OrderedDict()
+_CSR_CACHE_SIZE = 4
+_CSR_CACHE_LOCK = threading.Lock()
 
-def dataset_to_coo(dataset: Dataset):
-    """Converts a merlin.io.Dataset object to a scipy coo matrix"""
+
+def dataset_to_coo(
+    dataset: Dataset, sum_duplicates: bool = False, num_workers: Optional[int] = 1
+) -> coo_matrix:
+    """Converts a merlin.io.Dataset object to a scipy coo matrix
+
+    The partitions are streamed (`num_workers` at a time) into index and value buffers
+    preallocated from the partition lengths, with the narrowest index dtype the ids fit in,
+    so the peak memory stays close to the size of the matrix.
+
+    Parameters
+    ----------
+    dataset : merlin.io.Dataset
+        Dataset with the columns tagged `Tags.USER_ID`, `Tags.ITEM_ID`
+        and (optionally) `Tags.TARGET`
+    sum_duplicates : bool, optional
+        Whether the repeated (user id, item id) interactions are summed, by default False
+    num_workers : int, optional
+        Number of partitions converted at a time, by default 1
+    """
+    user_id_column, item_id_column, target_column = _interaction_columns(dataset)
+    columns = [user_id_column, item_id_column] + ([target_column] if target_column else [])
+    ddf = dataset.to_ddf()[columns]
+
+    partition_lens = _partition_lens(dataset, ddf)
+    offsets = np.concatenate([[0], np.cumsum(partition_lens, dtype=np.int64)])
+    index_dtype = _index_dtype(dataset, [user_id_column, item_id_column])
+    buffers = {
+        "userids": np.empty(offsets[-1], dtype=index_dtype),
+        "itemids": np.empty(offsets[-1], dtype=index_dtype),
+        "targets": np.empty(offsets[-1], dtype=np.float32),
+    }
+    lock = threading.Lock()
+
+    def assemble(df, partition: int):
+        userids, itemids, targets = _partition_to_coo(
+            df, user_id_column, item_id_column, target_column
+        )
+        start, end = offsets[partition], offsets[partition + 1]
+        if len(userids) != end - start:
+            raise ValueError(
+                f"Partition {partition} has {len(userids)} rows, "
+                f"but {end - start} were expected from the dataset metadata"
+            )
+        with lock:
+            for name, block in [("userids", userids), ("itemids", itemids)]:
+                if len(block) and block.max() > np.iinfo(buffers[name].dtype).max:
+                    # Ids beyond the int32 range (and the schema domain)
+                    buffers[name] = buffers[name].astype(np.int64)
+                buffers[name][start:end] = block
+            buffers["targets"][start:end] = targets
+
+    dask.compute(
+        *[dask.delayed(assemble)(part, i) for i, part in enumerate(ddf.to_delayed())],
+        scheduler="threads",
+        num_workers=num_workers,
+    )
+
+    matrix = coo_matrix((buffers.pop("targets"), (buffers.pop("userids"), buffers.pop("itemids"))))
+    if sum_duplicates:
+        matrix.sum_duplicates()
+
+    return matrix
+
+
+def dataset_to_csr(
+    dataset: Dataset,
+    cache_dir: Optional[str] = None,
+    num_workers: Optional[int] = None,
+) -> sparse.csr_matrix:
+    """Converts a merlin.io.Dataset object to a scipy csr matrix of
+    the (user id, item id) interactions, with the sum of the targets as values.
+
+    The partitions of the dataset are converted in parallel, and the matrix of a
+    file-backed dataset is cached by `interactions_cache_key` (the files and the
+    interaction columns of the schema), in memory and as `<cache_dir>/<key>.npz`,
+    so it's built once across the `fit`, `evaluate` and `predict` calls and experiments.
+    The cached matrix is shared, so it shouldn't be modified in place.
+
+    Parameters
+    ----------
+    dataset : merlin.io.Dataset
+        Dataset with the columns tagged `Tags.USER_ID`, `Tags.ITEM_ID`
+        and (optionally) `Tags.TARGET`
+    cache_dir : str, optional
+        Directory where the matrix is persisted, by default None (only cached in memory)
+    num_workers : int, optional
+        Number of threads converting the partitions, by default None (dask's default)
+
+    Returns
+    -------
+    sparse.csr_matrix
+    """
+    key = interactions_cache_key(dataset)
+    if key is not None:
+        with _CSR_CACHE_LOCK:
+            if key in _CSR_CACHE:
+                _CSR_CACHE.move_to_end(key)
+                return _CSR_CACHE[key]
+        path = os.path.join(cache_dir, f"{key}.npz") if cache_dir else None
+        if path and os.path.exists(path):
+            return _add_to_cache(key, sparse.load_npz(path).tocsr())
+
+    matrix = _build_csr(dataset, num_workers)
+    if key is None:
+        return matrix
+
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written to a temporary file first, so concurrent experiments never read a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        sparse.save_npz(tmp_path, matrix)
+        os.replace(tmp_path, path)
+
+    return _add_to_cache(key, matrix)
+
+
+def csr_rows(matrix: sparse.csr_matrix, ids: np.ndarray) -> sparse.csr_matrix:
+    """Rows of the matrix for the `ids` (e.g. the interactions of some users),
+    empty for the ids out of the bounds of the matrix"""
+    ids = np.asarray(ids)
+    in_bounds = (ids >= 0) & (ids < matrix.shape[0])
+    rows = matrix[np.where(in_bounds, ids, 0)]
+    if not in_bounds.all():
+        rows = sparse.diags(in_bounds.astype(rows.dtype)) @ rows
+        rows.eliminate_zeros()
+
+    return sparse.csr_matrix(rows)
+
+
+def interactions_cache_key(dataset: Dataset) -> Optional[str]:
+    """Key of the interaction matrix of a file-backed dataset, from its files
+    (paths, sizes and modification times) and the interaction columns of its schema.
+    Returns None for the datasets which aren't backed by files (e.g. a dataframe)."""
+    paths = getattr(dataset.engine, "paths", None)
+    fs = getattr(dataset.engine, "fs", None)
+    if not paths or fs is None:
+        return None
+
+    files = []
+    for path in paths:
+        for file in _dir_files(fs, path) if fs.isdir(path) else sorted(fs.glob(path)):
+            info = fs.info(file)
+            modified = info.get("mtime", info.get("LastModified", info.get("updated")))
+            files.append([file, info.get("size"), str(modified)])
+
+    columns = [col for col in _interaction_columns(dataset) if col]
+    dtypes = [str(dataset.schema[col].dtype) for col in columns]
+    content = json.dumps({"files": files, "columns": columns, "dtypes": dtypes})
+
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def _dir_files(fs, path: str) -> List[str]:
+    return sorted(
+        file for file in fs.find(path) if not os.path.basename(file).startswith(("_", "."))
+    )
+
+
+def _add_to_cache(key: str, matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    with _CSR_CACHE_LOCK:
+        _CSR_CACHE[key] = matrix
+        while len(_CSR_CACHE) > _CSR_CACHE_SIZE:
+            _CSR_CACHE.popitem(last=False)
+
+    return matrix
+
+
+def _build_csr(dataset: Dataset, num_workers: Optional[int] = None) -> sparse.csr_matrix:
+    # The duplicated interactions are summed by the conversion
+    return dataset_to_coo(dataset, num_workers=num_workers).tocsr()
+
+
+def _partition_lens(dataset: Dataset, ddf) -> List[int]:
+    """Number of rows of each partition, from the metadata of the dataset when available"""
+    try:
+        partition_lens = dataset.partition_lens
+    except AttributeError:
+        partition_lens = None
+    if not partition_lens or len(partition_lens) != ddf.npartitions:
+        partition_lens = ddf.map_partitions(len).compute(scheduler="synchronous")
+
+    return [int(length) for length in partition_lens]
+
+
+def _index_dtype(dataset: Dataset, columns: List[str]) -> np.dtype:
+    """int32 (the narrowest index dtype of scipy) unless the domain of an id column exceeds it"""
+    for col in columns:
+        domain = dataset.schema[col].int_domain
+        if domain and domain.max is not None and domain.max > np.iinfo(np.int32).max:
+            return np.dtype(np.int64)
+
+    return np.dtype(np.int32)
+
+
+def _partition_to_coo(
+    df, user_id_column: str, item_id_column: str, target_column: Optional[str]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    userids = to_numpy(df[user_id_column])
+    itemids = to_numpy(df[item_id_column])
+    if target_column:
+        targets = to_numpy(df[target_column]).astype(np.float32, copy=False)
+    else:
+        targets = np.ones(len(userids), dtype=np.float32)
+
+    return userids, itemids, targets
+
+
+def _interaction_columns(dataset: Dataset) -> Tuple[str, str, Optional[str]]:
     user_id_column = dataset.schema.select_by_tag(Tags.USER_ID).first.name
     item_id_column = dataset.schema.select_by_tag(Tags.ITEM_ID).first.name
 
-    columns = [user_id_column, item_id_column]
     target_column = None
     target = dataset.schema.select_by_tag(Tags.TARGET)
 
@@ -40,14 +257,8 @@ def dataset_to_coo(dataset: Dataset):
 
     elif len(target) == 1:
         target_column = target.first.name
-        columns.append(target_column)
-
-    df = dataset.to_ddf()[columns].compute(scheduler="synchronous")
 
-    userids = _to_numpy(df[user_id_column])
-    itemids = _to_numpy(df[item_id_column])
-    targets = _to_numpy(df[target_column]) if target_column else np.ones(len(userids))
-    return coo_matrix((targets.astype("float32"), (userids, itemids)))
+    return user_id_column, item_id_column, target_column
 
 
 def unique_rows_by_features(
@@ -64,7 +275,7 @@ def unique_rows_by_features(
     return Dataset(ddf)
 
 
-def _to_numpy(series):
+def to_numpy(series):
     """converts a pandas or cudf series to a numpy array"""
     if isinstance(series, pd.Series):
         return series.values
@@ -0,0 +1,484 @@
+#
+# Copyright (c) 2022, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import concurrent.futures
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from merlin.io import Dataset
+from merlin.models.utils.dataset import csr_rows, dataset_to_csr, to_numpy
+from merlin.models.utils.top_k import blockwise_top_k
+
+RETRIEVAL_METRICS = ("recall", "ndcg", "map", "mrr", "precision")
+_EPSILON = 1e-7
+
+
+class StreamingRetrievalEvaluator:
+    """Evaluates retrieval embeddings offline, streaming the users in blocks.
+
+    For each block of users, the scores against all the items are computed (in blocks of
+    `item_block_size` items) and reduced to the top-k, which are compared with the
+    ground-truth interactions of the users. Only the sums of the metrics are kept, overall
+    and per segment, so the memory doesn't grow with the number of users and any number of
+    segment breakdowns are computed in the same pass.
+
+    The metrics follow the definitions of `merlin.models.tf.metrics.ranking`, and are
+    averaged over the users with at least one ground-truth interaction.
+
+    Example usage::
+
+        evaluator = StreamingRetrievalEvaluator.from_dataset(
+            model.item_embeddings(items), id_column="item_id", top_ks=[10, 100]
+        )
+        user_embeddings = model.query_embeddings(valid).compute()
+        metrics = evaluator.evaluate(
+            user_embeddings["user_id"].values,
+            user_embeddings[[str(i) for i in range(dim)]].values,
+            ground_truth=valid,
+            segments=activity_bucket_by_user_id,
+        )
+
+    Parameters
+    ----------
+    item_embeddings : np.ndarray
+        The (num_items, dim) embeddings of the candidate items
+    item_ids : np.ndarray, optional
+        The ids of the candidate items, by default their positions in `item_embeddings`
+    top_ks : Sequence[int], optional
+        The cut-offs of the metrics, by default (10,)
+    metrics : Sequence[str], optional
+        The metrics to compute, among "recall", "ndcg", "map", "mrr" and "precision".
+        By default all of them.
+    exclude : Union[Dataset, sparse.spmatrix], optional
+        Interactions (e.g. the training data) to remove from the recommendations
+        of each user, by default None
+    user_block_size : int, optional
+        Number of users scored at a time, by default 1024
+    item_block_size : int, optional
+        Number of items scored at a time, by default all of them
+    num_workers : int, optional
+        Number of threads evaluating the user blocks in parallel (the matrix products
+        and top-k selections release the GIL). By default 0, which evaluates them
+        in the calling thread.
+    """
+
+    def __init__(
+        self,
+        item_embeddings: np.ndarray,
+        item_ids: Optional[np.ndarray] = None,
+        top_ks: Sequence[int] = (10,),
+        metrics: Optional[Sequence[str]] = None,
+        exclude: Optional[Union[Dataset, sparse.spmatrix]] = None,
+        user_block_size: int = 1024,
+        item_block_size: Optional[int] = None,
+        num_workers: int = 0,
+    ):
+        metrics = list(metrics or RETRIEVAL_METRICS)
+        unknown = [metric for metric in metrics if metric not in RETRIEVAL_METRICS]
+        if unknown:
+            raise ValueError(f"Unknown metrics {unknown}, expected any of {RETRIEVAL_METRICS}")
+        self.metrics = metrics
+        self.top_ks = sorted(set(int(k) for k in top_ks))
+        self.k = min(self.top_ks[-1], len(item_embeddings))
+
+        self.item_embeddings = np.ascontiguousarray(item_embeddings, dtype=np.float32)
+        self.item_ids = (
+            np.arange(len(item_embeddings)) if item_ids is None else np.asarray(item_ids)
+        )
+        self.exclude = _to_csr(exclude) if exclude is not None else None
+        self.user_block_size = user_block_size
+        self.item_block_size = item_block_size or len(item_embeddings)
+        self.num_workers = num_workers
+        self._ground_truth: Optional[sparse.csr_matrix] = None
+
+    @classmethod
+    def from_dataset(
+        cls,
+        item_embeddings: Dataset,
+        id_column: str,
+        embedding_columns: Optional[List[str]] = None,
+        **kwargs,
+    ) -> "StreamingRetrievalEvaluator":
+        """Creates the evaluator from a dataset of item embeddings,
+        like the output of `RetrievalModel.item_embeddings`.
+
+        Parameters
+        ----------
+        item_embeddings : Dataset
+            The item ids and embeddings
+        id_column : str
+            The column of the item ids
+        embedding_columns : List[str], optional
+            The columns of the embeddings, by default the columns named by
+            their position ("0", "1", ...)
+        """
+        item_ids, embeddings = embeddings_from_dataset(
+            item_embeddings, id_column, embedding_columns
+        )
+
+        return cls(embeddings, item_ids, **kwargs)
+
+    def evaluate(
+        self,
+        user_ids: np.ndarray,
+        user_embeddings: np.ndarray,
+        ground_truth: Union[Dataset, sparse.spmatrix],
+        segments: Optional[Union[pd.Series, Dict]] = None,
+    ) -> Dict[str, float]:
+        """Evaluates the embeddings of the users against their ground-truth interactions.
+
+        Parameters
+        ----------
+        user_ids : np.ndarray
+            The ids of the users
+        user_embeddings : np.ndarray
+            The (num_users, dim) embeddings of the users
+        ground_truth : Union[Dataset, sparse.spmatrix]
+            The relevant items of each user, either a dataset with columns tagged
+            `Tags.USER_ID` and `Tags.ITEM_ID` or a sparse (user id, item id) matrix
+        segments : Union[pd.Series, Dict], optional
+            The segment of each user id (e.g. an activity bucket), to break down
+            the metrics by segment. By default None.
+
+        Returns
+        -------
+        Dict[str, float]
+            The metrics (e.g. "recall@10") averaged over the users with ground-truth
+            interactions, their number ("num_users") and, if `segments` are given,
+            the same metrics for each segment prefixed by it (e.g. "low/recall@10").
+        """
+        blocks = (
+            (
+                user_ids[start : start + self.user_block_size],
+                user_embeddings[start : start + self.user_block_size],
+            )
+            for start in range(0, len(user_ids), self.user_block_size)
+        )
+
+        return self.evaluate_blocks(blocks, ground_truth, segments=segments)
+
+    def evaluate_blocks(
+        self,
+        blocks: Iterable[Tuple[np.ndarray, np.ndarray]],
+        ground_truth: Union[Dataset, sparse.spmatrix],
+        segments: Optional[Union[pd.Series, Dict]] = None,
+    ) -> Dict[str, float]:
+        """Evaluates an iterable of (user ids, user embeddings) blocks,
+        e.g. read batch by batch from the query embeddings of a model,
+        so the embeddings of all the users never need to be in memory.
+
+        See `evaluate` for the other parameters.
+        """
+        self._ground_truth = _to_csr(ground_truth)
+        if segments is not None and not isinstance(segments, pd.Series):
+            segments = pd.Series(segments)
+
+        def with_segments(blocks):
+            for user_ids, embeddings in blocks:
+                user_ids = np.asarray(user_ids)
+                labels = None if segments is None else segments.reindex(user_ids).to_numpy()
+                yield user_ids, np.asarray(embeddings, dtype=np.float32), labels
+
+        totals: Dict[object, np.ndarray] = {}
+        counts: Dict[object, int] = {}
+        for block_totals, block_counts in self._map_blocks(with_segments(blocks)):
+            for segment, total in block_totals.items():
+                totals[segment] = totals.get(segment, 0.0) + total
+                counts[segment] = counts.get(segment, 0) + block_counts[segment]
+
+        results: Dict[str, float] = {}
+        for segment in sorted(totals, key=lambda s: (s is not None, str(s))):
+            prefix = "" if segment is None else f"{segment}/"
+            averages = totals[segment] / max(counts[segment], 1)
+            for i, metric in enumerate(self.metrics):
+                for j, k in enumerate(self.top_ks):
+                    results[f"{prefix}{metric}@{k}"] = float(averages[i, j])
+            results[f"{prefix}num_users"] = counts[segment]
+
+        return results
+
+    def _map_blocks(self, blocks: Iterator) -> Iterator:
+        if self.num_workers <= 0:
+            for block in blocks:
+                yield self._evaluate_block(*block)
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(self.num_workers) as pool:
+            # Bounds the number of blocks in flight, so the users are streamed
+            pending = set()
+            for block in blocks:
+                if len(pending) >= 2 * self.num_workers:
+                    done, pending = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        yield future.result()
+                pending.add(pool.submit(self._evaluate_block, *block))
+            for future in concurrent.futures.as_completed(pending):
+                yield future.result()
+
+    def _evaluate_block(
+        self, user_ids: np.ndarray, embeddings: np.ndarray, segments: Optional[np.ndarray]
+    ) -> Tuple[Dict[object, np.ndarray], Dict[object, int]]:
+        # The rows of the block are a copy, which can be modified
+        ground_truth = csr_rows(self._ground_truth, user_ids)
+        ground_truth.eliminate_zeros()
+        relevant_counts = np.diff(ground_truth.indptr)
+        has_relevant = relevant_counts > 0
+        if not has_relevant.any():
+            return {}, {}
+
+        ground_truth, relevant_counts = ground_truth[has_relevant], relevant_counts[has_relevant]
+        top_k = self._top_k(user_ids[has_relevant], embeddings[has_relevant])
+        # The candidate item ids can be out of the columns of the ground-truth
+        top_k_ids = self.item_ids[top_k]
+        in_bounds = top_k_ids < ground_truth.shape[1]
+        hits = np.zeros(top_k.shape, dtype=np.float32)
+        rows = np.broadcast_to(np.arange(len(top_k))[:, None], top_k.shape)
+        hits[in_bounds] = np.asarray(ground_truth[rows[in_bounds], top_k_ids[in_bounds]]).ravel()
+        results = self._ranking_metrics((hits > 0).astype(np.float32), relevant_counts)
+
+        totals = {None: results.sum(axis=0)}
+        counts = {None: len(results)}
+        if segments is not None:
+            segments = segments[has_relevant]
+            for segment in pd.unique(segments):
+                if pd.isna(segment):
+                    continue
+                mask = segments == segment
+                totals[segment] = results[mask].sum(axis=0)
+                counts[segment] = int(mask.sum())
+
+        return totals, counts
+
+    def _top_k(self, user_ids: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
+        """Positions of the top-k items of each user, by decreasing score"""
+        exclude = None
+        if self.exclude is not None:
+            exclude = csr_rows(self.exclude, user_ids)
+            exclude.eliminate_zeros()
+
+        def mask_excluded(scores, start, end):
+            _mask_excluded(scores, exclude, self.item_ids[start:end])
+
+        positions, _ = blockwise_top_k(
+            embeddings,
+            self.item_embeddings,
+            self.k,
+            self.item_block_size,
+            mask_fn=mask_excluded if exclude is not None else None,
+        )
+
+        return positions
+
+    def _ranking_metrics(self, hits: np.ndarray, relevant_counts: np.ndarray) -> np.ndarray:
+        """Metrics of each user, with shape (num_users, num_metrics, num_ks)"""
+        ks = np.array(self.top_ks)
+        k_indices = np.minimum(ks, hits.shape[1]) - 1
+        positions = np.arange(1, hits.shape[1] + 1)
+
+        cumulative_hits = np.cumsum(hits, axis=1)
+        hits_at_ks = cumulative_hits[:, k_indices]
+        relevant_at_ks = np.minimum(relevant_counts[:, None], ks)
+
+        discounts = 1.0 / np.log2(positions + 1)
+        ideal_gains = np.concatenate([[0.0], np.cumsum(discounts)])[
+            np.minimum(relevant_at_ks, hits.shape[1])
+        ]
+        first_hit = np.where(hits.any(axis=1), hits.argmax(axis=1), hits.shape[1])[:, None]
+
+        results = {
+            "recall": hits_at_ks / relevant_at_ks,
+            "precision": hits_at_ks / ks,
+            "map": np.cumsum(cumulative_hits / positions * hits, axis=1)[:, k_indices]
+            / relevant_at_ks,
+            "mrr": np.where(first_hit <= k_indices, 1.0 / (first_hit + 1), 0.0),
+            "ndcg": np.cumsum(hits * discounts, axis=1)[:, k_indices] / ideal_gains,
+        }
+
+        return np.stack([results[metric] for metric in self.metrics], axis=1)
+
+
+class BinaryHistogram:
+    """Streaming and mergeable state of binary classification metrics (AUC, GAUC, log-loss).
+
+    The predicted probabilities are counted in `num_buckets` equal-width buckets, separately
+    for the positive and negative examples, so the AUC is computed from the histograms with
+    a resolution of 1 / `num_buckets`. For the group AUC (GAUC, e.g. the AUC per user
+    averaged over the users) the groups are hashed into `num_shards` shards, each one with
+    its own histograms, and the AUC of each shard is averaged weighted by its number of
+    examples. It is exact (up to the bucketing) when every group has its own shard, e.g. with
+    integer user ids lower than `num_shards`. The memory only depends on `num_buckets` and
+    `num_shards`, not on the size of the dataset.
+
+    States updated on different data (e.g. different files in a process pool, or the
+    `HistogramAUC` metrics of a model) are combined with `merge` or `+`::
+
+        def evaluate_file(path):
+            df = pd.read_parquet(path)
+            return BinaryHistogram(num_shards=4096).update(df.click, df.prediction, df.user_id)
+
+        with ProcessPoolExecutor() as pool:
+            histogram = sum(pool.map(evaluate_file, paths), BinaryHistogram(num_shards=4096))
+        histogram.auc(), histogram.gauc(), histogram.log_loss()
+
+    Parameters
+    ----------
+    num_buckets : int, optional
+        Number of buckets of the predicted probabilities, by default 1000
+    num_shards : int, optional
+        Number of shards the groups are hashed into for the GAUC, by default 1
+    """
+
+    def __init__(self, num_buckets: int = 1000, num_shards: int = 1):
+        self.num_buckets = num_buckets
+        self.num_shards = num_shards
+        self.positives = np.zeros((num_shards, num_buckets), dtype=np.float64)
+        self.negatives = np.zeros((num_shards, num_buckets), dtype=np.float64)
+        self.log_loss_sum = 0.0
+        self.weight_sum = 0.0
+
+    def update(
+        self,
+        y_true: np.ndarray,
+        y_pred: np.ndarray,
+        groups: Optional[np.ndarray] = None,
+        sample_weight: Optional[np.ndarray] = None,
+    ) -> "BinaryHistogram":
+        """Counts a batch of labels and predicted probabilities, with the group of each
+        example (required for the GAUC when `num_shards` > 1)."""
+        y_true = np.asarray(y_true, dtype=np.float64).reshape(-1)
+        y_pred = np.asarray(y_pred, dtype=np.float64).reshape(-1)
+        weights = (
+            np.ones_like(y_true)
+            if sample_weight is None
+            else np.broadcast_to(
+                np.asarray(sample_weight, dtype=np.float64).reshape(-1), y_true.shape
+            )
+        )
+        shards = np.zeros(len(y_true), dtype=np.int64)
+        if groups is not None and self.num_shards > 1:
+            shards = np.mod(np.asarray(groups).reshape(-1).astype(np.int64), self.num_shards)
+
+        buckets = histogram_buckets(y_pred, self.num_buckets)
+        np.add.at(self.positives, (shards, buckets), weights * y_true)
+        np.add.at(self.negatives, (shards, buckets), weights * (1.0 - y_true))
+
+        y_pred = np.clip(y_pred, _EPSILON, 1.0 - _EPSILON)
+        losses = y_true * np.log(y_pred) + (1.0 - y_true) * np.log(1.0 - y_pred)
+        self.log_loss_sum -= float(np.sum(weights * losses))
+        self.weight_sum += float(np.sum(weights))
+
+        return self
+
+    def merge(self, other: "BinaryHistogram") -> "BinaryHistogram":
+        """Adds the counts of `other`, which must have the same buckets and shards"""
+        if (other.num_buckets, other.num_shards) != (self.num_buckets, self.num_shards):
+            raise ValueError(
+                "Can't merge histograms with different buckets or shards: "
+                f"{(self.num_buckets, self.num_shards)} and "
+                f"{(other.num_buckets, other.num_shards)}"
+            )
+        self.positives += other.positives
+        self.negatives += other.negatives
+        self.log_loss_sum += other.log_loss_sum
+        self.weight_sum += other.weight_sum
+
+        return self
+
+    def __add__(self, other: "BinaryHistogram") -> "BinaryHistogram":
+        return self.copy().merge(other)
+
+    def copy(self) -> "BinaryHistogram":
+        histogram = BinaryHistogram(self.num_buckets, self.num_shards)
+
+        return histogram.merge(self)
+
+    def auc(self) -> float:
+        """AUC of all the examples"""
+        auc, _ = histogram_auc(self.positives.sum(axis=0), self.negatives.sum(axis=0))
+
+        return float(auc)
+
+    def gauc(self) -> float:
+        """AUC of each shard of groups, averaged weighted by the number of examples
+        of the shards with both positive and negative examples"""
+        aucs, weights = histogram_auc(self.positives, self.negatives)
+
+        return float(np.sum(aucs * weights) / max(np.sum(weights), 1e-12))
+
+    def log_loss(self) -> float:
+        return self.log_loss_sum / max(self.weight_sum, 1e-12)
+
+
+def histogram_buckets(y_pred: np.ndarray, num_buckets: int) -> np.ndarray:
+    """Equal-width bucket of each probability"""
+    buckets = (np.clip(y_pred, 0.0, 1.0) * num_buckets).astype(np.int64)
+
+    return np.minimum(buckets, num_buckets - 1)
+
+
+def histogram_auc(positives: np.ndarray, negatives: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """AUC from the histograms of the positive and negative examples (along the last axis),
+    counting the pairs in the same bucket as ties. Returns the AUCs and the number of
+    examples of the histograms with both positives and negatives (0 for the others)."""
+    negatives_below = np.cumsum(negatives, axis=-1) - negatives
+    area = np.sum(positives * (negatives_below + 0.5 * negatives), axis=-1)
+    num_positives, num_negatives = positives.sum(axis=-1), negatives.sum(axis=-1)
+    pairs = num_positives * num_negatives
+
+    aucs = np.where(pairs > 0, area / np.maximum(pairs, 1e-12), 0.0)
+    weights = np.where(pairs > 0, num_positives + num_negatives, 0.0)
+
+    return aucs, weights
+
+
+def embeddings_from_dataset(
+    dataset: Union[Dataset, pd.DataFrame],
+    id_column: str,
+    embedding_columns: Optional[List[str]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the ids and embeddings of a dataset of embeddings, like the output
+    of `RetrievalModel.query_embeddings` or `RetrievalModel.item_embeddings`.
+
+    The embedding columns default to the columns named by their position ("0", "1", ...).
+    """
+    df = dataset.to_ddf().compute() if isinstance(dataset, Dataset) else dataset
+    if embedding_columns is None:
+        embedding_columns = [col for col in df.columns if str(col).isdigit()]
+        embedding_columns = sorted(embedding_columns, key=int)
+
+    ids = to_numpy(df[id_column])
+    embeddings = np.stack([to_numpy(df[col]) for col in embedding_columns], axis=1)
+
+    return ids, embeddings.astype(np.float32)
+
+
+def _to_csr(data: Union[Dataset, sparse.spmatrix]) -> sparse.csr_matrix:
+    if isinstance(data, Dataset):
+        data = dataset_to_csr(data)
+
+    # Not copied (nor modified), e.g. the matrices cached by `dataset_to_csr`
+    return sparse.csr_matrix(data)
+
+
+def _mask_excluded(scores: np.ndarray, exclude: sparse.csr_matrix, item_ids: np.ndarray):
+    """Sets to -inf the scores of the excluded (user, item id) pairs"""
+    in_bounds = item_ids < exclude.shape[1]
+    columns = exclude[:, item_ids[in_bounds]].tocoo()
+    scores[columns.row, np.flatnonzero(in_bounds)[columns.col]] = -np.inf
@@ -0,0 +1,105 @@
+#
+# Copyright (c) 2022, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+from typing import Optional, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from merlin.core.dispatch import DataFrameType
+
+
+class ParquetBatchWriter:
+    """Appends DataFrame batches to a Parquet file, writing one row group per batch.
+
+    The data is written to a temporary file which is only renamed to `path`
+    once the writer is closed without errors, so a file found at `path`
+    is always complete.
+
+    Parameters
+    ----------
+    path: str
+        Path of the Parquet file to write.
+    compression: str
+        Parquet compression codec. Defaults to "snappy".
+    """
+
+    def __init__(self, path: str, compression: str = "snappy"):
+        self.path = path
+        self.compression = compression
+        self.num_rows = 0
+        self._tmp_path = f"{path}.tmp"
+        self._writer: Optional[pq.ParquetWriter] = None
+
+    def write(self, df: Union[DataFrameType, pa.Table]) -> None:
+        table = df if isinstance(df, pa.Table) else _to_arrow_table(df)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(
+                self._tmp_path, table.schema, compression=self.compression
+            )
+        elif not table.schema.equals(self._writer.schema):
+            table = table.cast(self._writer.schema)
+        self._writer.write_table(table)
+        self.num_rows += table.num_rows
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self) -> "ParquetBatchWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _to_arrow_table(df: DataFrameType) -> pa.Table:
+    if hasattr(df, "to_arrow"):
+        # cudf
+        return df.to_arrow(preserve_index=False)
+
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def recommendations_table(
+    ids: np.ndarray, item_ids: np.ndarray, scores: np.ndarray, id_column: str
+) -> pa.Table:
+    """Arrow table of `(id_column, item_ids, scores)` rows, from the (num_queries, k)
+    arrays of the recommended item ids and scores of each query id"""
+    num_rows, k = item_ids.shape
+    offsets = np.arange(0, (num_rows + 1) * k, k, dtype=np.int32)
+
+    return pa.Table.from_arrays(
+        [
+            pa.array(ids),
+            pa.ListArray.from_arrays(offsets, pa.array(item_ids.reshape(-1))),
+            pa.ListArray.from_arrays(offsets, pa.array(scores.reshape(-1))),
+        ],
+        names=[id_column, "item_ids", "scores"],
+    )
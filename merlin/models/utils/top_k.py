@@ -0,0 +1,91 @@
+#
+# Copyright (c) 2022, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+
+def blockwise_top_k(
+    queries: np.ndarray,
+    candidates: np.ndarray,
+    k: int,
+    block_size: Optional[int] = None,
+    biases: Optional[np.ndarray] = None,
+    mask_fn: Optional[Callable[[np.ndarray, int, int], None]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k of the dot-product scores between the queries and the candidates,
+    keeping a running top-k while scoring `block_size` candidates at a time,
+    so the memory is bounded by `len(queries) * (block_size + k)` scores.
+
+    Parameters
+    ----------
+    queries : np.ndarray
+        The (num_queries, dim) query vectors
+    candidates : np.ndarray
+        The (num_candidates, dim) candidate vectors
+    k : int
+        The number of candidates to keep for each query
+    block_size : int, optional
+        Number of candidates scored at a time, by default all of them
+    biases : np.ndarray, optional
+        The (num_candidates,) biases added to the scores, by default None
+    mask_fn : Callable[[np.ndarray, int, int], None], optional
+        Called with the scores of each block of candidates and the block's
+        `start` and `end` positions, to mask scores in place (e.g. with -inf)
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        The (num_queries, min(k, num_candidates)) arrays of the positions of the
+        candidates and of their scores, by decreasing score
+    """
+    num_candidates = len(candidates)
+    block_size = block_size or max(num_candidates, 1)
+    top_positions = np.empty((len(queries), 0), dtype=np.int64)
+    top_scores = np.empty((len(queries), 0), dtype=np.float32)
+
+    for start in range(0, num_candidates, block_size):
+        end = min(start + block_size, num_candidates)
+        scores = queries @ candidates[start:end].T
+        if biases is not None:
+            scores += biases[start:end]
+        if mask_fn is not None:
+            mask_fn(scores, start, end)
+
+        positions = np.broadcast_to(np.arange(start, end), scores.shape)
+        top_positions, top_scores = select_top_k(
+            np.concatenate([top_positions, positions], axis=1),
+            np.concatenate([top_scores, scores], axis=1),
+            k,
+        )
+
+    return sort_top_k(top_positions, top_scores)
+
+
+def select_top_k(ids: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Keeps the (unordered) k highest scores of each row, and their ids"""
+    if scores.shape[1] <= k:
+        return ids, scores
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+    return np.take_along_axis(ids, idx, axis=1), np.take_along_axis(scores, idx, axis=1)
+
+
+def sort_top_k(ids: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorts each row by decreasing score, keeping the ties in their original order"""
+    order = np.argsort(-scores, axis=1, kind="stable")
+
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
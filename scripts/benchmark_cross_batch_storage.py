@@ -0,0 +1,64 @@
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import merlin.models.tf as ml
+
+
+def storage_bytes(queue: ml.FIFOQueue) -> int:
+    variables = [queue.storage] + ([queue.scales] if queue.scales is not None else [])
+
+    return sum(int(np.prod(var.shape)) * var.dtype.size for var in variables)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Memory, retrieval recall and throughput of the item embeddings cache "
+        "of CachedCrossBatchSampler for different storage dtypes"
+    )
+    parser.add_argument("--capacity", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--num-queries", type=int, default=1024)
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--dtypes", nargs="+", default=["float32", "float16", "bfloat16", "int8"])
+    args = parser.parse_args()
+
+    item_embeddings = tf.math.l2_normalize(tf.random.normal((args.capacity, args.dim)), axis=-1)
+    queries = tf.math.l2_normalize(tf.random.normal((args.num_queries, args.dim)), axis=-1)
+    _, exact_top_k = tf.math.top_k(tf.matmul(queries, item_embeddings, transpose_b=True), args.k)
+    exact_top_k = exact_top_k.numpy()
+
+    for dtype in args.dtypes:
+        queue = ml.FIFOQueue(args.capacity, dtype=tf.float32, dims=[args.dim], storage_dtype=dtype)
+        for start in range(0, args.capacity, args.batch_size):
+            queue.enqueue_many(item_embeddings[start : start + args.batch_size])
+        cached = queue.list_all()
+
+        max_error = float(tf.reduce_max(tf.abs(cached - item_embeddings)))
+        _, top_k = tf.math.top_k(tf.matmul(queries, cached, transpose_b=True), args.k)
+        recall = np.mean(
+            [len(np.intersect1d(a, b)) / args.k for a, b in zip(top_k.numpy(), exact_top_k)]
+        )
+
+        @tf.function
+        def step(embeddings):
+            queue.enqueue_many(embeddings)
+            return tf.reduce_sum(queue.list_all())
+
+        batch = item_embeddings[: args.batch_size]
+        step(batch)
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            step(batch)
+        seconds = time.perf_counter() - start
+
+        print(
+            f"{dtype}: {storage_bytes(queue) / 2**20:.1f} MiB, "
+            f"recall@{args.k}={recall:.4f}, max abs error={max_error:.2e}, "
+            f"{args.steps / seconds:.1f} enqueue+sample steps/s "
+            f"(capacity={args.capacity}, dim={args.dim})"
+        )
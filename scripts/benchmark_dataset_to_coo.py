@@ -0,0 +1,55 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from merlin.io import Dataset
+from merlin.models.utils.dataset import dataset_to_coo
+from merlin.schema import ColumnSchema, Schema, Tags
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Peak memory of converting a parquet dataset of interactions "
+        "to a scipy matrix, relative to the size of the final CSR matrix"
+    )
+    parser.add_argument("--num-rows", type=int, default=10_000_000)
+    parser.add_argument("--num-files", type=int, default=20)
+    parser.add_argument("--num-users", type=int, default=1_000_000)
+    parser.add_argument("--num-items", type=int, default=100_000)
+    parser.add_argument("--num-workers", type=int, default=1)
+    args = parser.parse_args()
+
+    schema = Schema(
+        [
+            ColumnSchema("user_id", tags=[Tags.USER_ID], dtype=np.int64),
+            ColumnSchema("item_id", tags=[Tags.ITEM_ID], dtype=np.int64),
+        ]
+    )
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        rows_per_file = args.num_rows // args.num_files
+        for i in range(args.num_files):
+            pd.DataFrame(
+                {
+                    "user_id": rng.integers(0, args.num_users, rows_per_file),
+                    "item_id": rng.integers(0, args.num_items, rows_per_file),
+                }
+            ).to_parquet(os.path.join(tmpdir, f"part_{i}.parquet"))
+        dataset = Dataset(os.path.join(tmpdir, "*.parquet"), engine="parquet", schema=schema)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        matrix = dataset_to_coo(dataset, num_workers=args.num_workers).tocsr()
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    csr_bytes = matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    print(
+        f"{seconds:.2f} s, peak {peak / 2**20:.0f} MiB, final CSR {csr_bytes / 2**20:.0f} MiB "
+        f"({peak / csr_bytes:.2f}x, num_rows={args.num_rows}, num_workers={args.num_workers})"
+    )
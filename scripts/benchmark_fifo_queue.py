@@ -0,0 +1,43 @@
+import argparse
+import time
+
+import tensorflow as tf
+
+import merlin.models.tf as ml
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Throughput of FIFOQueue.enqueue_many inside tf.function"
+    )
+    parser.add_argument("--capacities", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--batch-size", type=int, default=8192)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--steps", type=int, default=100)
+    args = parser.parse_args()
+
+    for capacity in args.capacities:
+        embeddings_queue = ml.FIFOQueue(capacity, dtype=tf.float32, dims=[args.dim])
+        ids_queue = ml.FIFOQueue(capacity, dtype=tf.int64)
+
+        @tf.function
+        def enqueue(embeddings, ids):
+            embeddings_queue.enqueue_many(embeddings)
+            ids_queue.enqueue_many(ids)
+            return ids_queue.index_of(ids)
+
+        embeddings = tf.random.uniform((args.batch_size, args.dim))
+        ids = tf.random.uniform((args.batch_size,), maxval=10 * capacity, dtype=tf.int64)
+
+        # Warm-up (tracing)
+        enqueue(embeddings, ids)
+
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            enqueue(embeddings, ids)
+        seconds = time.perf_counter() - start
+
+        print(
+            f"capacity={capacity}: {args.steps / seconds:.1f} steps/s, "
+            f"{args.steps * args.batch_size / seconds:.0f} examples/s "
+            f"(batch_size={args.batch_size}, dim={args.dim})"
+        )
@@ -0,0 +1,47 @@
+import argparse
+import time
+
+import numpy as np
+from scipy import sparse
+
+from merlin.models.lightfm import LightFM
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Latency of the top-k recommendations of LightFM, "
+        "with predict over all the (user, item) pairs versus the blocked recommend"
+    )
+    parser.add_argument("--num-users", type=int, default=2_000)
+    parser.add_argument("--num-items", type=int, default=20_000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-threads", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--item-block-size", type=int, default=65_536)
+    args = parser.parse_args()
+
+    interactions = sparse.random(
+        args.num_users, args.num_items, density=0.001, format="csr", random_state=0
+    )
+    model = LightFM(loss="warp", num_threads=args.num_threads)
+    model.lightfm_model.fit(interactions, epochs=1, num_threads=args.num_threads)
+    users = np.arange(args.num_users)
+
+    start = time.perf_counter()
+    scores = model.lightfm_model.predict(
+        np.repeat(users, args.num_items),
+        np.tile(np.arange(args.num_items), args.num_users),
+        num_threads=args.num_threads,
+    ).reshape(args.num_users, args.num_items)
+    np.argpartition(-scores, args.k - 1, axis=1)[:, : args.k]
+    predict_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.recommend(
+        users, k=args.k, batch_size=args.batch_size, item_block_size=args.item_block_size
+    )
+    recommend_seconds = time.perf_counter() - start
+
+    print(
+        f"predict over pairs: {predict_seconds:.2f} s, recommend: {recommend_seconds:.2f} s "
+        f"(num_users={args.num_users}, num_items={args.num_items}, k={args.k})"
+    )
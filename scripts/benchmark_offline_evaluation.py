@@ -0,0 +1,55 @@
+import argparse
+import time
+
+import numpy as np
+from scipy import sparse
+
+from merlin.models.utils.evaluation import StreamingRetrievalEvaluator
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Throughput of the streaming offline retrieval evaluator "
+        "for different numbers of worker processes"
+    )
+    parser.add_argument("--num-users", type=int, default=100_000)
+    parser.add_argument("--num-items", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--interactions-per-user", type=int, default=5)
+    parser.add_argument("--top-ks", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--user-block-size", type=int, default=1024)
+    parser.add_argument("--item-block-size", type=int, default=16_384)
+    parser.add_argument("--num-workers", type=int, nargs="+", default=[0, 2, 4])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    user_embeddings = rng.normal(size=(args.num_users, args.dim)).astype(np.float32)
+    item_embeddings = rng.normal(size=(args.num_items, args.dim)).astype(np.float32)
+    rows = np.repeat(np.arange(args.num_users), args.interactions_per_user)
+    ground_truth = sparse.coo_matrix(
+        (np.ones(len(rows)), (rows, rng.integers(0, args.num_items, len(rows)))),
+        shape=(args.num_users, args.num_items),
+    )
+    segments = rng.choice(["low", "medium", "high"], args.num_users)
+
+    for num_workers in args.num_workers:
+        evaluator = StreamingRetrievalEvaluator(
+            item_embeddings,
+            top_ks=args.top_ks,
+            user_block_size=args.user_block_size,
+            item_block_size=args.item_block_size,
+            num_workers=num_workers,
+        )
+        start = time.perf_counter()
+        results = evaluator.evaluate(
+            np.arange(args.num_users),
+            user_embeddings,
+            ground_truth,
+            segments=dict(enumerate(segments)),
+        )
+        seconds = time.perf_counter() - start
+
+        print(
+            f"num_workers={num_workers}: {args.num_users / seconds:.0f} users/s, "
+            f"recall@{args.top_ks[-1]}={results[f'recall@{args.top_ks[-1]}']:.4f} "
+            f"(num_items={args.num_items}, dim={args.dim})"
+        )
@@ -0,0 +1,50 @@
+import argparse
+import time
+
+import tensorflow as tf
+
+import merlin.models.tf as ml
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Latency of updating the ranking metrics at several cut-offs, "
+        "one metric per k versus the fused TopKMetricsBundle"
+    )
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--num-items", type=int, default=100_000)
+    parser.add_argument("--top-ks", type=int, nargs="+", default=[5, 10, 20, 50])
+    parser.add_argument("--steps", type=int, default=10)
+    args = parser.parse_args()
+
+    predictions = tf.random.uniform((args.batch_size, args.num_items))
+    labels = tf.one_hot(
+        tf.random.uniform((args.batch_size,), maxval=args.num_items, dtype=tf.int32),
+        args.num_items,
+    )
+
+    def separate_metrics():
+        metrics = ml.ranking_metrics(args.top_ks)
+        for metric in metrics:
+            metric.pre_sorted = False
+        return metrics
+
+    for name, metrics in [
+        ("separate", separate_metrics()),
+        ("fused", [ml.TopKMetricsBundle(args.top_ks, pre_sorted=False)]),
+    ]:
+
+        @tf.function
+        def update(y_true, y_pred):
+            return [metric.update_state(y_true, y_pred) for metric in metrics]
+
+        update(labels, predictions)
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            update(labels, predictions)
+        [metric.result() for metric in metrics]
+        seconds = (time.perf_counter() - start) / args.steps
+
+        print(
+            f"{name}: {seconds * 1000:.2f} ms/step ({len(metrics)} metric objects, "
+            f"batch_size={args.batch_size}, num_items={args.num_items}, top_ks={args.top_ks})"
+        )
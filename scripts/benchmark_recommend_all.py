@@ -0,0 +1,55 @@
+import argparse
+import tempfile
+import time
+
+import merlin.models.tf as ml
+from merlin.io.dataset import Dataset
+from merlin.schema import Tags
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Throughput of RetrievalModel.recommend_all on the synthetic e-commerce data"
+    )
+    parser.add_argument("--num-rows", type=int, default=100_000)
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--block-size", type=int, default=None)
+    parser.add_argument("--num-workers", type=int, default=1)
+    parser.add_argument("--partitions", type=int, default=4)
+    args = parser.parse_args()
+
+    data = ml.SyntheticData("e-commerce", num_rows=args.num_rows)
+    model = ml.TwoTowerModel(data.schema, query_tower=ml.MLPBlock([128, 64]))
+    model.compile(optimizer="adam")
+    model.fit(data.tf_dataloader(batch_size=1024), epochs=1, verbose=0)
+
+    item_features = data.schema.select_by_tag(Tags.ITEM).column_names
+    item_id = data.schema.select_by_tag(Tags.ITEM_ID).first.name
+    items = Dataset(data.dataframe[item_features].drop_duplicates(item_id))
+    users = Dataset(data.dataframe, schema=data.schema, npartitions=args.partitions)
+
+    start = time.perf_counter()
+    index = ml.TopKIndexBlock.from_block(
+        model.retrieval_block.item_block(), data=items, k=args.k, block_size=args.block_size
+    )
+    index_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as output_path:
+        start = time.perf_counter()
+        recommendations = model.recommend_all(
+            users,
+            k=args.k,
+            output_path=output_path,
+            batch_size=args.batch_size,
+            index=index,
+            num_workers=args.num_workers,
+        )
+        seconds = time.perf_counter() - start
+        num_users = len(recommendations.to_ddf())
+
+    print(f"index: {index.values.shape[0]} items in {index_seconds:.2f}s")
+    print(
+        f"recommend_all: {num_users} users in {seconds:.2f}s "
+        f"({num_users / seconds:.0f} users/s, k={args.k}, batch_size={args.batch_size}, "
+        f"block_size={args.block_size}, num_workers={args.num_workers})"
+    )
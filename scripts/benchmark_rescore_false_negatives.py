@@ -0,0 +1,58 @@
+import argparse
+import time
+
+import tensorflow as tf
+
+from merlin.models.tf.utils import tf_utils
+
+METHODS = {
+    "dense": tf_utils.rescore_false_negatives,
+    "sorted": tf_utils.rescore_false_negatives_sorted,
+}
+
+
+def temporaries_bytes(method: str, batch_size: int, num_negatives: int) -> int:
+    """Size of the temporary tensors, besides the (batch_size, num_negatives) scores"""
+    if method == "dense":
+        # Equality mask and ones_like(scores)
+        return batch_size * num_negatives * (1 + 4)
+    # argsort indices and sorted ids, search ranges and false negatives indices
+    return num_negatives * (4 + 8) + batch_size * 3 * 8
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Latency of the removal of accidental hits (false negatives) "
+        "with the dense equality mask and the sorted search"
+    )
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument(
+        "--num-negatives", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--num-items", type=int, default=10_000_000)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--methods", nargs="+", default=list(METHODS), choices=list(METHODS))
+    args = parser.parse_args()
+
+    for num_negatives in args.num_negatives:
+        positive_ids = tf.random.uniform((args.batch_size,), maxval=args.num_items, dtype=tf.int64)
+        neg_ids = tf.random.uniform((num_negatives,), maxval=args.num_items, dtype=tf.int64)
+        # Making sure there are accidental hits
+        neg_ids = tf.concat([positive_ids, neg_ids[args.batch_size :]], axis=0)
+        scores = tf.random.uniform((args.batch_size, num_negatives))
+
+        for method in args.methods:
+            rescore = tf.function(METHODS[method])
+            rescore(positive_ids, neg_ids, scores, -1e9)
+
+            start = time.perf_counter()
+            for _ in range(args.steps):
+                output = rescore(positive_ids, neg_ids, scores, -1e9)
+            output.numpy()
+            seconds = (time.perf_counter() - start) / args.steps
+
+            temporaries = temporaries_bytes(method, args.batch_size, num_negatives) / 2**20
+            print(
+                f"negatives={num_negatives} {method}: {seconds * 1000:.2f} ms/step, "
+                f"~{temporaries:.1f} MiB of temporaries (batch_size={args.batch_size})"
+            )
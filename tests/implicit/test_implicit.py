@@ -13,6 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import os
+
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
 from merlin.io import Dataset
 from merlin.models.data.synthetic import SyntheticData
 from merlin.models.implicit import AlternatingLeastSquares
@@ -30,3 +36,68 @@ def test_alternating_least_squares(music_streaming_data: SyntheticData):
     metrics = model.evaluate(dataset)
 
     assert all(metric >= 0 for metric in metrics.values())
+
+
+def test_alternating_least_squares_recommend(music_streaming_data: SyntheticData, tmpdir):
+    music_streaming_data._schema = music_streaming_data.schema.remove_by_tag(Tags.TARGET)
+    dataset = Dataset(music_streaming_data.dataframe, schema=music_streaming_data.schema)
+
+    model = AlternatingLeastSquares(factors=16, iterations=5)
+    model.fit(dataset)
+    user_ids = np.flatnonzero(np.diff(model.train_data.indptr))
+
+    item_ids, scores = model.recommend(user_ids, k=5)
+    assert item_ids.shape == scores.shape == (len(user_ids), 5)
+    # The items of the users in the training data are filtered
+    seen = model.train_data[user_ids].toarray()
+    assert not seen[np.arange(len(user_ids))[:, None], item_ids].any()
+
+    # Batches written to parquet on a thread pool
+    output_path = str(tmpdir.join("recommendations.parquet"))
+    assert (
+        model.recommend(user_ids, k=5, batch_size=7, num_workers=2, output_path=output_path) is None
+    )
+    recommendations = pq.read_table(output_path)
+    assert recommendations.num_rows == len(user_ids)
+    assert pq.ParquetFile(output_path).num_row_groups == -(-len(user_ids) // 7)
+    np.testing.assert_array_equal(recommendations["user_id"].to_numpy(), user_ids)
+    np.testing.assert_array_equal(np.stack(recommendations["item_ids"].to_numpy()), item_ids)
+    np.testing.assert_allclose(np.stack(recommendations["scores"].to_numpy()), scores, rtol=1e-5)
+
+    # predict doesn't filter by default, and keeps the order of the users in the dataset
+    dataset_user_ids = music_streaming_data.dataframe["user_id"].unique()
+    predicted_ids, _ = model.predict(dataset, k=5)
+    expected_ids, _ = model.recommend(dataset_user_ids, k=5, filter_already_liked_items=False)
+    np.testing.assert_array_equal(predicted_ids, expected_ids)
+    seen = model.train_data[dataset_user_ids].toarray()
+    assert seen[np.arange(len(dataset_user_ids))[:, None], predicted_ids].any()
+
+
+def test_alternating_least_squares_recommend_interrupted(
+    music_streaming_data: SyntheticData, tmpdir
+):
+    music_streaming_data._schema = music_streaming_data.schema.remove_by_tag(Tags.TARGET)
+    dataset = Dataset(music_streaming_data.dataframe, schema=music_streaming_data.schema)
+    model = AlternatingLeastSquares(factors=16, iterations=5)
+    model.fit(dataset)
+    user_ids = np.flatnonzero(np.diff(model.train_data.indptr))
+
+    recommend = model.implicit_model.recommend
+    num_batches = [0]
+
+    def failing_recommend(*args, **kwargs):
+        num_batches[0] += 1
+        if num_batches[0] == 3:
+            raise RuntimeError("interrupted")
+        return recommend(*args, **kwargs)
+
+    model.implicit_model.recommend = failing_recommend
+    output_path = str(tmpdir.join("recommendations.parquet"))
+    with pytest.raises(RuntimeError):
+        model.recommend(user_ids, k=5, batch_size=7, output_path=output_path)
+    # No truncated file is left behind
+    assert os.listdir(str(tmpdir)) == []
+
+    model.implicit_model.recommend = recommend
+    model.recommend(user_ids, k=5, batch_size=7, output_path=output_path, user_id_column="uid")
+    assert pq.read_table(output_path).column_names == ["uid", "item_ids", "scores"]
@@ -13,9 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import numpy as np
+
 from merlin.io import Dataset
 from merlin.models.data.synthetic import SyntheticData
-from merlin.models.lightfm import LightFM
+from merlin.models.lightfm import LightFM, _with_shape
+from merlin.models.utils.dataset import dataset_to_csr
 from merlin.schema import Tags
 
 
@@ -27,3 +30,66 @@ def test_warp(music_streaming_data: SyntheticData):
     model.fit(dataset)
 
     model.predict(dataset)
+
+
+def test_warp_recommend(music_streaming_data: SyntheticData):
+    music_streaming_data._schema = music_streaming_data.schema.remove_by_tag(Tags.TARGET)
+    dataset = Dataset(music_streaming_data.dataframe, schema=music_streaming_data.schema)
+
+    model = LightFM(learning_rate=0.05, loss="warp", epochs=5, num_threads=2)
+    model.fit(dataset)
+    users = np.arange(20)
+    num_items = model.train_data.shape[1]
+    all_scores = np.stack(
+        [
+            model.lightfm_model.predict(np.full(num_items, user), np.arange(num_items))
+            for user in users
+        ]
+    )
+
+    item_ids, scores = model.recommend(users, k=5, batch_size=8, item_block_size=50)
+    assert item_ids.shape == scores.shape == (len(users), 5)
+    np.testing.assert_allclose(scores, -np.sort(-all_scores, axis=1)[:, :5], rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(
+        np.take_along_axis(all_scores, item_ids, axis=1), scores, rtol=1e-5, atol=1e-6
+    )
+
+    # Candidate subsets, with users having less than k candidates
+    candidates = [np.arange(10), np.array([3, 7]), np.array([], dtype=np.int64)]
+    item_ids, scores = model.recommend(users[:3], k=5, candidates=candidates)
+    assert set(item_ids[0]) <= set(range(10))
+    np.testing.assert_allclose(scores[0], -np.sort(-all_scores[0, :10])[:5], rtol=1e-5, atol=1e-6)
+    assert sorted(item_ids[1, :2]) == [3, 7] and (item_ids[1, 2:] == -1).all()
+    assert (item_ids[2] == -1).all() and np.isneginf(scores[2]).all()
+
+    # Chunking the candidates of a batch doesn't change the recommendations
+    chunked_ids, chunked_scores = model.recommend(
+        users[:3], k=5, candidates=candidates, item_block_size=1
+    )
+    np.testing.assert_array_equal(chunked_ids, item_ids)
+    np.testing.assert_allclose(chunked_scores, scores)
+
+
+def test_warp_evaluate(music_streaming_data: SyntheticData):
+    music_streaming_data._schema = music_streaming_data.schema.remove_by_tag(Tags.TARGET)
+    df = music_streaming_data.dataframe
+    is_train = (df["user_id"] + df["item_id"]) % 2 == 0
+    model = LightFM(learning_rate=0.05, loss="warp", epochs=5)
+    model.fit(Dataset(df[is_train], schema=music_streaming_data.schema))
+
+    # Not seen in training, with fewer users and items than in training
+    test_df = df[~is_train]
+    num_users, num_items = model.train_data.shape
+    test_df = test_df[(test_df["user_id"] < num_users - 1) & (test_df["item_id"] < num_items - 1)]
+    test_dataset = Dataset(test_df, schema=music_streaming_data.schema)
+    test = dataset_to_csr(test_dataset)
+    resized = _with_shape(test, model.train_data.shape)
+    assert resized.shape == model.train_data.shape
+    assert np.shares_memory(resized.data, test.data)
+
+    expected = test.copy()
+    expected.resize(model.train_data.shape)
+    assert (resized != expected).nnz == 0
+
+    metrics = model.evaluate(test_dataset, k=5)
+    assert set(metrics) == {"precisions@5", "auc@5"}
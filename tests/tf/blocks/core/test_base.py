@@ -14,8 +14,11 @@
 # limitations under the License.
 #
 
+import tensorflow as tf
+
 import merlin.models.tf as ml
 from merlin.models.data.synthetic import SyntheticData
+from merlin.models.tf.blocks.core.base import BlockContext
 
 
 def test_sequential_block_yoochoose(testing_data: SyntheticData):
@@ -24,3 +27,29 @@ def test_sequential_block_yoochoose(testing_data: SyntheticData):
     outputs = body(testing_data.tf_tensor_dict)
 
     assert list(outputs.shape) == [100, 64]
+
+
+def test_block_context_shared_top_k():
+    context = BlockContext()
+    queries = tf.random.uniform((8, 4))
+    candidates = tf.random.uniform((100, 4))
+    calls = []
+
+    def top_k_fn(queries, k):
+        calls.append(k)
+        return tf.math.top_k(tf.matmul(queries, candidates, transpose_b=True), k=k)
+
+    scores, indices = context.shared_top_k(queries, candidates, 10, top_k_fn)
+    # A lower k for the same batch
+    scores_5, indices_5 = context.shared_top_k(queries, candidates, 5, top_k_fn)
+    assert calls == [10]
+    tf.debugging.assert_equal(scores_5, scores[:, :5])
+    tf.debugging.assert_equal(indices_5, indices[:, :5])
+
+    # Other queries (even with the same values) or candidates, a higher k, or the next batch
+    context.shared_top_k(tf.identity(queries), candidates, 10, top_k_fn)
+    context.shared_top_k(queries, tf.identity(candidates), 10, top_k_fn)
+    context.shared_top_k(queries, candidates, 20, top_k_fn)
+    context.call({})
+    context.shared_top_k(queries, candidates, 10, top_k_fn)
+    assert calls == [10, 10, 10, 20, 10]
@@ -14,7 +14,9 @@
 # limitations under the License.
 #
 
+import numpy as np
 import pytest
+import tensorflow as tf
 
 import merlin.models.tf as ml
 from merlin.io.dataset import Dataset
@@ -42,6 +44,12 @@ def test_topk_index(ecommerce_data: SyntheticData):
     _, top_indices = recommender(batch, k=10)
     assert top_indices.shape[-1] == 10
 
+    exclude_ids = tf.RaggedTensor.from_tensor(top_indices[:, :5])
+    _, filtered_top_indices = recommender(batch, k=10, exclude_ids=exclude_ids)
+    assert filtered_top_indices.shape[-1] == 10
+    for row_ids, row_exclude_ids in zip(filtered_top_indices.numpy(), exclude_ids.to_list()):
+        assert not set(row_ids) & set(row_exclude_ids)
+
 
 def test_topk_index_duplicate_indices(ecommerce_data: SyntheticData):
     model: ml.RetrievalModel = ml.TwoTowerModel(
@@ -57,3 +65,81 @@ def test_topk_index_duplicate_indices(ecommerce_data: SyntheticData):
     with pytest.raises(ValueError) as excinfo:
         _ = model.to_top_k_recommender(item_dataset, k=20)
     assert "Please make sure that `data` contains unique indices" in str(excinfo.value)
+
+
+@pytest.mark.parametrize("block_size", [None, 7])
+def test_topk_index_exclude_ids(block_size):
+    num_candidates, k = 30, 5
+    values = tf.random.uniform((num_candidates, 8))
+    ids = tf.constant(np.random.permutation(num_candidates) + 100, dtype=tf.int64)
+    index = ml.TopKIndexBlock(k=k, values=values, ids=ids, block_size=block_size)
+    queries = tf.random.uniform((3, 8))
+
+    _, top_ids = index(queries)
+    exclude_ids = tf.ragged.constant([top_ids[0, :3].numpy().tolist(), [], [1, 2]], tf.int64)
+    top_scores, excluded_top_ids = index(queries, exclude_ids=exclude_ids)
+
+    scores = tf.matmul(queries, values, transpose_b=True).numpy()
+    id_to_position = {id_: pos for pos, id_ in enumerate(ids.numpy())}
+    for row, row_exclude_ids in enumerate(exclude_ids.to_list()):
+        for id_ in row_exclude_ids:
+            if id_ in id_to_position:
+                scores[row, id_to_position[id_]] = -np.inf
+    expected_ids = ids.numpy()[np.argsort(-scores, axis=1)[:, :k]]
+
+    assert excluded_top_ids.shape == (3, k)
+    np.testing.assert_array_equal(excluded_top_ids.numpy(), expected_ids)
+    np.testing.assert_allclose(top_scores.numpy(), np.sort(scores, axis=1)[:, ::-1][:, :k])
+    assert not set(top_ids[0, :3].numpy()) & set(excluded_top_ids[0].numpy())
+
+    mask = np.zeros((3, num_candidates), dtype=bool)
+    mask[0, [id_to_position[id_] for id_ in top_ids[0, :3].numpy()]] = True
+    _, mask_top_ids = index(queries, exclude_ids=tf.constant(mask))
+    np.testing.assert_array_equal(mask_top_ids.numpy(), expected_ids)
+
+
+@pytest.mark.parametrize("block_size", [4, 7, 29])
+def test_topk_index_blockwise_in_graph(block_size):
+    num_candidates, k = 30, 10
+    values = tf.random.uniform((num_candidates, 8))
+    index = ml.TopKIndexBlock(k=k, values=values, block_size=block_size)
+    full_index = ml.TopKIndexBlock(k=k, values=values)
+    queries = tf.random.uniform((3, 8))
+    exclude_ids = tf.ragged.constant([[0, 5, 29], [], [12]], tf.int64)
+
+    @tf.function(
+        input_signature=[tf.TensorSpec([None, 8]), tf.RaggedTensorSpec([None, None], tf.int64)]
+    )
+    def top_k(queries, exclude_ids):
+        return index(queries, exclude_ids=exclude_ids)
+
+    top_scores, top_ids = top_k(queries, exclude_ids)
+    expected_scores, expected_ids = full_index(queries, exclude_ids=exclude_ids)
+
+    np.testing.assert_array_equal(top_ids.numpy(), expected_ids.numpy())
+    np.testing.assert_allclose(top_scores.numpy(), expected_scores.numpy(), rtol=1e-6)
+
+
+@pytest.mark.parametrize("block_size", [None, 4])
+def test_topk_index_k_larger_than_num_candidates(block_size):
+    values = tf.random.uniform((6, 8))
+    index = ml.TopKIndexBlock(k=10, values=values, block_size=block_size)
+
+    top_scores, top_ids = index(tf.random.uniform((3, 8)))
+
+    assert top_scores.shape == (3, 6) and top_ids.shape == (3, 6)
+    np.testing.assert_array_equal(np.sort(top_ids.numpy(), axis=1), np.tile(np.arange(6), (3, 1)))
+
+
+def test_topk_index_update():
+    index = ml.TopKIndexBlock(k=2, values=tf.random.uniform((6, 8)), ids=tf.range(10, 16))
+    values = tf.one_hot([3, 1, 2], 8)
+
+    index.update(values, ids=tf.constant([20, 21, 22]))
+    _, top_ids = index(tf.one_hot([1, 2], 8))
+    np.testing.assert_array_equal(top_ids.numpy()[:, 0], [21, 22])
+
+    # Without ids, the ids are the positions of the candidates
+    index.update(values)
+    _, top_ids = index(tf.one_hot([1], 8))
+    np.testing.assert_array_equal(top_ids.numpy()[:, 0], [1])
@@ -14,6 +14,7 @@
 # limitations under the License.
 #
 
+import numpy as np
 import pytest
 import tensorflow as tf
 
@@ -177,3 +178,40 @@ def test_categorical_one_hot_encoding():
     assert list(outputs["cat3"].shape) == [NUM_ROWS, MAX_LEN, 51]
 
     assert inputs["cat1"][0].numpy() == tf.where(outputs["cat1"][0, :] == 1).numpy()[0]
+
+
+def test_item_frequency_estimator():
+    estimator = ml.ItemFrequencyEstimator(num_buckets=100, alpha=0.1)
+    for step in range(200):
+        # Item 1 is in every batch, item 2 in every 4 batches (starting at step 100)
+        # and item 3 is never seen
+        item_ids = [1, 2] if step >= 100 and step % 4 == 0 else [1, 1]
+        outputs = estimator({"item_id": tf.constant(item_ids)}, training=True)
+
+    buckets = estimator._buckets(tf.range(1000)).numpy()
+    colliding_id = int(np.flatnonzero(buckets == buckets[1])[1])
+    probs = estimator.probability(tf.constant([1, 2, 3, colliding_id])).numpy()
+    # Item 2 is estimated from its second hit, regardless of the steps before its first hit
+    np.testing.assert_allclose(probs[:2], [1.0, 0.25], rtol=0.05)
+    # Item 3 was seen at most once in 200 steps
+    np.testing.assert_allclose(probs[2], 1 / 200)
+    assert probs[3] == probs[0]
+
+    assert set(outputs.keys()) == {"item_id", "popularity"}
+    tf.assert_equal(outputs["popularity"], estimator.probability(tf.constant(item_ids)))
+
+    # Not updated when not training
+    step = int(estimator.step)
+    estimator({"item_id": tf.constant([3])})
+    assert int(estimator.step) == step
+    np.testing.assert_allclose(estimator.probability(tf.constant([3])), 1 / 200)
+
+
+def test_item_frequency_estimator_hashes_sequential_ids():
+    estimator = ml.ItemFrequencyEstimator(num_buckets=100)
+    buckets = estimator._buckets(tf.range(0, 100_000, 100)).numpy()
+    # A modulo would send all these ids to the same bucket
+    assert len(np.unique(buckets)) > 50
+    tf.assert_equal(
+        estimator._buckets(tf.constant(["1", "2"])), estimator._buckets(tf.constant([1, 2]))
+    )
@@ -0,0 +1,118 @@
+#
+# Copyright (c) 2021, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import numpy as np
+import tensorflow as tf
+
+import merlin.models.tf as ml
+from merlin.io.dataset import Dataset
+from merlin.models.data.synthetic import SyntheticData
+from merlin.schema import Tags
+
+
+def test_query_embedding_cache_lru_eviction():
+    cache = ml.QueryEmbeddingCache(max_size=2)
+    cache.put(1, np.ones(3))
+    cache.put(2, np.ones(3) * 2)
+    assert cache.get(1) is not None
+    cache.put(3, np.ones(3) * 3)
+
+    # 2 was the least recently used
+    assert 2 not in cache
+    assert 1 in cache and 3 in cache
+    assert cache.evictions == 1
+    assert cache.hits == 1 and cache.misses == 0
+
+
+def test_query_embedding_cache_ttl_and_version():
+    now = [0.0]
+    cache = ml.QueryEmbeddingCache(max_size=10, ttl=5, clock=lambda: now[0])
+    cache.put_many([1, 2], np.ones((2, 3)))
+
+    now[0] = 3.0
+    found, values = cache.get_many([1, 2, 3])
+    assert found.tolist() == [True, True, False]
+    assert set(values.keys()) == {0, 1}
+
+    now[0] = 6.0
+    assert cache.get(1) is None
+    assert cache.hits == 2 and cache.misses == 2
+
+    cache.put(1, np.ones(3))
+    cache.check_version(1)
+    assert len(cache) == 0
+
+
+def test_topk_recommender_with_query_cache(ecommerce_data: SyntheticData):
+    model: ml.RetrievalModel = ml.TwoTowerModel(
+        ecommerce_data.schema, query_tower=ml.MLPBlock([64, 128])
+    )
+    model.compile(run_eagerly=True, optimizer="adam")
+    dataset = ecommerce_data.tf_dataloader(batch_size=50)
+    model.fit(dataset, epochs=1)
+
+    item_features = ecommerce_data.schema.select_by_tag(Tags.ITEM).column_names
+    item_dataset = Dataset(ecommerce_data.dataframe[item_features].drop_duplicates())
+
+    cache = ml.QueryEmbeddingCache()
+    recommender = model.to_top_k_recommender(item_dataset, k=10, query_cache=cache)
+    topk_index = recommender.block.layers[-1]
+
+    batch = next(iter(dataset))[0]
+    num_users = len(np.unique(batch["user_id"].numpy()))
+    scores, _ = recommender(batch)
+    assert cache.misses == 50 and len(cache) == num_users
+
+    cached_scores, _ = recommender(batch)
+    assert cache.hits == 50
+    expected_scores, _ = topk_index(model.retrieval_block.query_block()(batch))
+    tf.debugging.assert_near(cached_scores, expected_scores)
+    tf.debugging.assert_near(scores, expected_scores)
+
+    # Updating the weights invalidates the cache
+    model.fit(dataset, epochs=1)
+    recommender(batch)
+    assert len(cache) == num_users
+    assert cache.hits == 50 and cache.misses == 100
+
+
+def test_cached_query_block_in_graph(ecommerce_data: SyntheticData):
+    model: ml.RetrievalModel = ml.TwoTowerModel(
+        ecommerce_data.schema, query_tower=ml.MLPBlock([64])
+    )
+    model.compile(run_eagerly=False, optimizer="adam")
+    dataset = ecommerce_data.tf_dataloader(batch_size=50)
+    model.fit(dataset, epochs=1)
+
+    query_block = model.retrieval_block.query_block()
+    cache = ml.QueryEmbeddingCache()
+    cached_block = ml.CachedQueryBlock(query_block, cache=cache, version_fn=model._weights_version)
+    cached_fn = tf.function(cached_block)
+
+    batch = next(iter(dataset))[0]
+    num_users = len(np.unique(batch["user_id"].numpy()))
+    expected = query_block(batch)
+    tf.debugging.assert_near(cached_fn(batch), expected)
+    assert cache.misses == 50 and len(cache) == num_users
+
+    tf.debugging.assert_near(cached_fn(batch), expected)
+    assert cache.hits == 50 and cache.misses == 50
+
+    # Updating the weights invalidates the cache without re-tracing
+    model.fit(dataset, epochs=1)
+    tf.debugging.assert_near(cached_fn(batch), query_block(batch))
+    assert cache.hits == 50 and cache.misses == 100
+    assert cached_fn.experimental_get_tracing_count() == 1
@@ -248,3 +248,124 @@ def test_update_by_indices():
     queue.update_by_indices(indices=tf.constant([[1], [2]]), values=tf.constant([20, 21]))
     values = queue.list_all()
     tf.assert_equal(values, [10, 20, 21, 7, 6, 5, 4, 3, 2, 1])
+
+
+@pytest.mark.parametrize("index_values", [True, False])
+def test_indexof_after_eviction_dequeue_and_update(index_values):
+    queue = ml.FIFOQueue(
+        capacity=5,
+        dims=[],
+        dtype=tf.int64,
+        index_values=index_values,
+    )
+
+    queue.enqueue_many(tf.constant([10, 11, 12], dtype=tf.int64))
+    queue.dequeue()
+    tf.assert_equal(
+        queue.index_of(tf.constant([10, 11], dtype=tf.int64)), tf.constant([-1, 1], dtype=tf.int64)
+    )
+
+    # 11 is evicted, 15 and 16 are stored in the first slots
+    queue.enqueue_many(tf.constant([13, 14, 15, 16], dtype=tf.int64))
+    indices = queue.index_of(tf.constant([10, 11, 12, 15, 16], dtype=tf.int64))
+    tf.assert_equal(indices, tf.constant([-1, -1, 2, 0, 1], dtype=tf.int64))
+
+    queue.update_by_indices(indices=tf.constant([[3]]), values=tf.constant([20], dtype=tf.int64))
+    tf.assert_equal(
+        queue.index_of(tf.constant([13, 20], dtype=tf.int64)), tf.constant([-1, 3], dtype=tf.int64)
+    )
+
+    queue.clear()
+    tf.assert_equal(
+        queue.index_of(tf.constant([12, 16, 20], dtype=tf.int64)),
+        tf.constant([-1, -1, -1], dtype=tf.int64),
+    )
+
+    queue.enqueue(tf.constant(13, dtype=tf.int64))
+    tf.assert_equal(
+        queue.index_of(tf.constant([13], dtype=tf.int64)), tf.constant([0], dtype=tf.int64)
+    )
+
+
+@pytest.mark.parametrize("index_values", [True, False])
+def test_indexof_repeated_ids_in_batch(index_values):
+    queue = ml.FIFOQueue(
+        capacity=6,
+        dims=[],
+        dtype=tf.int64,
+        index_values=index_values,
+    )
+
+    queue.enqueue_many(tf.constant([7, 8, 7, 9, 7], dtype=tf.int64))
+    tf.assert_equal(
+        queue.index_of(tf.constant([7, 8, 9], dtype=tf.int64)),
+        tf.constant([4, 1, 3], dtype=tf.int64),
+    )
+
+    # The first 7 is dequeued and the next batch wraps around the end of the storage
+    queue.dequeue_many(3)
+    queue.enqueue_many(tf.constant([8, 8, 3], dtype=tf.int64))
+    tf.assert_equal(queue.list_all(), tf.constant([9, 7, 8, 8, 3], dtype=tf.int64))
+    tf.assert_equal(
+        queue.index_of(tf.constant([7, 8, 3, 10], dtype=tf.int64)),
+        tf.constant([4, 0, 1, -1], dtype=tf.int64),
+    )
+
+
+def test_queue_dequeue_at_full_capacity(fifo_queue_fixture):
+    queue = fifo_queue_fixture
+
+    inputs = tf.random.uniform((13, 5))
+    queue.enqueue_many(inputs[:4])
+    queue.enqueue_many(inputs[4:])
+
+    assert queue.at_full_capacity
+    assert tf.reduce_all(queue.dequeue() == inputs[3])
+    assert tf.reduce_all(queue.dequeue_many(20) == inputs[4:])
+    assert queue.count() == 0
+
+
+def test_queue_enqueue_dequeue_in_graph_mode(fifo_queue_fixture):
+    queue = fifo_queue_fixture
+
+    @tf.function
+    def enqueue_many(vals):
+        queue.enqueue_many(vals)
+
+    @tf.function
+    def dequeue_many(n):
+        return queue.dequeue_many(n)
+
+    inputs = [tf.random.uniform((num_rows, 5)) for num_rows in [4, 7, 3]]
+    for vals in inputs:
+        enqueue_many(vals)
+
+    expected = tf.concat(inputs, axis=0)[-queue.capacity :]
+    assert queue.count() == queue.capacity
+    assert tf.reduce_all(queue.list_all() == expected)
+    assert tf.reduce_all(dequeue_many(4) == expected[:4])
+    assert tf.reduce_all(queue.list_all() == expected[4:])
+
+
+@pytest.mark.parametrize(
+    "storage_dtype,atol", [("float16", 1e-3), ("bfloat16", 1e-2), ("int8", 1e-2)]
+)
+def test_queue_compressed_storage(storage_dtype, atol):
+    queue = ml.FIFOQueue(capacity=10, dims=[5], dtype=tf.float32, storage_dtype=storage_dtype)
+    assert queue.storage.dtype == tf.as_dtype(storage_dtype)
+
+    inputs = tf.random.uniform((8, 5), minval=-1.0, maxval=1.0)
+    queue.enqueue_many(inputs)
+    queue.update_by_indices(tf.constant([[2]]), tf.zeros((1, 5)))
+
+    outputs = queue.list_all()
+    assert outputs.dtype == tf.float32
+    expected = tf.tensor_scatter_nd_update(inputs, [[2]], tf.zeros((1, 5)))
+    tf.debugging.assert_near(outputs, expected, atol=atol)
+    tf.debugging.assert_near(queue.dequeue_many(3), expected[:3], atol=atol)
+
+
+def test_queue_compressed_storage_not_supported():
+    with pytest.raises(ValueError) as excinfo:
+        ml.FIFOQueue(capacity=10, dtype=tf.int64, storage_dtype=tf.int8)
+    assert "is not supported" in str(excinfo.value)
@@ -0,0 +1,59 @@
+#
+# Copyright (c) 2022, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import numpy as np
+import tensorflow as tf
+
+import merlin.models.tf as ml
+from merlin.models.data.synthetic import SyntheticData
+from merlin.models.utils.evaluation import BinaryHistogram
+
+
+def test_histogram_auc_matches_binary_histogram():
+    y_true = tf.cast(tf.random.uniform((500,)) < 0.3, tf.float32)
+    y_pred = tf.random.uniform((500,))
+    groups = tf.random.uniform((500,), maxval=40, dtype=tf.int64)
+
+    auc, gauc = ml.HistogramAUC(num_buckets=200), ml.GroupAUC(num_shards=64, num_buckets=200)
+    for start in range(0, 500, 100):
+        batch = slice(start, start + 100)
+        auc.update_state(y_true[batch], y_pred[batch])
+        gauc.update_state(y_true[batch], y_pred[batch], groups=groups[batch])
+
+    histogram = BinaryHistogram(num_buckets=200, num_shards=64)
+    histogram.update(y_true.numpy(), y_pred.numpy(), groups.numpy())
+
+    np.testing.assert_allclose(auc.result().numpy(), histogram.auc(), rtol=1e-6)
+    np.testing.assert_allclose(gauc.result().numpy(), histogram.gauc(), rtol=1e-6)
+    np.testing.assert_array_equal(gauc.histogram().positives, histogram.positives)
+
+    keras_auc = tf.keras.metrics.AUC(num_thresholds=201)
+    keras_auc.update_state(y_true, y_pred)
+    np.testing.assert_allclose(auc.result().numpy(), keras_auc.result().numpy(), atol=1e-2)
+
+
+def test_group_auc_in_binary_classification_task(ecommerce_data: SyntheticData):
+    body = ml.InputBlock(ecommerce_data.schema).connect(ml.MLPBlock([64]))
+    task = ml.BinaryClassificationTask(
+        "click", metrics=[ml.HistogramAUC(), ml.GroupAUC(group_feature="user_id")]
+    )
+    model = body.connect(task)
+    model.compile(optimizer="adam")
+
+    model.fit(ecommerce_data.dataset, batch_size=50, epochs=1)
+    metrics = model.evaluate(ecommerce_data.dataset, batch_size=50, return_dict=True)
+
+    assert 0.0 <= metrics["histogram_auc"] <= 1.0
+    assert 0.0 <= metrics["gauc"] <= 1.0
@@ -20,20 +20,24 @@ import pytest
 import tensorflow as tf
 from sklearn.metrics import ndcg_score as ndcg_score_sklearn
 
+from merlin.models.tf.blocks.core.base import PredictionOutput
 from merlin.models.tf.metrics.ranking import (
     AvgPrecisionAt,
     MRRAt,
     NDCGAt,
     PrecisionAt,
     RecallAt,
+    TopKMetricsBundle,
     average_precision_at,
     dcg_at,
     mrr_at,
     ndcg_at,
     precision_at,
+    ranking_metrics,
     recall_at,
 )
-from merlin.models.tf.utils.tf_utils import extract_topk
+from merlin.models.tf.prediction_tasks.base import PredictionTask
+from merlin.models.tf.utils.tf_utils import extract_topk, extract_topk_ragged
 
 
 @pytest.fixture
@@ -175,3 +179,146 @@ def test_ranking_metrics_classes_pre_or_not_sorted_matches(ranking_metrics_test_
     result2 = metric2.result()
 
     tf.assert_equal(result1, result2)
+
+
+@pytest.mark.parametrize("pre_sorted", [True, False])
+def test_top_k_metrics_bundle_matches_ranking_metrics(pre_sorted):
+    labels = tf.cast(tf.random.uniform((16, 50)) < 0.1, tf.float32)
+    predictions = tf.random.uniform((16, 50))
+    sample_weight = tf.random.uniform((16,))
+    top_ks = [1, 5, 20]
+
+    bundle = TopKMetricsBundle(top_ks, pre_sorted=pre_sorted)
+    metrics = ranking_metrics(top_ks)
+    for metric in metrics:
+        metric.pre_sorted = False
+        metric.update_state(labels, predictions, sample_weight=sample_weight)
+    if pre_sorted:
+        predictions_sorted, labels_sorted, label_relevant_counts = extract_topk(
+            20, predictions, labels
+        )
+        bundle.update_state(
+            labels_sorted, predictions_sorted, label_relevant_counts, sample_weight=sample_weight
+        )
+    else:
+        bundle.update_state(labels, predictions, sample_weight=sample_weight)
+    expected = {metric.name: metric.result() for metric in metrics}
+
+    assert set(bundle.result()) == set(expected)
+    for name, result in bundle.result().items():
+        tf.debugging.assert_near(result, expected[name], message=name)
+
+
+def test_top_k_metrics_bundle_matches_pre_sorted_ranking_metrics():
+    labels = tf.cast(tf.random.uniform((16, 50)) < 0.1, tf.float32)
+    predictions = tf.random.uniform((16, 50))
+    top_ks = [1, 5, 20]
+    # Sorted and truncated at the highest k, so the lower cut-offs see more columns than k
+    predictions_sorted, labels_sorted, label_relevant_counts = extract_topk(20, predictions, labels)
+
+    bundle = TopKMetricsBundle(top_ks, pre_sorted=True)
+    bundle.update_state(labels_sorted, predictions_sorted, label_relevant_counts)
+    metrics = ranking_metrics(top_ks)
+    for metric in metrics:
+        if isinstance(metric, MRRAt):
+            # The bundle cuts MRR at k, while the pre-sorted MRRAt reads all the columns
+            metric.update_state(
+                labels_sorted[:, : metric.k],
+                predictions_sorted[:, : metric.k],
+                label_relevant_counts,
+            )
+        else:
+            metric.update_state(labels_sorted, predictions_sorted, label_relevant_counts)
+    expected = {metric.name: metric.result() for metric in metrics}
+
+    assert set(bundle.result()) == set(expected)
+    for name, result in bundle.result().items():
+        tf.debugging.assert_near(result, expected[name], message=name)
+
+
+def test_top_k_metrics_bundle_matches_ranking_metrics_with_fewer_columns_than_k():
+    labels = tf.constant([[0, 1, 1], [1, 0, 0], [0, 0, 0]], tf.float32)
+    predictions = tf.constant([[3, 2, 1], [3, 2, 1], [3, 2, 1]], tf.float32)
+    label_relevant_counts = tf.constant([4, 1, 0], tf.float32)
+    top_ks = [2, 5, 10]
+
+    bundle = TopKMetricsBundle(top_ks, pre_sorted=True)
+    bundle.update_state(labels, predictions, label_relevant_counts)
+    metrics = ranking_metrics(top_ks)
+    for metric in metrics:
+        metric.update_state(labels, predictions, label_relevant_counts)
+    expected = {metric.name: metric.result() for metric in metrics}
+
+    assert set(bundle.result()) == set(expected)
+    for name, result in bundle.result().items():
+        tf.debugging.assert_near(result, expected[name], message=name)
+    # Averaged over the 3 columns, and the ideal DCG is not clamped to 3 positions
+    tf.debugging.assert_near(expected["precision_at_5"], (2 / 3 + 1 / 3) / 3)
+    ideal_dcg_at_5 = sum(1 / math.log2(position) for position in range(2, 6))
+    tf.debugging.assert_near(
+        expected["ndcg_5"], ((1 / math.log2(3) + 1 / math.log2(4)) / ideal_dcg_at_5 + 1.0) / 3
+    )
+
+
+@pytest.fixture
+def relevant_ids_test_data():
+    # The second example repeats a relevant id, the last one has none
+    relevant_ids = tf.ragged.constant([[1, 3], [3, 0, 3], []], dtype=tf.int64)
+    labels = tf.convert_to_tensor([[0, 1, 0, 1, 0], [1, 0, 0, 1, 0], [0, 0, 0, 0, 0]], tf.float32)
+    predictions = tf.convert_to_tensor(
+        [[10, 9, 8, 7, 6], [1, 4, 3, 2, 5], [10, 9, 8, 7, 6]], tf.float32
+    )
+    return relevant_ids, labels, predictions
+
+
+def test_extract_topk_ragged(relevant_ids_test_data):
+    relevant_ids, labels, predictions = relevant_ids_test_data
+
+    expected = extract_topk(4, predictions, labels)
+    for relevant in [relevant_ids, relevant_ids.to_sparse()]:
+        output = extract_topk_ragged(4, predictions, relevant)
+        for tensor, expected_tensor in zip(output, expected):
+            tf.debugging.assert_equal(tensor, expected_tensor)
+
+
+@pytest.mark.parametrize(
+    "metric_class",
+    [
+        RecallAt,
+        PrecisionAt,
+        AvgPrecisionAt,
+        MRRAt,
+        NDCGAt,
+        lambda k, pre_sorted: TopKMetricsBundle([2, k], pre_sorted=pre_sorted),
+    ],
+)
+def test_ranking_metrics_relevant_ids(relevant_ids_test_data, metric_class):
+    relevant_ids, labels, predictions = relevant_ids_test_data
+
+    metric1 = metric_class(k=4, pre_sorted=False)
+    metric1.update_state(labels, predictions)
+
+    metric2 = metric_class(k=4, pre_sorted=False)
+    metric2.update_state(relevant_ids, predictions)
+
+    tf.nest.map_structure(tf.debugging.assert_equal, metric1.result(), metric2.result())
+
+    with pytest.raises(ValueError) as excinfo:
+        metric_class(k=4, pre_sorted=True).update_state(relevant_ids, predictions)
+    assert "require pre_sorted=False" in str(excinfo.value)
+
+
+def test_prediction_task_ranking_metrics_relevant_ids(relevant_ids_test_data):
+    relevant_ids, labels, predictions = relevant_ids_test_data
+
+    class _Task(PredictionTask):
+        def _compute_loss(self, predictions, targets, **kwargs):
+            return 0.0
+
+    results = []
+    for targets in [labels, relevant_ids]:
+        task = _Task(target_name="target", metrics=ranking_metrics([2, 4]))
+        task.calculate_metrics(PredictionOutput(predictions, targets), forward=False)
+        results.append(task.metric_results())
+
+    tf.nest.map_structure(tf.debugging.assert_equal, *results)
@@ -178,3 +178,33 @@ def test_resume_training(ecommerce_data: SyntheticData, prediction_task, run_eag
     copy_model = testing_utils.assert_model_is_retrainable(model, dataset, run_eagerly=run_eagerly)
 
     assert copy_model is not None
+
+
+def test_simple_model_async_train_metrics(ecommerce_data: SyntheticData, num_epochs=2):
+    body = ml.InputBlock(ecommerce_data.schema).connect(ml.MLPBlock([64]))
+    model = body.connect(ml.BinaryClassificationTask("click"))
+    model.compile(optimizer="adam")
+
+    losses = model.fit(
+        ecommerce_data.dataset, batch_size=50, epochs=num_epochs, async_train_metrics=True
+    )
+    metrics = model.evaluate(ecommerce_data.dataset, batch_size=50, return_dict=True)
+    testing_utils.assert_binary_classification_loss_metrics(
+        losses, metrics, target_name="click", num_epochs=num_epochs
+    )
+    assert all(0.0 <= auc <= 1.0 for auc in losses.history["click/binary_classification_task/auc"])
+    async_metrics = model._async_metrics_updater
+
+    # Another asynchronous fit reuses the updater the train step was traced with,
+    # so its metrics are computed rather than left reset
+    train_function = model.train_function
+    model.reset_metrics()
+    losses = model.fit(ecommerce_data.dataset, batch_size=50, epochs=1, async_train_metrics=True)
+    assert model._async_metrics_updater is async_metrics
+    assert model.train_function is train_function
+    assert losses.history["click/binary_classification_task/auc"][0] > 0.0
+
+    # The train step is traced again when switching back to synchronous metrics
+    losses = model.fit(ecommerce_data.dataset, batch_size=50, epochs=1)
+    assert model._async_metrics_updater is None
+    assert model.train_function is not train_function
@@ -1,7 +1,12 @@
+import os
+
+import dask.dataframe as dd
+import numpy as np
 import pytest
 import tensorflow as tf
 
 import merlin.models.tf as mm
+from merlin.io.dataset import Dataset
 from merlin.models.data.synthetic import SyntheticData
 from merlin.models.tf.metrics.ranking import AvgPrecisionAt, MRRAt, NDCGAt, PrecisionAt, RecallAt
 from merlin.schema import Tags
@@ -76,6 +81,32 @@ def test_two_tower_retrieval_model_with_metrics(ecommerce_data: SyntheticData, r
     _ = model.evaluate(ecommerce_data.tf_dataloader(batch_size=10))
 
 
+def test_two_tower_retrieval_model_with_fused_metrics(ecommerce_data: SyntheticData):
+    ecommerce_data._schema = ecommerce_data.schema.remove_by_tag(Tags.TARGET)
+
+    model = mm.TwoTowerModel(
+        schema=ecommerce_data.schema,
+        query_tower=mm.MLPBlock([64]),
+        samplers=[mm.InBatchSampler()],
+        metrics=mm.ranking_metrics([5, 10], fused=True),
+        loss="categorical_crossentropy",
+    )
+    model.set_retrieval_candidates_for_evaluation(ecommerce_data.dataset)
+    model.compile(optimizer="adam")
+
+    losses = model.fit(ecommerce_data.tf_dataloader(batch_size=10), epochs=1)
+    metrics = model.evaluate(ecommerce_data.tf_dataloader(batch_size=10), return_dict=True)
+
+    expected_metrics = [
+        f"{name}_{k}"
+        for name in ["recall_at", "mrr_at", "ndcg", "map_at", "precision_at"]
+        for k in [5, 10]
+    ]
+    assert set(expected_metrics) <= set(losses.history)
+    assert set(expected_metrics) <= set(metrics)
+    assert metrics["recall_at_5"] <= metrics["recall_at_10"]
+
+
 def test_retrieval_evaluation_without_negatives(ecommerce_data: SyntheticData):
     model = mm.TwoTowerModel(schema=ecommerce_data.schema, query_tower=mm.MLPBlock([64]))
     model.compile(optimizer="adam", run_eagerly=True)
@@ -103,3 +134,104 @@ def test_youtube_dnn_retrieval(
     out = model({k: tf.cast(v, tf.int64) for k, v in sequence_testing_data.tf_tensor_dict.items()})
 
     assert out.shape[-1] == 51997
+
+
+def test_two_tower_recommend_all(ecommerce_data: SyntheticData, tmpdir):
+    model = mm.TwoTowerModel(schema=ecommerce_data.schema, query_tower=mm.MLPBlock([64]))
+    model.compile(optimizer="adam", run_eagerly=True)
+    model.fit(ecommerce_data.tf_dataloader(batch_size=50))
+
+    item_features = ecommerce_data.schema.select_by_tag(Tags.ITEM).column_names
+    items = Dataset(ecommerce_data.dataframe[item_features].drop_duplicates("item_id"))
+    # Several partitions of users, each user's rows being in a single partition
+    users = dd.from_pandas(ecommerce_data.dataframe, npartitions=1).shuffle(
+        "user_id", npartitions=3
+    )
+    users = Dataset(users, schema=ecommerce_data.schema)
+    assert users.to_ddf().npartitions == 3
+    output_path = str(tmpdir / "recommendations")
+    recommendations = model.recommend_all(
+        users,
+        items,
+        k=5,
+        output_path=output_path,
+        batch_size=16,
+        block_size=8,
+        num_workers=2,
+    )
+
+    assert sorted(os.listdir(output_path)) == [f"part_{i}.parquet" for i in range(3)]
+    df = recommendations.to_ddf().compute()
+    num_users = ecommerce_data.dataframe["user_id"].nunique()
+    assert list(df.columns) == ["user_id", "item_ids", "scores"]
+    assert len(df) == num_users and df["user_id"].nunique() == num_users
+    scores = np.stack(df["scores"].values)
+    assert scores.shape == (num_users, 5)
+    assert (np.diff(scores, axis=1) <= 0).all()
+    assert set(np.concatenate(df["item_ids"].values)) <= set(items.to_ddf()["item_id"].compute())
+
+
+@pytest.mark.parametrize("run_eagerly", [True, False])
+def test_two_tower_model_with_logq_correction(ecommerce_data: SyntheticData, run_eagerly):
+    estimator = mm.ItemFrequencyEstimator(num_buckets=1000)
+    task = mm.ItemRetrievalTask(
+        ecommerce_data.schema, normalize=False, item_frequency_estimator=estimator
+    )
+    model = mm.TwoTowerModel(
+        ecommerce_data.schema, query_tower=mm.MLPBlock([64]), prediction_tasks=task
+    )
+    model.compile(optimizer="adam", run_eagerly=run_eagerly)
+
+    losses = model.fit(ecommerce_data.tf_dataloader(batch_size=50), epochs=1)
+    assert len(losses.epoch) == 1
+    assert int(estimator.step) == 2
+
+    item_ids = ecommerce_data.dataframe["item_id"].values[:5]
+    probs = estimator.probability(tf.constant(item_ids)).numpy()
+    assert ((probs > 0) & (probs <= 1)).all()
+
+
+@pytest.mark.parametrize("run_eagerly", [True, False])
+def test_two_tower_model_with_deduplicated_negatives(ecommerce_data: SyntheticData, run_eagerly):
+    task = mm.ItemRetrievalTask(
+        ecommerce_data.schema,
+        samplers=[mm.InBatchSampler(), mm.CachedCrossBatchSampler(capacity=200)],
+        deduplicate_negatives=True,
+    )
+    model = mm.TwoTowerModel(
+        ecommerce_data.schema, query_tower=mm.MLPBlock([64]), prediction_tasks=task
+    )
+    model.compile(optimizer="adam", run_eagerly=run_eagerly)
+
+    losses = model.fit(ecommerce_data.tf_dataloader(batch_size=50), epochs=2)
+    assert len(losses.epoch) == 2
+    assert all(np.isfinite(loss) for loss in losses.history["loss"])
+
+
+@pytest.mark.parametrize("run_eagerly", [True, False])
+def test_two_tower_model_with_hard_negatives(ecommerce_data: SyntheticData, run_eagerly):
+    item_features = ecommerce_data.schema.select_by_tag(Tags.ITEM).column_names
+    items = Dataset(ecommerce_data.dataframe[item_features].drop_duplicates("item_id"))
+    sampler = mm.HardNegativeSampler(
+        lambda: mm.HardNegativeSampler.item_embeddings_from_block(
+            model.retrieval_block.item_block(), items
+        ),
+        num_hard_negatives=5,
+        refresh_every=1,
+    )
+    task = mm.ItemRetrievalTask(
+        ecommerce_data.schema, samplers=[mm.InBatchSampler(), sampler], deduplicate_negatives=True
+    )
+    model = mm.TwoTowerModel(
+        ecommerce_data.schema, query_tower=mm.MLPBlock([64]), prediction_tasks=task
+    )
+    model.compile(optimizer="adam", run_eagerly=run_eagerly)
+
+    losses = model.fit(
+        ecommerce_data.tf_dataloader(batch_size=50),
+        epochs=1,
+        callbacks=[sampler.refresh_callback()],
+    )
+    assert all(np.isfinite(loss) for loss in losses.history["loss"])
+    assert sampler.num_refreshes >= 2
+    assert sampler._item_embeddings.shape[0] == len(items.to_ddf())
@@ -41,3 +41,26 @@ def test_serialization_binary_classification_head(testing_data: SyntheticData):
     testing_utils.assert_loss_and_metrics_are_valid(
         copy_model, (testing_data.tf_tensor_dict, targets)
     )
+
+
+def test_async_metrics_updater():
+    from merlin.models.tf.prediction_tasks.base import AsyncMetricsUpdater, PredictionOutput
+
+    task, sync_task = ml.BinaryClassificationTask("target"), ml.BinaryClassificationTask("target")
+    updater = AsyncMetricsUpdater()
+    updater.start()
+    for _ in range(3):
+        outputs = PredictionOutput(
+            tf.random.uniform((100, 1)),
+            tf.cast(tf.random.uniform((100, 1), maxval=2, dtype=tf.int32), tf.float32),
+        )
+        loss = updater.attach(task, outputs, tf.constant(1.0))
+        sync_task.calculate_metrics(outputs, forward=False, training=True)
+    updater.wait()
+    updater.stop()
+
+    assert float(loss) == 1.0
+    assert updater.num_dropped == 0
+    expected = sync_task.metric_result_dict()
+    for name, value in task.metric_result_dict().items():
+        tf.debugging.assert_near(value, expected[name])
@@ -14,12 +14,14 @@
 # limitations under the License.
 #
 
+import numpy as np
 import pytest
 import tensorflow as tf
 
 import merlin.models.tf as ml
 from merlin.models.data.synthetic import SyntheticData
-from merlin.models.tf.blocks.core.base import PredictionOutput
+from merlin.models.tf.blocks.core.base import BlockContext, PredictionOutput
+from merlin.models.tf.blocks.core.transformations import L2Norm
 from merlin.schema import Tags
 
 
@@ -153,7 +155,8 @@ def test_item_retrieval_scorer_cached_sampler_downscore_false_negatives_no_item_
     )
 
 
-def test_item_retrieval_scorer_downscore_false_negatives():
+@pytest.mark.parametrize("false_negatives_method", ["dense", "sorted"])
+def test_item_retrieval_scorer_downscore_false_negatives(false_negatives_method):
     batch_size = 10
 
     cached_batches_sampler = ml.InBatchSampler()
@@ -168,6 +171,7 @@ def test_item_retrieval_scorer_downscore_false_negatives():
         samplers=[cached_batches_sampler],
         sampling_downscore_false_negatives=True,
         sampling_downscore_false_negatives_value=FALSE_NEGATIVE_SCORE,
+        sampling_downscore_false_negatives_method=false_negatives_method,
         context=context,
     )
 
@@ -195,6 +199,93 @@ def test_item_retrieval_scorer_downscore_false_negatives():
     )
 
 
+@pytest.mark.parametrize("deduplicate_negatives", [False, True])
+def test_item_retrieval_scorer_frequency_sampler_log_q_correction(deduplicate_negatives):
+    item_ids = tf.constant([1, 2, 3], dtype=tf.int32)
+    context = ml.BlockContext(feature_names=["item_id"], feature_dtypes={"item_id": tf.int32})
+    embedding_table = context.add_embedding_weight("item_id", shape=(10, 4))
+    embedding_table.assign(tf.random.uniform((10, 4)))
+    _ = context({"item_id": item_ids})
+
+    # Only item 7 can be sampled, with an expected count of 5 per batch
+    frequencies = np.zeros(10)
+    frequencies[7] = 1.0
+    scorer = ml.ItemRetrievalScorer(
+        samplers=[ml.InBatchSampler(), ml.FrequencyBasedSampler(frequencies, max_num_samples=5)],
+        sampling_downscore_false_negatives=False,
+        deduplicate_negatives=deduplicate_negatives,
+        context=context,
+    )
+    queries = tf.random.uniform((3, 4))
+    outputs = scorer.call_outputs(PredictionOutput(queries, item_ids), training=True)
+
+    negative_ids = [1, 2, 3, 7] if deduplicate_negatives else [1, 2, 3] + [7] * 5
+    expected_scores = queries.numpy() @ embedding_table.numpy()[negative_ids].T
+    # Only the negatives of the frequency sampler are corrected
+    expected_scores[:, 3:] -= np.log(5.0)
+    np.testing.assert_allclose(outputs.predictions[:, 1:].numpy(), expected_scores, rtol=1e-5)
+
+
+def test_item_retrieval_scorer_log_q_correction_with_estimator_and_frequency_sampler():
+    item_ids = tf.constant([1, 2, 3], dtype=tf.int32)
+    context = ml.BlockContext(feature_names=["item_id"], feature_dtypes={"item_id": tf.int32})
+    embedding_table = context.add_embedding_weight("item_id", shape=(10, 4))
+    embedding_table.assign(tf.random.uniform((10, 4)))
+    _ = context({"item_id": item_ids})
+
+    frequencies = np.zeros(10)
+    frequencies[7] = 1.0
+    estimator = ml.ItemFrequencyEstimator(num_buckets=100)
+    scorer = ml.ItemRetrievalScorer(
+        samplers=[ml.InBatchSampler(), ml.FrequencyBasedSampler(frequencies, max_num_samples=5)],
+        sampling_downscore_false_negatives=False,
+        item_frequency_estimator=estimator,
+        context=context,
+    )
+    queries = tf.random.uniform((3, 4))
+    outputs = scorer.call_outputs(PredictionOutput(queries, item_ids), training=True)
+
+    negative_ids = [1, 2, 3] + [7] * 5
+    expected_scores = queries.numpy() @ embedding_table.numpy()[negative_ids].T
+    # The in-batch negatives are corrected by the estimator, and the negatives
+    # of the frequency sampler only by their expected count
+    expected_scores[:, :3] -= estimator.log_q(item_ids).numpy()
+    expected_scores[:, 3:] -= np.log(5.0)
+    np.testing.assert_allclose(outputs.predictions[:, 1:].numpy(), expected_scores, rtol=1e-5)
+
+
+def test_item_retrieval_scorer_false_negatives_method_with_deduplicate_negatives():
+    scorer = ml.ItemRetrievalScorer(samplers=[ml.InBatchSampler()], deduplicate_negatives=True)
+    assert scorer.false_negatives_method == "sorted"
+    assert ml.ItemRetrievalScorer(samplers=[ml.InBatchSampler()]).false_negatives_method == "dense"
+
+    with pytest.raises(ValueError) as excinfo:
+        ml.ItemRetrievalScorer(
+            samplers=[ml.InBatchSampler()],
+            sampling_downscore_false_negatives_method="dense",
+            deduplicate_negatives=True,
+        )
+    assert "deduplicate_negatives=True finds the false negatives" in str(excinfo.value)
+
+
+def test_item_retrieval_scorer_from_config():
+    scorer = ml.ItemRetrievalScorer(
+        sampling_downscore_false_negatives=False,
+        sampling_downscore_false_negatives_value=-1.0,
+        deduplicate_negatives=True,
+        eval_top_k=10,
+        eval_block_size=100,
+    )
+    copy = ml.ItemRetrievalScorer.from_config(scorer.get_config())
+
+    assert copy.downscore_false_negatives is False
+    assert copy.false_negatives_score == -1.0
+    assert copy.false_negatives_method == "sorted"
+    assert copy.deduplicate_negatives is True
+    assert copy.eval_top_k == 10
+    assert copy.eval_block_size == 100
+
+
 def test_item_retrieval_scorer_only_positive_when_not_training():
     batch_size = 10
 
@@ -368,3 +459,102 @@ def test_retrieval_task_inbatch_default_sampler(
         tf.assert_equal(tf.shape(output)[0], batch_size)
         # Number of negatives plus one positive
         tf.assert_equal(tf.shape(output)[1], expected_num_samples_inbatch + 1)
+
+
+@pytest.mark.parametrize("run_eagerly", [True, False])
+def test_last_item_prediction_task_sampled_softmax_eval_top_k(
+    sequence_testing_data: SyntheticData, run_eagerly: bool
+):
+    inputs = ml.InputBlock(
+        sequence_testing_data.schema,
+        aggregation="concat",
+        seq=False,
+        max_seq_length=4,
+        masking="clm",
+        split_sparse=True,
+    )
+    task = ml.NextItemPredictionTask(
+        schema=sequence_testing_data.schema,
+        loss=tf.keras.losses.CategoricalCrossentropy(from_logits=True),
+        masking=True,
+        sampled_softmax=True,
+        eval_top_k=20,
+        eval_block_size=10_000,
+    )
+
+    model = inputs.connect(ml.MLPBlock([64]), task)
+    model.compile(optimizer="adam", run_eagerly=run_eagerly)
+    losses = model.fit(sequence_testing_data.dataset, batch_size=50, epochs=1)
+    assert len(losses.epoch) == 1
+
+    metrics = model.evaluate(sequence_testing_data.dataset, batch_size=50, return_dict=True)
+    assert all(0 <= value <= 1 for name, value in metrics.items() if "_at_" in name)
+
+    features = {k: tf.cast(v, tf.int64) for k, v in sequence_testing_data.tf_tensor_dict.items()}
+    embedding_table = [v for v in model.variables if "item_id_seq/embedding" in v.name][0]
+    with tf.GradientTape() as tape:
+        loss = model.compute_loss(model(features, training=True), None, training=True)
+    # Only the rows of the target and sampled items get gradients
+    assert isinstance(tape.gradient(loss, embedding_table), tf.IndexedSlices)
+
+
+@pytest.mark.parametrize("run_eagerly", [True, False])
+def test_parallel_next_item_tasks_shared_eval_top_k(
+    sequence_testing_data: SyntheticData, run_eagerly: bool, monkeypatch
+):
+    inputs = ml.InputBlock(
+        sequence_testing_data.schema,
+        aggregation="concat",
+        seq=False,
+        max_seq_length=4,
+        masking="clm",
+        split_sparse=True,
+    )
+
+    def next_item_task(name, eval_top_k):
+        return ml.NextItemPredictionTask(
+            schema=sequence_testing_data.schema,
+            loss=tf.keras.losses.CategoricalCrossentropy(from_logits=True),
+            masking=True,
+            sampled_softmax=True,
+            eval_top_k=eval_top_k,
+            target_name=name,
+            task_name=name,
+            normalize=False,
+        )
+
+    # Both tasks score the same queries (normalized once for both tasks),
+    # so the top-k of the catalog is computed once
+    tasks = ml.ParallelPredictionBlock(
+        next_item_task("a", 20), next_item_task("b", 10), pre=L2Norm()
+    )
+    model = inputs.connect(ml.MLPBlock([64]), tasks)
+    model.compile(optimizer="adam", run_eagerly=run_eagerly)
+    model.fit(sequence_testing_data.dataset, batch_size=50, epochs=1)
+
+    # Counts the executions (rather than the tracings) of the top-k of the catalog
+    num_top_k_calls = tf.Variable(0)
+    top_k_call = ml.TopKIndexBlock.call
+
+    def counted_top_k_call(self, *args, **kwargs):
+        with tf.control_dependencies([num_top_k_calls.assign_add(1)]):
+            return tuple(tf.identity(output) for output in top_k_call(self, *args, **kwargs))
+
+    monkeypatch.setattr(ml.TopKIndexBlock, "call", counted_top_k_call)
+    metrics = model.evaluate(sequence_testing_data.dataset, batch_size=50, return_dict=True)
+    assert all(0 <= value <= 1 for name, value in metrics.items() if "_at_" in name)
+    shared_calls = int(num_top_k_calls.numpy())
+    num_top_k_calls.assign(0)
+
+    # Evaluating the tasks separately, each with its own top-k, gives the same metrics
+    monkeypatch.setattr(
+        BlockContext, "shared_top_k", lambda self, queries, _, k, top_k_fn: top_k_fn(queries, k)
+    )
+    model.test_function = None
+    separate_metrics = model.evaluate(
+        sequence_testing_data.dataset, batch_size=50, return_dict=True
+    )
+    assert shared_calls > 0 and int(num_top_k_calls.numpy()) == 2 * shared_calls
+    assert separate_metrics.keys() == metrics.keys()
+    for name, value in metrics.items():
+        assert value == pytest.approx(separate_metrics[name], rel=1e-5), name
@@ -14,10 +14,15 @@
 # limitations under the License.
 #
 
+import subprocess
+import sys
+
+import numpy as np
 import pytest
 import tensorflow as tf
 
 import merlin.models.tf as ml
+from merlin.models.tf.blocks.sampling.cross_batch import _build_alias_tables
 
 
 def test_inbatch_sampler():
@@ -374,3 +379,209 @@ def test_cached_uniform_sampler_trying_add_sample_before_built():
         input_data = ml.EmbeddingWithMetadata(embeddings=None, metadata={})
         _ = cached_batches_sampler.sample()
     assert "The CachedUniformSampler layer was not built yet." in str(excinfo.value)
+
+
+@pytest.mark.parametrize("alpha", [1.0, 0.5])
+def test_frequency_sampler(alpha):
+    num_sampled = 20000
+    item_frequencies = np.array([0, 0, 50, 30, 10, 5, 5, 0, 100], dtype=np.float32)
+    item_weights = tf.random.uniform(shape=(10, 5), dtype=tf.float32)
+    item_ids = tf.constant([2, 3, 4], dtype=tf.int32)
+
+    sampler = ml.FrequencyBasedSampler(
+        item_frequencies, alpha=alpha, max_num_samples=num_sampled, seed=42
+    )
+    input_data = ml.EmbeddingWithMetadata(tf.random.uniform((3, 5)), {"item_id": item_ids})
+    output_data = sampler(input_data.__dict__, item_weights)
+
+    sampled_ids = output_data.metadata["item_id"]
+    tf.assert_equal(tf.nn.embedding_lookup(item_weights, sampled_ids), output_data.embeddings)
+
+    expected_probs = item_frequencies**alpha / (item_frequencies**alpha).sum()
+    probs = np.bincount(sampled_ids.numpy(), minlength=len(item_frequencies)) / num_sampled
+    np.testing.assert_allclose(probs, expected_probs, atol=0.02)
+    assert (probs[item_frequencies == 0] == 0).all()
+
+    np.testing.assert_allclose(
+        output_data.metadata["popularity"].numpy(),
+        num_sampled * expected_probs[sampled_ids.numpy()],
+        rtol=1e-4,
+    )
+    np.testing.assert_allclose(
+        sampler.log_q(item_ids).numpy(),
+        np.log(num_sampled * expected_probs[item_ids.numpy()]),
+        rtol=1e-4,
+    )
+
+
+@pytest.mark.parametrize("num_items", [1, 10, 1_000_000])
+def test_frequency_sampler_alias_tables(num_items):
+    rng = np.random.default_rng(0)
+    frequencies = rng.zipf(1.5, size=num_items).astype(np.float64)
+    frequencies[rng.uniform(size=num_items) < 0.1] = 0
+    frequencies[0] = 1
+    probs = frequencies / frequencies.sum()
+
+    alias_probs, alias = _build_alias_tables(probs)
+
+    # Each bucket is drawn with probability 1 / num_items, and then either
+    # its item with probability `alias_probs` or its alias
+    implied_probs = (
+        alias_probs + np.bincount(alias, weights=1.0 - alias_probs, minlength=num_items)
+    ) / num_items
+    np.testing.assert_allclose(implied_probs, probs, atol=1e-12)
+    assert (alias_probs[probs == 0] == 0).all()
+    assert (probs[alias[alias_probs < 1]] > 0).all()
+
+
+def test_frequency_sampler_from_dataset(ecommerce_data):
+    sampler = ml.FrequencyBasedSampler.from_dataset(ecommerce_data.dataset, max_num_samples=10)
+    item_counts = ecommerce_data.dataframe["item_id"].value_counts()
+    assert sampler.num_items == item_counts.index.max() + 1
+    expected_probs = np.zeros(sampler.num_items)
+    expected_probs[item_counts.index.values] = item_counts.values / item_counts.sum()
+    np.testing.assert_allclose(sampler.probs.numpy(), expected_probs, rtol=1e-5)
+
+    sampler.update_frequencies(np.ones(sampler.num_items))
+    np.testing.assert_allclose(sampler.probs.numpy(), 1 / sampler.num_items, rtol=1e-5)
+    with pytest.raises(ValueError) as excinfo:
+        sampler.update_frequencies(np.ones(10))
+    assert "must match the number of items" in str(excinfo.value)
+
+
+@pytest.mark.parametrize("block_size", [None, 7])
+def test_hard_negative_sampler(block_size):
+    item_ids = np.arange(100, 120)
+    item_embeddings = np.random.uniform(size=(20, 8)).astype(np.float32)
+    sampler = ml.HardNegativeSampler(
+        lambda: (item_ids, item_embeddings), num_hard_negatives=3, block_size=block_size
+    )
+    with pytest.raises(RuntimeError) as excinfo:
+        sampler(
+            {"embeddings": tf.zeros((2, 8)), "metadata": {"item_id": tf.constant([1, 2])}},
+            query_embeddings=tf.zeros((2, 8)),
+        )
+    assert "has no items snapshot yet" in str(excinfo.value)
+
+    sampler.refresh()
+    queries = tf.random.uniform((4, 8))
+    positive_ids = tf.constant([100, 105, 110, 119])
+    input_data = ml.EmbeddingWithMetadata(tf.zeros((4, 8)), {"item_id": positive_ids})
+    output_data = sampler(input_data.__dict__, query_embeddings=queries)
+
+    scores = queries.numpy() @ item_embeddings.T
+    scores[np.arange(4), positive_ids.numpy() - 100] = -np.inf
+    expected_ids = set(item_ids[np.argsort(-scores, axis=1)[:, :3]].reshape(-1))
+    sampled_ids = output_data.metadata["item_id"].numpy()
+    assert len(sampled_ids) == len(set(sampled_ids))
+    assert set(sampled_ids) == expected_ids
+    np.testing.assert_allclose(output_data.embeddings.numpy(), item_embeddings[sampled_ids - 100])
+
+
+def test_hard_negative_sampler_async_refresh():
+    item_ids = np.arange(10)
+    snapshots = [np.zeros((10, 4), dtype=np.float32), np.ones((10, 4), dtype=np.float32)]
+    sampler = ml.HardNegativeSampler(lambda: (item_ids, snapshots[sampler.num_refreshes]))
+
+    sampler.refresh()
+    assert sampler.num_refreshes == 1
+
+    sampler.refresh()
+    assert sampler.apply_refresh(wait=True)
+    assert sampler.num_refreshes == 2
+    np.testing.assert_array_equal(sampler._item_embeddings.numpy(), snapshots[1])
+    assert not sampler.apply_refresh(wait=True)
+
+    with pytest.raises(ValueError) as excinfo:
+        sampler._set_items(item_ids[:5], snapshots[0][:5])
+    assert "differs from the shape of the current ones" in str(excinfo.value)
+
+
+def test_hard_negative_sampler_refresh_in_graph():
+    snapshots = [
+        (np.arange(10), np.eye(10, 4, dtype=np.float32)),
+        (np.arange(10)[::-1], np.eye(10, 4, dtype=np.float32)),
+    ]
+    sampler = ml.HardNegativeSampler(
+        lambda: snapshots[sampler.num_refreshes], num_hard_negatives=1, block_size=3
+    )
+    sampler.refresh()
+
+    @tf.function
+    def sample(queries, positive_ids):
+        return sampler.sample(queries, positive_ids).metadata["item_id"]
+
+    queries = tf.constant([[1.0, 0.0, 0.0, 0.0]])
+    assert sample(queries, tf.constant([0])).numpy().tolist() == [1]
+    assert sample(queries, tf.constant([5])).numpy().tolist() == [0]
+
+    # The item ids are reversed, so the embedding closest to the query is the one of item 9
+    sampler.refresh(asynchronous=False)
+    assert sample(queries, tf.constant([9])).numpy().tolist() == [8]
+    assert sample(queries, tf.constant([5])).numpy().tolist() == [9]
+
+
+@pytest.mark.parametrize("storage_dtype", ["float16", "int8"])
+def test_cached_batches_sampler_compressed_storage(storage_dtype):
+    sampler = ml.CachedCrossBatchSampler(
+        capacity=20, ignore_last_batch_on_sample=False, embeddings_storage_dtype=storage_dtype
+    )
+    item_embeddings = tf.random.uniform(shape=(10, 5), dtype=tf.float32)
+    item_ids = tf.range(10)
+    input_data = ml.EmbeddingWithMetadata(item_embeddings, {"item_id": item_ids})
+    output_data = sampler(input_data.__dict__)
+
+    assert sampler.item_embeddings_queue.storage.dtype == tf.as_dtype(storage_dtype)
+    assert output_data.embeddings.dtype == tf.float32
+    tf.debugging.assert_near(output_data.embeddings, item_embeddings, atol=1e-2)
+    tf.assert_equal(output_data.metadata["item_id"], item_ids)
+
+
+_CROSS_REPLICA_SCRIPT = """
+import tensorflow as tf
+
+# Splits the CPU in two logical devices for a MirroredStrategy,
+# which is only possible before TF is initialized (e.g. by importing merlin.models.tf)
+tf.config.set_logical_device_configuration(
+    tf.config.list_physical_devices("CPU")[0], [tf.config.LogicalDeviceConfiguration()] * 2
+)
+
+import merlin.models.tf as ml
+devices = tf.config.list_logical_devices("CPU")
+strategy = tf.distribute.MirroredStrategy([device.name for device in devices[:2]])
+sampler = ml.InBatchSampler(cross_replica=True)
+
+embeddings = strategy.experimental_distribute_values_from_function(
+    lambda ctx: tf.fill((3, 4), float(ctx.replica_id_in_sync_group + 1))
+)
+item_ids = strategy.experimental_distribute_values_from_function(
+    lambda ctx: tf.range(3) + 10 * ctx.replica_id_in_sync_group
+)
+
+
+@tf.function
+def step(embeddings, item_ids):
+    with tf.GradientTape() as tape:
+        tape.watch(embeddings)
+        output = sampler({"embeddings": embeddings, "metadata": {"item_id": item_ids}})
+        loss = tf.reduce_sum(output.embeddings)
+    return output.embeddings, output.metadata["item_id"], tape.gradient(loss, embeddings)
+
+
+outputs, ids, gradients = strategy.run(step, args=(embeddings, item_ids))
+expected = tf.concat([tf.fill((3, 4), 1.0), tf.fill((3, 4), 2.0)], axis=0)
+for replica in range(2):
+    tf.assert_equal(outputs.values[replica], expected)
+    tf.assert_equal(ids.values[replica], tf.constant([0, 1, 2, 10, 11, 12]))
+    # The items gathered from the other replica don't get gradients
+    tf.assert_equal(gradients.values[replica], tf.ones((3, 4)))
+"""
+
+
+def test_inbatch_sampler_cross_replica():
+    # Run in a separate process, as the logical devices can't be changed
+    # once TF is initialized by the other tests
+    result = subprocess.run(
+        [sys.executable, "-c", _CROSS_REPLICA_SCRIPT], capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
@@ -1,7 +1,12 @@
+import os
+
+import dask.dataframe as dd
+import numpy as np
 import pandas as pd
 import pytest
 
 import merlin.models.tf as ml
+from merlin.io import Dataset
 from merlin.models.data.synthetic import SyntheticData
 
 
@@ -22,6 +27,105 @@ def test_model_encode(ecommerce_data: SyntheticData, run_eagerly):
     assert all([task in list(ddf.columns) for task in model.block.last.task_names])
 
 
+def test_model_encode_to_parquet(ecommerce_data: SyntheticData, tmpdir):
+    prediction_task = ml.PredictionTasks(ecommerce_data.schema)
+
+    body = ml.InputBlock(ecommerce_data.schema).connect(ml.MLPBlock([64]))
+    model = body.connect(prediction_task)
+    model.compile(run_eagerly=True, optimizer="adam")
+
+    model.fit(ecommerce_data.dataset, batch_size=50, epochs=1)
+
+    output_path = str(tmpdir.join("predictions"))
+    output_columns = ["user_id"] + model.block.last.task_names
+    data = model.batch_predict(
+        ecommerce_data.dataset,
+        batch_size=10,
+        output_path=output_path,
+        output_columns=output_columns,
+    )
+    ddf = data.compute(scheduler="synchronous")
+
+    assert list(ddf.columns) == output_columns
+    assert len(ddf) == 100
+    assert not any(path.endswith(".tmp") for path in os.listdir(output_path))
+
+    # Partitions already written are not predicted again
+    mtimes = {
+        path: os.path.getmtime(os.path.join(output_path, path)) for path in os.listdir(output_path)
+    }
+    data = model.batch_predict(
+        ecommerce_data.dataset,
+        batch_size=10,
+        output_path=output_path,
+        output_columns=output_columns,
+        resume=True,
+    )
+    assert len(data.compute(scheduler="synchronous")) == 100
+    for path, mtime in mtimes.items():
+        assert os.path.getmtime(os.path.join(output_path, path)) == mtime
+
+
+def test_model_encode_empty_filters_keep_all_columns(tmpdir):
+    from merlin.models.tf.utils.batch_utils import ModelEncode, encode_to_parquet
+
+    df = pd.DataFrame({"user_id": [1, 2, 3], "feature": [0.1, 0.2, 0.3]})
+    model_encode = ModelEncode(
+        lambda batch: np.ones((len(batch), 2), dtype=np.float32), output_names=["a", "b"]
+    )
+
+    expected_columns = ["user_id", "feature", "a", "b"]
+    assert list(model_encode(df).columns) == expected_columns
+    assert list(model_encode(df, [], []).columns) == expected_columns
+    assert list(model_encode(df, ["user_id"], []).columns) == ["user_id", "a", "b"]
+
+    # Only input columns
+    paths = encode_to_parquet(
+        model_encode, dd.from_pandas(df, npartitions=1), str(tmpdir), output_columns=["user_id"]
+    )
+    assert list(pd.read_parquet(paths[0]).columns) == ["user_id"]
+
+
+def test_pipelined_model_encode(ecommerce_data: SyntheticData):
+    from merlin.models.tf.utils.batch_utils import PipelinedModelEncode
+
+    prediction_task = ml.PredictionTasks(ecommerce_data.schema)
+
+    body = ml.InputBlock(ecommerce_data.schema).connect(ml.MLPBlock([64]))
+    model = body.connect(prediction_task)
+    model.compile(run_eagerly=True, optimizer="adam")
+
+    model.fit(ecommerce_data.dataset, batch_size=50, epochs=1)
+
+    expected = model.batch_predict(ecommerce_data.dataset, batch_size=10).compute()
+
+    encoder = PipelinedModelEncode(model, batch_size=5, max_batch_size=20, chunk_size=40)
+    data = encoder.predict(ecommerce_data.dataset)
+    ddf = data.compute(scheduler="synchronous")
+
+    assert list(ddf.columns) == list(expected.columns)
+    for task_name in model.block.last.task_names:
+        np.testing.assert_allclose(ddf[task_name].values, expected[task_name].values, rtol=1e-5)
+
+    stats = encoder.stats.as_dict()
+    assert stats["num_rows"] == 100
+    assert stats["rows_per_second"] > 0
+    assert all(f"{stage}_latency_ms" in stats for stage in ["load", "compute", "write"])
+    assert max(encoder.stats.batch_sizes) <= 20
+
+    data, stats = model.batch_predict(
+        ecommerce_data.dataset, batch_size=10, pipelined=True, return_stats=True
+    )
+    assert len(data.compute(scheduler="synchronous")) == stats.num_rows == 100
+
+    # Without rows, the output is empty but has the output columns
+    empty = Dataset(ecommerce_data.dataframe.iloc[:0], schema=ecommerce_data.schema)
+    data, stats = model.batch_predict(empty, batch_size=10, pipelined=True, return_stats=True)
+    empty_df = data.compute(scheduler="synchronous")
+    assert len(empty_df) == stats.num_rows == 0
+    assert list(empty_df.columns) == list(expected.columns)
+
+
 def test_two_tower_embedding_extraction(ecommerce_data: SyntheticData):
     two_tower = ml.TwoTowerBlock(ecommerce_data.schema, query_tower=ml.MLPBlock([64, 128]))
 
@@ -43,8 +147,6 @@ def test_two_tower_embedding_extraction(ecommerce_data: SyntheticData):
 
 
 def test_two_tower_extracted_embeddings_are_equal(ecommerce_data: SyntheticData):
-    import numpy as np
-
     two_tower = ml.TwoTowerBlock(ecommerce_data.schema, query_tower=ml.MLPBlock([64, 128]))
 
     model = two_tower.connect(
@@ -0,0 +1,58 @@
+import numpy as np
+import tensorflow as tf
+
+from merlin.models.tf.utils.tf_utils import (
+    rescore_false_negatives,
+    rescore_false_negatives_sorted,
+    unique_items,
+)
+
+
+def test_unique_items_keeps_first_occurrence():
+    item_ids = tf.constant([3, 1, 3, 2, 1], dtype=tf.int64)
+    embeddings = tf.reshape(tf.range(10, dtype=tf.float32), (5, 2))
+
+    unique_ids, unique_embeddings = unique_items(item_ids, embeddings)
+
+    np.testing.assert_array_equal(unique_ids.numpy(), [3, 1, 2])
+    np.testing.assert_array_equal(unique_embeddings.numpy(), [[0, 1], [2, 3], [6, 7]])
+
+
+def test_rescore_false_negatives_sorted_unique_ids():
+    positive_ids = tf.constant([5, 2, 9, 7], dtype=tf.int64)
+    neg_ids = tf.constant([7, 1, 5, 3, 2, 8], dtype=tf.int64)
+    negative_scores = tf.random.uniform((4, 6))
+
+    expected = rescore_false_negatives(positive_ids, neg_ids, negative_scores, -100.0)
+    output = rescore_false_negatives_sorted(positive_ids, neg_ids, negative_scores, -100.0)
+
+    np.testing.assert_array_equal(output.numpy(), expected.numpy())
+    assert int(tf.reduce_sum(tf.cast(output == -100.0, tf.int32))) == 3
+
+
+def test_rescore_false_negatives_sorted_graph_mode():
+    fn = tf.function(rescore_false_negatives_sorted)
+    positive_ids = tf.constant([4, 6], dtype=tf.int64)
+    negative_scores = tf.ones((2, 3))
+
+    output = fn(positive_ids, tf.constant([6, 2, 4], dtype=tf.int64), negative_scores, 0.0)
+    np.testing.assert_array_equal(output.numpy(), [[1, 1, 0], [0, 1, 1]])
+
+    output = fn(positive_ids, tf.constant([1, 2, 3], dtype=tf.int64), negative_scores, 0.0)
+    np.testing.assert_array_equal(output.numpy(), negative_scores.numpy())
+
+
+def test_rescore_false_negatives_sorted():
+    positive_ids = tf.random.uniform((32,), maxval=50, dtype=tf.int64)
+    # Repeated negative ids
+    neg_ids = tf.random.uniform((200,), maxval=50, dtype=tf.int64)
+    negative_scores = tf.random.uniform((32, 200))
+
+    expected = rescore_false_negatives(positive_ids, neg_ids, negative_scores, -100.0)
+    output = rescore_false_negatives_sorted(positive_ids, neg_ids, negative_scores, -100.0)
+    np.testing.assert_array_equal(output.numpy(), expected.numpy())
+
+    output = tf.function(rescore_false_negatives_sorted)(
+        positive_ids, tf.zeros((0,), dtype=tf.int64), tf.zeros((32, 0)), -100.0
+    )
+    assert output.shape == (32, 0)
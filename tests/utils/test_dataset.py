@@ -0,0 +1,129 @@
+#
+# Copyright (c) 2022, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+
+import numpy as np
+import pandas as pd
+
+from merlin.io import Dataset
+from merlin.models.utils import dataset as dataset_utils
+from merlin.models.utils.dataset import (
+    csr_rows,
+    dataset_to_coo,
+    dataset_to_csr,
+    interactions_cache_key,
+)
+from merlin.schema import ColumnSchema, Schema, Tags
+
+SCHEMA = Schema(
+    [
+        ColumnSchema("user_id", tags=[Tags.USER_ID], dtype=np.int64),
+        ColumnSchema("item_id", tags=[Tags.ITEM_ID], dtype=np.int64),
+        ColumnSchema("click", tags=[Tags.TARGET], dtype=np.float32),
+    ]
+)
+
+
+def _interactions(num_rows=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "user_id": rng.integers(0, 50, num_rows),
+            "item_id": rng.integers(0, 80, num_rows),
+            "click": rng.integers(0, 2, num_rows).astype(np.float32),
+        }
+    )
+
+
+def _dense(df):
+    dense = np.zeros((df["user_id"].max() + 1, df["item_id"].max() + 1), dtype=np.float32)
+    np.add.at(dense, (df["user_id"].values, df["item_id"].values), df["click"].values)
+
+    return dense
+
+
+def test_dataset_to_coo():
+    df = _interactions()
+    dataset = Dataset(df, schema=SCHEMA, npartitions=4)
+
+    matrix = dataset_to_coo(dataset)
+    assert matrix.nnz == len(df)
+    assert matrix.row.dtype == matrix.col.dtype == np.int32
+    np.testing.assert_array_equal(matrix.row, df["user_id"].values)
+    np.testing.assert_array_equal(matrix.toarray(), _dense(df))
+
+    summed = dataset_to_coo(dataset, sum_duplicates=True, num_workers=2)
+    assert summed.nnz == len(df.drop_duplicates(["user_id", "item_id"]))
+    np.testing.assert_array_equal(summed.toarray(), _dense(df))
+
+
+def test_dataset_to_coo_large_ids():
+    df = pd.DataFrame({"user_id": [0, 2**40], "item_id": [1, 2], "click": [1.0, 1.0]})
+    dataset = Dataset(df, schema=SCHEMA, npartitions=2)
+
+    matrix = dataset_to_coo(dataset)
+
+    assert matrix.row.dtype == np.int64
+    np.testing.assert_array_equal(matrix.row, [0, 2**40])
+    assert matrix.shape == (2**40 + 1, 3)
+
+
+def test_dataset_to_csr():
+    df = _interactions()
+    dataset = Dataset(df, schema=SCHEMA, npartitions=4)
+
+    matrix = dataset_to_csr(dataset, num_workers=2)
+
+    assert interactions_cache_key(dataset) is None
+    np.testing.assert_array_equal(matrix.toarray(), _dense(df))
+
+
+def test_dataset_to_csr_cache(tmpdir):
+    path = os.path.join(tmpdir, "data")
+    os.makedirs(path)
+    parts = [_interactions(seed=i) for i in range(3)]
+    for i, part in enumerate(parts):
+        part.to_parquet(os.path.join(path, f"part_{i}.parquet"))
+    dataset = Dataset(os.path.join(path, "*.parquet"), engine="parquet", schema=SCHEMA)
+    cache_dir = os.path.join(tmpdir, "cache")
+
+    matrix = dataset_to_csr(dataset, cache_dir=cache_dir)
+    key = interactions_cache_key(dataset)
+    assert os.listdir(cache_dir) == [f"{key}.npz"]
+    assert dataset_to_csr(dataset, cache_dir=cache_dir) is matrix
+
+    # Reloaded from the .npz file
+    dataset_utils._CSR_CACHE.clear()
+    reloaded = dataset_to_csr(dataset, cache_dir=cache_dir)
+    assert reloaded is not matrix
+    np.testing.assert_array_equal(reloaded.toarray(), _dense(pd.concat(parts)))
+
+    # The key changes with the interaction columns of the schema
+    no_target = Dataset(
+        os.path.join(path, "*.parquet"), engine="parquet", schema=SCHEMA.remove_by_tag(Tags.TARGET)
+    )
+    assert interactions_cache_key(no_target) != key
+
+
+def test_csr_rows():
+    matrix = dataset_to_csr(Dataset(_interactions(), schema=SCHEMA))
+
+    rows = csr_rows(matrix, np.array([3, matrix.shape[0] + 5, 0]))
+
+    assert rows.shape == (3, matrix.shape[1])
+    np.testing.assert_array_equal(rows[0].toarray(), matrix[3].toarray())
+    assert rows[1].nnz == 0
+    np.testing.assert_array_equal(rows[2].toarray(), matrix[0].toarray())
@@ -0,0 +1,157 @@
+#
+# Copyright (c) 2022, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+from sklearn.metrics import log_loss, roc_auc_score
+
+from merlin.models.utils.evaluation import (
+    BinaryHistogram,
+    StreamingRetrievalEvaluator,
+    _to_csr,
+)
+
+
+@pytest.fixture
+def retrieval_data():
+    rng = np.random.default_rng(0)
+    num_users, num_items = 200, 300
+    user_ids = rng.permutation(num_users) + 5
+    user_embeddings = rng.normal(size=(num_users, 8)).astype(np.float32)
+    item_embeddings = rng.normal(size=(num_items, 8)).astype(np.float32)
+    item_ids = rng.permutation(num_items) * 2
+    # At least one relevant item per user, except the last ones
+    rows = np.concatenate([user_ids[:-10], rng.choice(user_ids[:-10], 600)])
+    columns = rng.choice(item_ids, len(rows))
+    ground_truth = sparse.coo_matrix(
+        (np.ones(len(rows)), (rows, columns)), shape=(user_ids.max() + 1, item_ids.max() + 1)
+    )
+
+    return user_ids, user_embeddings, item_ids, item_embeddings, ground_truth
+
+
+def test_streaming_retrieval_evaluator_matches_ranking_metrics(retrieval_data):
+    tf = pytest.importorskip("tensorflow")
+    from merlin.models.tf.metrics.ranking import TopKMetricsBundle
+
+    user_ids, user_embeddings, item_ids, item_embeddings, ground_truth = retrieval_data
+    evaluator = StreamingRetrievalEvaluator(
+        item_embeddings, item_ids, top_ks=[1, 5, 20], user_block_size=32, item_block_size=70
+    )
+    results = evaluator.evaluate(user_ids, user_embeddings, ground_truth)
+
+    labels = sparse.csr_matrix(ground_truth)[user_ids[:-10]][:, item_ids].toarray() > 0
+    bundle = TopKMetricsBundle([1, 5, 20], pre_sorted=False)
+    bundle.update_state(
+        tf.constant(labels, tf.float32),
+        tf.matmul(user_embeddings[:-10], item_embeddings, transpose_b=True),
+    )
+    expected = bundle.result()
+
+    assert results["num_users"] == len(user_ids) - 10
+    for name, metric in [
+        ("recall", "recall_at"),
+        ("precision", "precision_at"),
+        ("map", "map_at"),
+        ("mrr", "mrr_at"),
+        ("ndcg", "ndcg"),
+    ]:
+        for k in [1, 5, 20]:
+            np.testing.assert_allclose(
+                results[f"{name}@{k}"], expected[f"{metric}_{k}"], rtol=1e-5, err_msg=name
+            )
+
+
+def test_streaming_retrieval_evaluator_segments_and_workers(retrieval_data):
+    user_ids, user_embeddings, item_ids, item_embeddings, ground_truth = retrieval_data
+    segments = pd.Series(np.where(user_ids % 2 == 0, "even", "odd"), index=user_ids)
+
+    evaluator = StreamingRetrievalEvaluator(
+        item_embeddings, item_ids, top_ks=[10], user_block_size=16, num_workers=2
+    )
+    results = evaluator.evaluate(user_ids, user_embeddings, ground_truth, segments=segments)
+
+    assert results["even/num_users"] + results["odd/num_users"] == results["num_users"]
+    is_odd = user_ids % 2 == 1
+    odd = StreamingRetrievalEvaluator(item_embeddings, item_ids, top_ks=[10]).evaluate(
+        user_ids[is_odd], user_embeddings[is_odd], ground_truth
+    )
+    for name, value in odd.items():
+        np.testing.assert_allclose(results[f"odd/{name}"], value, rtol=1e-6)
+
+
+def test_streaming_retrieval_evaluator_exclude(retrieval_data):
+    user_ids, user_embeddings, item_ids, item_embeddings, ground_truth = retrieval_data
+
+    evaluator = StreamingRetrievalEvaluator(
+        item_embeddings, item_ids, top_ks=[50], exclude=ground_truth, item_block_size=64
+    )
+    results = evaluator.evaluate(user_ids, user_embeddings, ground_truth)
+
+    assert results["recall@50"] == 0.0
+
+
+def test_streaming_retrieval_evaluator_does_not_copy_ground_truth(retrieval_data):
+    user_ids, user_embeddings, item_ids, item_embeddings, ground_truth = retrieval_data
+    evaluator = StreamingRetrievalEvaluator(item_embeddings, item_ids, top_ks=[10, 50])
+    expected = evaluator.evaluate(user_ids, user_embeddings, ground_truth)
+
+    # Narrower than the candidate item ids, with explicit zeros for the last users
+    ground_truth = sparse.csr_matrix(ground_truth)
+    narrow = sparse.csr_matrix(
+        (
+            np.concatenate([ground_truth.data, np.zeros(10)]),
+            (
+                np.concatenate([ground_truth.tocoo().row, user_ids[-10:]]),
+                np.concatenate([ground_truth.tocoo().col, np.zeros(10, dtype=np.int64)]),
+            ),
+        ),
+        shape=(ground_truth.shape[0], ground_truth.indices.max() + 1),
+    )
+    shape, nnz = narrow.shape, narrow.nnz
+
+    assert evaluator.evaluate(user_ids, user_embeddings, narrow) == expected
+    assert np.shares_memory(_to_csr(narrow).data, narrow.data)
+    assert narrow.shape == shape and narrow.nnz == nnz
+
+
+def test_binary_histogram():
+    rng = np.random.default_rng(0)
+    groups = rng.integers(0, 50, 2000)
+    y_true = (rng.random(2000) < 0.2 + groups / 100).astype(np.float32)
+    y_pred = np.clip(0.3 * y_true + rng.random(2000) * 0.7, 0, 1)
+
+    histogram = BinaryHistogram(num_buckets=10_000, num_shards=64)
+    for batch in np.array_split(np.arange(2000), 4):
+        histogram += BinaryHistogram(num_buckets=10_000, num_shards=64).update(
+            y_true[batch], y_pred[batch], groups[batch]
+        )
+
+    assert histogram.auc() == pytest.approx(roc_auc_score(y_true, y_pred), abs=1e-3)
+    assert histogram.log_loss() == pytest.approx(log_loss(y_true, y_pred), rel=1e-5)
+
+    df = pd.DataFrame({"group": groups, "y_true": y_true, "y_pred": y_pred})
+    per_group = [
+        (roc_auc_score(group.y_true, group.y_pred), len(group))
+        for _, group in df.groupby("group")
+        if group.y_true.nunique() == 2
+    ]
+    gauc = sum(auc * count for auc, count in per_group) / sum(count for _, count in per_group)
+    assert histogram.gauc() == pytest.approx(gauc, abs=1e-3)
+
+    with pytest.raises(ValueError):
+        histogram.merge(BinaryHistogram(num_buckets=10))
@@ -0,0 +1,52 @@
+#
+# Copyright (c) 2022, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import numpy as np
+import pytest
+
+from merlin.models.utils.top_k import blockwise_top_k
+
+
+@pytest.mark.parametrize("block_size", [None, 1, 7, 100])
+def test_blockwise_top_k(block_size):
+    rng = np.random.default_rng(0)
+    queries = rng.normal(size=(5, 4)).astype(np.float32)
+    candidates = rng.normal(size=(30, 4)).astype(np.float32)
+    biases = rng.normal(size=30).astype(np.float32)
+
+    def mask_fn(scores, start, end):
+        scores[:, np.arange(start, end) % 3 == 0] = -np.inf
+
+    positions, scores = blockwise_top_k(
+        queries, candidates, 5, block_size, biases=biases, mask_fn=mask_fn
+    )
+
+    expected_scores = queries @ candidates.T + biases
+    expected_scores[:, ::3] = -np.inf
+    expected_positions = np.argsort(-expected_scores, axis=1, kind="stable")[:, :5]
+    np.testing.assert_array_equal(positions, expected_positions)
+    np.testing.assert_allclose(
+        scores, np.take_along_axis(expected_scores, expected_positions, axis=1), rtol=1e-5
+    )
+
+
+def test_blockwise_top_k_fewer_candidates_than_k():
+    queries = np.ones((2, 3), dtype=np.float32)
+    candidates = np.array([[1.0, 0.0, 0.0], [2.0, 0.0, 0.0]], dtype=np.float32)
+
+    positions, scores = blockwise_top_k(queries, candidates, 5, block_size=1)
+
+    np.testing.assert_array_equal(positions, [[1, 0], [1, 0]])
+    np.testing.assert_array_equal(scores, [[2.0, 1.0], [2.0, 1.0]])